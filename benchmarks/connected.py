@@ -0,0 +1,59 @@
+"""Mesure du coût des tuiles connectées (chemins, murailles…).
+Pour chaque classe de tuile connectée du monde généré, on mesure la lecture de
+`data`, la mise à jour des connexions et l'affichage d'une tuile (avec son
+fond, aplati par `composite_cache`).
+
+À lancer depuis la racine du projet :
+    python -m benchmarks.connected
+"""
+from __future__ import annotations
+from typing import Callable, Dict, List
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
+
+import argparse
+import timeit
+
+from src.game import Pygame
+from src.map import Connected, ElaborateConnected, Tile
+
+def per_tile(tiles: List[Tile], action: Callable[[Tile], object], number: int) -> float:
+    """Retourne la durée moyenne de l'action pour une tuile, en microsecondes"""
+    def run() -> None:
+        for tile in tiles:
+            action(tile)
+    return min(timeit.repeat(run, number=number, repeat=5)) / number / len(tiles) * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    game = Pygame(seed=args.seed)
+    game.players.init()
+    screen = game.screen
+    game.camera.follow(game.players.player)
+    context = game.frame_context()
+    game.map.render(context)
+    tiles: Dict[str, List[Tile]] = {"Connected": [], "ElaborateConnected": []}
+    for row in game.map.map:
+        for tile in row:
+            if type(tile) in (Connected, ElaborateConnected):
+                tiles[type(tile).__name__].append(tile)
+
+    print(f"{'':20} {'tiles':>6} {'data':>9} {'update':>9} {'render':>9}")
+    for name, selected in tiles.items():
+        if not selected:
+            continue
+        print(
+            f"{name:20} {len(selected):6} "
+            f"{per_tile(selected, lambda tile: tile.data, args.number):6.3f} us "
+            f"{per_tile(selected, lambda tile: tile.update(), args.number):6.3f} us "
+            f"{per_tile(selected, lambda tile: tile.render(screen, context), args.number):6.3f} us"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Mesure du coût de la vue d'ensemble sur un grand monde.
+On mesure la construction de la grille des types, la modification d'une tuile,
+l'affichage de la vue d'ensemble à chaque niveau de zoom et celui de la
+mini-carte (recalculée après une modification, puis gardée en cache).
+
+À lancer depuis la racine du projet :
+    python -m benchmarks.overview --size 2000
+"""
+from __future__ import annotations
+from typing import Callable
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
+
+import argparse
+import random
+import time
+import timeit
+
+from src.game import MIN_ZOOM, Pygame
+from src.map import Map
+from src.sprites import MIN_SCALE
+
+def per_call(action: Callable[[], object], number: int) -> float:
+    """Retourne la durée moyenne de l'action, en millisecondes"""
+    return min(timeit.repeat(action, number=number, repeat=5)) / number * 1000
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=2000, help="la largeur et la hauteur du monde en tuiles")
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    game = Pygame(seed=1234)
+    start = time.perf_counter()
+    game.map = Map(game, args.size, args.size, generate_maze=False)
+    print(f"world of {args.size}x{args.size} tiles created in {time.perf_counter() - start:.2f} s")
+    game.players.init()
+    game.camera.follow(game.players.player)
+    game.players.player.coords.set(args.size // 2, args.size // 2)
+    overview = game.map.overview
+
+    start = time.perf_counter()
+    overview.build()
+    print(f"build:          {(time.perf_counter() - start) * 1000:8.2f} ms")
+
+    generator = random.Random(0)
+    def set_tile() -> None:
+        game.map.set_tile(generator.randrange(args.size), generator.randrange(args.size), 1)
+    print(f"set_tile:       {per_call(set_tile, args.number) * 1000:8.2f} us")
+
+    for zoom in range(MIN_SCALE - 1, MIN_ZOOM - 1, -1):
+        game.set_zoom(zoom)
+        context = game.frame_context()
+        time_ms = per_call(lambda: overview.render(game.screen, context, game.players), args.number)
+        print(f"render zoom {zoom:2}: {time_ms:8.2f} ms")
+
+    def changed_minimap() -> None:
+        overview.set(0, 0, 0)
+        overview.render_minimap(game.screen, context, game.players)
+    print(f"minimap:        {per_call(changed_minimap, args.number):8.2f} ms (after a change)")
+    print(f"minimap:        {per_call(lambda: overview.render_minimap(game.screen, context, game.players), args.number):8.2f} ms (cached)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Mesure du temps de rendu d'une partie rejouée.
+Une partie enregistrée avec `python main.py --record FILE` (ou une marche
+aléatoire générée à partir d'une graine) est rejouée sans affichage, et la
+durée de chaque image est mesurée.
+
+À lancer depuis la racine du projet :
+    python -m benchmarks.replay [FILE] --repeat 3
+"""
+from __future__ import annotations
+from typing import List, Optional
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
+
+import argparse
+import random
+import statistics
+import time
+
+import pygame
+
+from src.camera import FrameContext
+from src.game import Pygame
+from src.map import MapView
+from src.inputs import MOVES, command_mask
+from src.replay import Recording
+
+def random_walk(seed: int, frames: int) -> Recording:
+    """Génère une partie reproductible où le joueur se déplace au hasard"""
+    generator = random.Random(seed)
+    recording = Recording(seed)
+    mask = 0
+    for _ in range(frames):
+        if generator.random() < 0.1:
+            # on change de direction de temps en temps, et on s'arrête parfois
+            mask = command_mask([generator.choice(list(MOVES))]) if generator.random() < 0.8 else 0
+        recording.append(mask, 33)
+    return recording
+
+def run(recording: Recording) -> List[float]:
+    """Rejoue la partie et retourne la durée de chaque image"""
+    game = Pygame(seed=recording.seed)
+    stamps: List[float] = []
+    render = game.map.render
+    def timed_render(context: FrameContext, surface: Optional[pygame.Surface] = None, view: Optional[MapView] = None) -> None:
+        # le rendu du monde a lieu une fois par image (une seule vue)
+        stamps.append(time.perf_counter())
+        render(context, surface, view)
+    game.map.render = timed_render
+    game.loop(replay=recording)
+    stamps.append(time.perf_counter())
+    return [end - start for start, end in zip(stamps, stamps[1:])]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file", nargs="?", help="la partie enregistrée à rejouer")
+    parser.add_argument("--seed", type=int, default=1234, help="la graine de la marche aléatoire")
+    parser.add_argument("--frames", type=int, default=900, help="le nombre d'images de la marche aléatoire")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    recording = Recording.load(args.file) if args.file else random_walk(args.seed, args.frames)
+    for run_index in range(args.repeat):
+        frame_times = sorted(run(recording))
+        print(
+            f"run {run_index + 1}: {len(frame_times)} frames, "
+            f"mean {statistics.mean(frame_times) * 1000:.2f} ms, "
+            f"median {statistics.median(frame_times) * 1000:.2f} ms, "
+            f"p99 {frame_times[int(len(frame_times) * 0.99) - 1] * 1000:.2f} ms"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Mesure de la charge du serveur multijoueur.
+Ce script lance un serveur et un grand nombre de clients simulés (sans affichage)
+dans le même processus, puis mesure la durée des ticks du serveur.
+
+À lancer depuis la racine du projet :
+    python -m benchmarks.server_load --clients 300 --duration 10 --spread
+"""
+from __future__ import annotations
+from typing import List
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from src.protocol import TICK_RATE, FrameReader, Message, pack_hello, pack_move
+from src.server import Server
+
+class BotConnection(asyncio.Protocol):
+    """Un client simulé qui compte les octets reçus"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.reader = FrameReader()
+        self.transport = None
+        self.received = 0
+        self.welcomed = asyncio.Event()
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+        # le serveur refuse deux joueurs connectés avec le même nom
+        transport.write(pack_hello(self.name))
+
+    def data_received(self, data: bytes) -> None:
+        self.received += len(data)
+        for message, _ in self.reader.feed(data):
+            if message == Message.WELCOME:
+                self.welcomed.set()
+
+async def bot(connection: BotConnection, stop: asyncio.Event, move_interval: float) -> None:
+    """Envoie des déplacements aléatoires jusqu'à la fin de la mesure"""
+    await connection.welcomed.wait()
+    sequence = 0
+    while not stop.is_set():
+        offset = random.choice(((1, 0), (-1, 0), (0, 1), (0, -1)))
+        sequence = (sequence + 1) & 0xFFFF
+        connection.transport.write(pack_move(sequence, *offset))
+        await asyncio.sleep(move_interval * random.uniform(0.8, 1.2))
+
+async def ticker(server: Server, stop: asyncio.Event, tick_times: List[float]) -> int:
+    """Fait tourner les ticks du serveur en mesurant leur durée, retourne le
+    nombre de ticks en retard"""
+    loop = asyncio.get_running_loop()
+    interval = 1 / TICK_RATE
+    next_tick = loop.time()
+    late = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        server.tick()
+        tick_times.append(time.perf_counter() - start)
+        next_tick += interval
+        delay = next_tick - loop.time()
+        if delay < 0:
+            late += 1
+            next_tick = loop.time()
+            delay = 0
+        await asyncio.sleep(delay)
+    return late
+
+async def run(clients: int, duration: float, move_interval: float, port: int, spread: bool) -> None:
+    server = Server("127.0.0.1", port)
+    await server.start()
+    loop = asyncio.get_running_loop()
+
+    # les ticks tournent pendant les connexions, qui ne sont pas mesurées
+    warmup_stop = asyncio.Event()
+    warmup = asyncio.ensure_future(ticker(server, warmup_stop, []))
+    connections = []
+    for index in range(clients):
+        _, connection = await loop.create_connection(lambda: BotConnection(f"bot {index}"), "127.0.0.1", port)
+        connections.append(connection)
+    await asyncio.gather(*(connection.welcomed.wait() for connection in connections))
+    if spread:
+        # répartit les joueurs sur tout le monde au lieu du point d'apparition
+        walkable = [
+            (x, y)
+            for y in range(server.map.HEIGHT)
+            for x in range(server.map.WIDTH)
+            if server.map.allow_move(x, y)
+        ]
+        for player_id in list(server.players):
+            server.teleport(player_id, *random.choice(walkable))
+    warmup_stop.set()
+    await warmup
+    for connection in connections:
+        connection.received = 0
+
+    stop = asyncio.Event()
+    tick_times: List[float] = []
+    measure = asyncio.ensure_future(ticker(server, stop, tick_times))
+    bots = [asyncio.ensure_future(bot(connection, stop, move_interval)) for connection in connections]
+    await asyncio.sleep(duration)
+    stop.set()
+    late = await measure
+    await asyncio.gather(*bots)
+    for connection in connections:
+        connection.transport.close()
+    server.close()
+
+    tick_times.sort()
+    received = sum(connection.received for connection in connections)
+    print(f"clients:         {clients}")
+    print(f"ticks:           {len(tick_times)} ({late} late)")
+    print(f"tick mean:       {statistics.mean(tick_times) * 1000:.3f} ms")
+    print(f"tick p99:        {tick_times[int(len(tick_times) * 0.99) - 1] * 1000:.3f} ms")
+    print(f"tick budget:     {1000 / TICK_RATE:.1f} ms")
+    print(f"received/client: {received / clients / duration / 1024:.1f} KiB/s")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--move-interval", type=float, default=0.15)
+    parser.add_argument("--port", type=int, default=17777)
+    parser.add_argument("--spread", action="store_true", help="répartit les joueurs sur tout le monde")
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.duration, args.move_interval, args.port, args.spread))
+
+if __name__ == "__main__":
+    main()
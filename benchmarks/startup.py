@@ -0,0 +1,75 @@
+"""Mesure du temps de démarrage avec et sans le paquet de ressources.
+Chaque mesure est faite dans un nouveau processus : on mesure le temps
+d'import des modules du jeu, qui lisent `textures.json` et `blocs.json` (sans
+compter l'import de pygame), puis le chargement de toutes les textures, comme
+pendant les premières images.
+
+À lancer depuis la racine du projet (après `python -m src.bundle`) :
+    python -m benchmarks.startup --repeat 10
+"""
+from __future__ import annotations
+from typing import Dict, List
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+def child() -> None:
+    """Démarre le jeu sans affichage et écrit les durées mesurées"""
+    import pygame
+    pygame.display.init()
+    pygame.display.set_mode((650, 500))
+    start = time.perf_counter()
+    from src.map import Map
+    from src.sprites import get_image, index
+    imported = time.perf_counter()
+    for name in index:
+        get_image(name)
+    loaded = time.perf_counter()
+    print(imported - start, loaded - imported)
+
+def measure(bundle: bool, repeat: int) -> Dict[str, List[float]]:
+    """Lance `repeat` processus et retourne les durées mesurées"""
+    environment = dict(os.environ, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="hide")
+    environment["SYLVAJIA_BUNDLE"] = "1" if bundle else "0"
+    results: Dict[str, List[float]] = {"import": [], "textures": [], "total": []}
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child"],
+            env=environment,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        imported, loaded = (float(value) for value in output.split())
+        results["import"].append(imported)
+        results["textures"].append(loaded)
+        results["total"].append(imported + loaded)
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+    if not os.path.exists("./data/assets.bundle"):
+        parser.error("build the bundle first with `python -m src.bundle`")
+
+    for name, bundle in (("loose files", False), ("bundle", True)):
+        results = measure(bundle, args.repeat)
+        print(
+            f"{name + ':':13} "
+            + ", ".join(
+                f"{step} {statistics.median(values) * 1000:.1f} ms"
+                for step, values in results.items()
+            )
+        )
+
+if __name__ == "__main__":
+    main()
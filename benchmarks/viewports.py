@@ -0,0 +1,73 @@
+"""Mesure du coût de l'écran partagé.
+Plusieurs joueurs se déplacent dans le monde, chacun suivi par une vue de la
+grille ; on compare la durée d'une image avec N vues à N fois celle d'une
+seule vue de l'écran entier. Les vues partagent les caches de textures et de
+tuiles, et chacune ne redessine que les bandes découvertes par sa caméra.
+
+À lancer depuis la racine du projet :
+    python -m benchmarks.viewports --frames 300
+"""
+from __future__ import annotations
+from typing import List
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
+
+import argparse
+import random
+import statistics
+import time
+
+from src.camera import Camera
+from src.game import Pygame
+from src.inputs import MOVES
+from src.players import Player
+from src.viewport import Viewport, split_screen
+
+def run(game: Pygame, walkers: List[Player], count: int, frames: int) -> float:
+    """Retourne la durée moyenne du rendu d'une image avec `count` vues, en
+    millisecondes (les joueurs se déplacent au hasard pendant la mesure)"""
+    viewports = []
+    for walker, rect in zip(walkers, split_screen(game.screen.get_rect(), count)):
+        camera = Camera()
+        camera.follow(walker)
+        viewports.append(Viewport(game.map, camera, rect))
+    generator = random.Random(0)
+    moves = list(MOVES.values())
+    durations = []
+    for frame in range(frames):
+        for walker in walkers[:count]:
+            walker.move_by(*generator.choice(moves))
+        game.animation_state += 1
+        game.time += 1 / 30
+        start = time.perf_counter()
+        for viewport in viewports:
+            viewport.render(game.screen, game.players, game.zoom, game.animation_state)
+        durations.append(time.perf_counter() - start)
+    for viewport in viewports:
+        viewport.close()
+    # la première image dessine toutes les vues entièrement
+    return statistics.mean(durations[1:]) * 1000
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    game = Pygame(seed=args.seed)
+    game.players.init()
+    walkers = []
+    for player_id in range(1, 5):
+        game.players.new(player_id)
+        walkers.append(game.players[player_id])
+
+    single = run(game, walkers, 1, args.frames)
+    print(f"1 view:  {single:6.2f} ms per frame")
+    for count in (2, 4):
+        duration = run(game, walkers, count, args.frames)
+        print(f"{count} views: {duration:6.2f} ms per frame ({duration / (count * single):.0%} of {count} single views)")
+
+if __name__ == "__main__":
+    main()
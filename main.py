@@ -2,15 +2,154 @@
 import os
 os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "hide"
 
-from src.game import Pygame
+import argparse
+import logging
+import sys
+import time
+from typing import Optional
 
-import os
+from src.protocol import DEFAULT_HOST, DEFAULT_PORT
+
+def parse_address(address: str):
+    """Découpe une adresse de la forme `hôte[:port]`"""
+    host, _, port = address.partition(":")
+    return host or DEFAULT_HOST, int(port) if port else DEFAULT_PORT
 
 def main():
     """Lance le jeu"""
-    game = Pygame()
+    parser = argparse.ArgumentParser(description="Sylvajia")
+    parser.add_argument("--server", metavar="HOST[:PORT]", nargs="?", const=f"{DEFAULT_HOST}:{DEFAULT_PORT}",
+                        help="lance un serveur multijoueur sans affichage")
+    parser.add_argument("--connect", metavar="HOST[:PORT]", help="rejoint une partie multijoueur")
+    parser.add_argument("--name", default="", help="le nom du joueur en multijoueur")
+    parser.add_argument("--seed", type=int, help="la graine du monde généré (entre 0 et 2**64-1)")
+    parser.add_argument("--split", action="store_true",
+                        help="partage l'écran avec un deuxième joueur local (touches i, j, k, l)")
+    parser.add_argument("--record", metavar="FILE", help="enregistre la partie dans un fichier")
+    parser.add_argument("--replay", metavar="FILE", help="rejoue une partie enregistrée, sans affichage et au plus vite")
+    parser.add_argument("--check", action="store_true",
+                        help="avec --replay, vérifie que le joueur finit à la même position que lors de l'enregistrement")
+    parser.add_argument("--capture", metavar="PATH",
+                        help="enregistre les images affichées dans un dossier d'images PNG, ou en vidéo brute si PATH finit par .raw")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="écrit régulièrement les mesures du jeu ou du serveur (format Prometheus, ou lignes JSON si FILE finit par .jsonl)")
+    parser.add_argument("--metrics-interval", metavar="SECONDS", type=float, default=10.0,
+                        help="le nombre de secondes entre deux écritures des mesures")
+    parser.add_argument("--autosave", metavar="DIRECTORY",
+                        help="sauvegarde régulièrement le monde dans ce dossier, et reprend la dernière sauvegarde complète")
+    parser.add_argument("--autosave-interval", metavar="SECONDS", type=float, default=60.0,
+                        help="le nombre de secondes entre deux sauvegardes automatiques")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="mesure la mémoire dès le démarrage, pour le rapport de la touche memory_report (F9)")
+    args = parser.parse_args()
+    if args.autosave is not None and args.connect is not None:
+        parser.error("--autosave cannot be used with --connect (the server saves the world)")
+    if args.autosave is not None and args.record is not None:
+        # un enregistrement repart toujours du premier niveau généré par sa graine
+        parser.error("--record cannot be used with --autosave (a recording starts from a new world)")
+    if args.split and (args.connect is not None or args.server is not None):
+        parser.error("--split is only available in a local game")
+    if args.seed is not None and not 0 <= args.seed < 2**64:
+        # la graine est enregistrée sur 8 octets (voir `replay.HEADER`)
+        parser.error("--seed must be between 0 and 2**64-1")
+
+    if args.trace_memory:
+        from src.memory import start
+        start()
+
+    writer = None
+    if args.metrics is not None:
+        from src.metrics import MetricsWriter
+        writer = MetricsWriter(args.metrics, args.metrics_interval)
+    try:
+        run(args)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def run(args: argparse.Namespace):
+    """Lance le mode demandé par les arguments"""
+    if args.replay is not None:
+        replay(args.replay, args.check, args.capture)
+        return
+
+    if args.server is not None:
+        logging.basicConfig(level=logging.INFO)
+        from src.server import run_server
+        run_server(*parse_address(args.server), args.autosave, args.autosave_interval)
+        return
+
+    from src.game import Pygame
+
+    client = None
+    if args.connect is not None:
+        from src.client import Client
+        client = Client(*parse_address(args.connect), name=args.name)
+        client.start()
+
+    game = Pygame(client, seed=args.seed, split=args.split)
+
+    autosave = None
+    if args.autosave is not None:
+        from src.autosave import Autosave, load_latest
+        from src.levels import Levels
+        saved = load_latest(args.autosave)
+        level = 0
+        if saved is not None:
+            saved.apply(game.map)
+            game.start_positions = saved.positions
+            level = saved.level
+        # les niveaux éloignés sont écrits à côté des sauvegardes
+        game.levels = Levels(game.map, level, args.autosave)
+        autosave = Autosave(args.autosave, game.map, game.positions, args.autosave_interval, level=level)
+
+    recording = None
+    if args.record is not None:
+        from src.replay import Recording
+        recording = Recording(game.map.seed)
+
+    capture = None
+    if args.capture is not None:
+        from src.capture import FrameCapture
+        from src.game import FPS
+        capture = FrameCapture(args.capture, FPS)
+
+    game.loop(recording=recording, capture=capture, autosave=autosave)
+    if capture is not None:
+        capture.close()
+    if autosave is not None:
+        autosave.close()
+
+    if recording is not None:
+        recording.final = game.players.player.coords.real_coords()
+        recording.save(args.record)
+
+def replay(path: str, check: bool, capture_path: Optional[str] = None):
+    """Rejoue une partie enregistrée sans affichage et affiche le temps écoulé.
+    Avec `capture_path`, toutes les images sont enregistrées (pour comparer
+    visuellement deux versions du jeu)."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from src.game import FPS, Pygame
+    from src.replay import Recording
+
+    recording = Recording.load(path)
+    game = Pygame(seed=recording.seed)
+    capture = None
+    if capture_path is not None:
+        from src.capture import FrameCapture
+        # la partie rejouée n'a pas de rythme à tenir : aucune image n'est abandonnée
+        capture = FrameCapture(capture_path, FPS, wait=True)
+    start = time.perf_counter()
+    game.loop(replay=recording, capture=capture)
+    elapsed = time.perf_counter() - start
+    if capture is not None:
+        capture.close()
 
-    game.loop()
+    final = tuple(int(value) for value in game.players.player.coords.real_coords())
+    print(f"{len(recording)} frames in {elapsed:.2f}s ({len(recording) / elapsed:.0f} fps), final position {final}")
+    if check and final != recording.final:
+        print(f"expected final position {recording.final}", file=sys.stderr)
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,598 @@
+"""Ce fichier contient la sauvegarde automatique du monde pendant la partie.
+Sérialiser tout le monde (`Map.to_dict`) parcourt chaque tuile et bloquerait
+le jeu ou le serveur le temps de l'écriture. À la place :
+- le monde note dans son journal (`Map.journal`) l'état compact de chaque
+  tuile modifiée (son type, sa donnée et ceux de ses fonds) ;
+- à chaque sauvegarde, le fil principal ne fait qu'échanger le journal contre
+  un journal vide et copier la position des joueurs et les tuiles explorées
+  des joueurs qui en ont découvert de nouvelles ;
+- un fil d'exécution séparé applique les modifications à ses propres
+  tableaux (un ou quatre octets par tuile), les compresse et les écrit dans un
+  fichier temporaire, qui remplace la sauvegarde d'un coup une fois complet.
+
+Seule la première sauvegarde, au lancement, parcourt toutes les tuiles, et
+c'est le fil de sauvegarde qui s'en charge : le fil principal ne lui confie
+que les rangées de tuiles du monde (`TileWalk`). Pendant le parcours, le
+journal garde l'état d'origine des tuiles remplacées, que le fil de
+sauvegarde remet ensuite : la sauvegarde est celle du monde au moment où elle
+a été demandée.
+Les dernières sauvegardes sont gardées : au lancement, la plus récente qui
+est complète et lisible est rechargée.
+
+À activer avec :
+    python main.py --autosave ./saves
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from array import array
+import json
+import logging
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+import zlib
+
+from .fog import Explored
+
+if TYPE_CHECKING:
+    from .map import Map, Tile
+
+__all__ = [
+    "AUTOSAVE_INTERVAL",
+    "KEEP_SAVES",
+    "TileJournal",
+    "TileArrays",
+    "SavedWorld",
+    "Autosave",
+    "read_save",
+    "write_save",
+    "load_latest",
+]
+
+MAGIC = b"SYLS"
+VERSION = 1
+HEADER = struct.Struct("<4sBI") # signature, version, taille de l'en-tête JSON
+AUTOSAVE_INTERVAL = 60.0 # secondes entre deux sauvegardes
+KEEP_SAVES = 3 # nombre de sauvegardes gardées
+NO_BACKGROUND = 0xFF # type de fond des tuiles sans fond
+CHUNK_SIZE = 1024 * 1024 # taille des blocs compressés (zlib libère le GIL pendant la compression)
+COMPRESSION_LEVEL = 1 # compression rapide : la sauvegarde prend moins de temps au jeu
+
+Layers = Tuple[Tuple[int, int], ...] # (type, donnée) de la tuile puis de chacun de ses fonds
+Positions = Dict[str, Tuple[int, int]]
+
+def tile_layers(tile: Tile) -> Layers:
+    """Retourne l'état sauvegardé d'une tuile : son type et sa donnée, puis
+    ceux de ses fonds successifs (les tuiles liées des ponts sont recalculées
+    au chargement et ne sont pas sauvegardées)"""
+    layers = []
+    while tile is not None:
+        layers.append((tile.type, int(tile.data)))
+        tile = tile.background
+    return tuple(layers)
+
+def save_name(number: int) -> str:
+    return f"autosave_{number:06}.sav"
+
+def save_number(name: str) -> Optional[int]:
+    """Retourne le numéro d'une sauvegarde d'après le nom de son fichier"""
+    if name.startswith("autosave_") and name.endswith(".sav"):
+        try:
+            return int(name[len("autosave_"):-len(".sav")])
+        except ValueError:
+            return None
+    return None
+
+def save_numbers(directory: str) -> List[int]:
+    """Retourne les numéros des sauvegardes d'un dossier"""
+    return [number for number in map(save_number, os.listdir(directory)) if number is not None]
+
+class TileArrays:
+    """L'état de toutes les tuiles d'un monde dans des tableaux compacts.
+    Le type et la donnée de chaque tuile et de son premier fond sont rangés
+    dans des tableaux d'une case par tuile ; les fonds suivants, très rares
+    (le fond du fond du moulin), sont gardés à part.
+    """
+    deep: Dict[int, Layers]
+
+    def __init__(self, width: int, height: int) -> None:
+        size = width * height
+        self.width = width
+        self.height = height
+        self.types = bytearray(size)
+        self.datas = array("i", bytes(4 * size))
+        self.background_types = bytearray([NO_BACKGROUND]) * size
+        self.background_datas = array("i", bytes(4 * size))
+        self.deep = {}
+
+    @classmethod
+    def build(cls, map: Map) -> TileArrays:
+        """Construit les tableaux en parcourant toutes les tuiles du monde"""
+        return cls.from_rows(map.map)
+
+    @classmethod
+    def from_rows(cls, rows: List[List[Tile]]) -> TileArrays:
+        """Construit les tableaux en parcourant des rangées de tuiles (celles
+        de `Map.map`)"""
+        arrays = cls(len(rows[0]) if rows else 0, len(rows))
+        index = 0
+        for row in rows:
+            for tile in row:
+                arrays.set(index, tile_layers(tile))
+                index += 1
+        return arrays
+
+    def set(self, index: int, layers: Layers) -> None:
+        """Enregistre l'état d'une tuile"""
+        self.types[index], self.datas[index] = layers[0]
+        if len(layers) > 1:
+            self.background_types[index], self.background_datas[index] = layers[1]
+        else:
+            self.background_types[index] = NO_BACKGROUND
+            self.background_datas[index] = 0
+        if len(layers) > 2:
+            self.deep[index] = layers[2:]
+        else:
+            self.deep.pop(index, None)
+
+    def layers(self, index: int) -> Layers:
+        """Retourne l'état d'une tuile"""
+        layers = [(self.types[index], self.datas[index])]
+        if self.background_types[index] != NO_BACKGROUND:
+            layers.append((self.background_types[index], self.background_datas[index]))
+            layers.extend(self.deep.get(index, ()))
+        return tuple(layers)
+
+    def buffers(self) -> List[bytes]:
+        """Retourne les tableaux à écrire, dans l'ordre du fichier (les
+        entiers sont écrits en petit-boutiste)"""
+        datas, background_datas = self.datas, self.background_datas
+        if sys.byteorder == "big":
+            datas, background_datas = array("i", datas), array("i", background_datas)
+            datas.byteswap()
+            background_datas.byteswap()
+        return [self.types, datas, self.background_types, background_datas]
+
+class TileWalk:
+    """Le parcours de toutes les tuiles d'un monde par le fil de sauvegarde.
+    Les rangées ne sont pas copiées : le journal note dans `originals` l'état
+    qu'avait chaque tuile remplacée pendant le parcours, au moment où il a été
+    demandé.
+    """
+    __slots__ = ("rows", "originals", "done")
+
+    def __init__(self, rows: List[List[Tile]]) -> None:
+        self.rows = rows
+        self.originals: Dict[int, Layers] = {}
+        self.done = False # le parcours est terminé, le journal n'a plus rien à garder
+
+    def build(self) -> TileArrays:
+        """Parcourt les rangées et retourne l'état des tuiles au moment où le
+        parcours a été demandé (appelée par le fil de sauvegarde)"""
+        arrays = TileArrays.from_rows(self.rows)
+        # une tuile remplacée après ce point l'a été après son parcours :
+        # son état d'origine n'est plus utile
+        self.done = True
+        for index, layers in list(self.originals.items()):
+            arrays.set(index, layers)
+        return arrays
+
+class TileJournal:
+    """Le journal des tuiles modifiées d'un monde depuis la dernière sauvegarde.
+    Le journal ne note rien tant qu'aucune sauvegarde n'a été faite : la
+    première sauvegarde, et la suivante quand tout le monde a été remplacé
+    (`Map.update_all`), parcourent toutes les tuiles dans le fil de sauvegarde.
+    """
+    changes: Optional[Dict[int, Layers]]
+    walk: Optional[TileWalk]
+
+    def __init__(self, map: Map) -> None:
+        self.map = map
+        self.changes = None
+        self.walk = None # le parcours de toutes les tuiles en cours
+
+    def set(self, x: int, y: int, tile: Tile) -> None:
+        """Note la nouvelle tuile d'un emplacement (appelée par `Map.__setitem__`,
+        avant que la tuile ne soit remplacée)"""
+        if self.changes is None:
+            return
+        index = y * self.map.WIDTH + x
+        walk = self.walk
+        if walk is not None:
+            if walk.done:
+                self.walk = None
+            elif index not in walk.originals:
+                walk.originals[index] = tile_layers(self.map.map[y][x])
+        self.changes[index] = tile_layers(tile)
+
+    def reset(self) -> None:
+        """Indique que toutes les tuiles ont changé"""
+        self.changes = None
+        self.walk = None
+
+    def take(self) -> Tuple[Optional[TileWalk], Dict[int, Layers]]:
+        """Retourne les modifications notées depuis l'appel précédent et vide
+        le journal : soit le parcours de toutes les tuiles du monde (la
+        première fois), soit seulement les tuiles modifiées"""
+        if self.changes is None:
+            self.changes = {}
+            self.walk = TileWalk(self.map.map)
+            return self.walk, {}
+        changes, self.changes = self.changes, {}
+        return None, changes
+
+class SavedWorld:
+    """Un monde relu depuis une sauvegarde"""
+    positions: Positions
+    explored: Dict[str, bytes]
+
+    def __init__(self, header: Dict[str, Any], arrays: TileArrays, explored: Dict[str, bytes]) -> None:
+        self.number: int = header["number"]
+        self.time: float = header["time"]
+        self.seed: int = header["seed"]
+        self.level: int = header.get("level", 0) # niveau du monde (voir `levels.py`)
+        self.spawn = tuple(header["spawn"])
+        self.background: int = header["background"]
+        self.positions = {name: (x, y) for name, (x, y) in header["positions"].items()}
+        self.arrays = arrays
+        self.explored = explored
+
+    def apply(self, map: Map) -> None:
+        """Remplace le monde par celui de la sauvegarde (comme `Map.load_dict`)"""
+        # importé ici : `map.py` importe ce fichier pour le journal des tuiles
+        from .map import get_type
+        arrays = self.arrays
+        width, height = arrays.width, arrays.height
+        rows = []
+        index = 0
+        for y in range(height):
+            row = []
+            for x in range(width):
+                tile = None
+                for type, data in reversed(arrays.layers(index)):
+                    tile = get_type(type)(x, y, type, data, map, tile)
+                row.append(tile)
+                index += 1
+            rows.append(row)
+        map.map = rows
+        map.WIDTH, map.HEIGHT = width, height
+        map.seed = self.seed
+        map.spawn = self.spawn
+        map.background = self.background
+        map.exploration.explored = {
+            name: Explored(width, height, bits) for name, bits in self.explored.items()
+        }
+        map.exploration.version += 1
+        # les tuiles liées (fond des ponts...) sont recalculées
+        map.update_all()
+
+def read_save(path: str) -> SavedWorld:
+    """Lit une sauvegarde écrite par `Autosave`
+
+    Raises
+    ------
+    ValueError
+        Si le fichier n'est pas une sauvegarde, ou est incomplet
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is truncated")
+    magic, version, length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a supported save")
+    try:
+        header = json.loads(data[HEADER.size:HEADER.size + length].decode("utf-8"))
+        decompressor = zlib.decompressobj()
+        payload = decompressor.decompress(data[HEADER.size + length:])
+    except (UnicodeDecodeError, json.JSONDecodeError, zlib.error) as error:
+        raise ValueError(f"{path} is corrupted: {error}") from error
+    if not decompressor.eof or len(payload) != header["payload"]:
+        raise ValueError(f"{path} is incomplete")
+
+    width, height = header["width"], header["height"]
+    size = width * height
+    arrays = TileArrays(width, height)
+    view = memoryview(payload)
+    offset = 0
+    def take(length: int) -> memoryview:
+        nonlocal offset
+        offset += length
+        return view[offset - length:offset]
+    arrays.types[:] = take(size)
+    arrays.datas = array("i", bytes(take(4 * size)))
+    arrays.background_types[:] = take(size)
+    arrays.background_datas = array("i", bytes(take(4 * size)))
+    if sys.byteorder == "big":
+        arrays.datas.byteswap()
+        arrays.background_datas.byteswap()
+    arrays.deep = {
+        int(index): tuple((type, data) for type, data in layers)
+        for index, layers in header["deep"].items()
+    }
+    bits_size = (size + 7) // 8
+    explored = {name: bytes(take(bits_size)) for name in header["explored"]}
+    return SavedWorld(header, arrays, explored)
+
+def write_save(path: str, header: Dict[str, Any], arrays: TileArrays, explored: Dict[str, bytes]) -> None:
+    """Écrit une sauvegarde dans un fichier temporaire, qui remplace ensuite
+    le fichier d'un coup une fois complet (lisible par `read_save`).
+
+    Attributes
+    ----------
+    path: str
+        Le fichier de la sauvegarde
+    header: Dict[str, Any]
+        L'en-tête de la sauvegarde (numéro, heure, graine, point d'apparition,
+        fond, position des joueurs), complété par la taille du monde
+    arrays: TileArrays
+        L'état de toutes les tuiles
+    explored: Dict[str, bytes]
+        Les tuiles explorées par chaque joueur (celles qui ne correspondent
+        pas à la taille du monde sont ignorées)
+    """
+    bits_size = (arrays.width * arrays.height + 7) // 8
+    explored = {name: bits for name, bits in explored.items() if len(bits) == bits_size}
+    buffers = arrays.buffers() + list(explored.values())
+    header = dict(
+        header,
+        width=arrays.width,
+        height=arrays.height,
+        deep={str(index): [list(layer) for layer in layers] for index, layers in arrays.deep.items()},
+        explored=list(explored),
+        payload=sum(len(memoryview(buffer).cast("B")) for buffer in buffers),
+    )
+    encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    temporary = path + ".tmp"
+    compressor = zlib.compressobj(COMPRESSION_LEVEL)
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(encoded)))
+        file.write(encoded)
+        for buffer in buffers:
+            view = memoryview(buffer).cast("B")
+            for start in range(0, len(view), CHUNK_SIZE):
+                file.write(compressor.compress(view[start:start + CHUNK_SIZE]))
+        file.write(compressor.flush())
+        file.flush()
+        # la sauvegarde est sur le disque avant de remplacer la précédente
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+def load_latest(directory: str) -> Optional[SavedWorld]:
+    """Retourne la sauvegarde complète la plus récente d'un dossier (les
+    sauvegardes illisibles sont ignorées), ou `None` s'il n'y en a pas"""
+    if not os.path.isdir(directory):
+        return None
+    for number in sorted(save_numbers(directory), reverse=True):
+        path = os.path.join(directory, save_name(number))
+        try:
+            saved = read_save(path)
+        except (OSError, ValueError, KeyError) as error:
+            logging.warning("Ignoring save %s: %s", path, error)
+            continue
+        logging.info("Loaded %s (saved %s)", path, time.ctime(saved.time))
+        return saved
+    return None
+
+class Snapshot:
+    """L'état du monde au moment d'une sauvegarde, copié par le fil principal"""
+    __slots__ = ("full", "walk", "changes", "header", "explored", "explorers")
+
+    def __init__(
+        self,
+        full: Optional[TileArrays],
+        walk: Optional[TileWalk],
+        changes: Dict[int, Layers],
+        header: Dict[str, Any],
+        explored: Optional[Dict[str, bytes]],
+        explorers: List[str],
+    ) -> None:
+        self.full = full # toutes les tuiles déjà relevées, pour la première sauvegarde
+        self.walk = walk # ou le parcours des tuiles à faire par le fil de sauvegarde
+        self.changes = changes # sinon les tuiles modifiées depuis la sauvegarde précédente
+        self.header = header
+        # les tuiles explorées des joueurs qui en ont exploré de nouvelles
+        # (`None` si personne), et le nom de tous les joueurs du monde
+        self.explored = explored
+        self.explorers = explorers
+
+class Autosave:
+    """La sauvegarde régulière d'un monde dans un fil d'exécution séparé"""
+    arrays: Optional[TileArrays]
+
+    def __init__(
+        self,
+        directory: str,
+        map: Map,
+        positions: Callable[[], Positions],
+        interval: float = AUTOSAVE_INTERVAL,
+        keep: int = KEEP_SAVES,
+        level: int = 0,
+    ) -> None:
+        """Prépare la sauvegarde (la première est faite au premier appel de
+        `Autosave.tick`).
+
+        Attributes
+        ----------
+        directory: str
+            Le dossier des sauvegardes
+        map: Map
+            Le monde à sauvegarder
+        positions: Callable[[], Positions]
+            Retourne la position de chaque joueur, rangée par nom
+        interval: float = AUTOSAVE_INTERVAL
+            Le nombre de secondes entre deux sauvegardes
+        keep: int = KEEP_SAVES
+            Le nombre de sauvegardes gardées
+        level: int = 0
+            Le numéro du niveau du monde (voir `levels.py`)
+        """
+        self.directory = directory
+        self.map = map
+        self.positions = positions
+        self.interval = interval
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+        # les sauvegardes continuent la numérotation de celles du dossier
+        self.number = max(save_numbers(directory), default=0)
+        self.last_save = -interval # la première sauvegarde est faite tout de suite
+        self.last_positions: Optional[Positions] = None
+        self.exploration_version = -1
+        # tuiles explorées de chaque joueur lors de la dernière sauvegarde,
+        # et leur version (seules celles qui ont changé sont recopiées)
+        self.explored_versions: Dict[str, Tuple[Explored, int]] = {}
+        self.level = level
+        self.next_full: Optional[TileArrays] = None # tuiles déjà relevées du prochain monde
+        self.pending: queue.Queue[Optional[Snapshot]] = queue.Queue()
+        self.idle = threading.Event() # aucune sauvegarde en cours d'écriture
+        self.idle.set()
+        self.thread: Optional[threading.Thread] = None
+        self.failed = False # une sauvegarde a échoué : la suivante repart de zéro
+        # état du monde tenu par le fil de sauvegarde
+        self.arrays = None
+        self.explored: Dict[str, bytes] = {}
+
+    def tick(self) -> None:
+        """Sauvegarde le monde si la sauvegarde précédente est assez ancienne
+        et terminée (appelée à chaque image du jeu ou tick du serveur)"""
+        if time.monotonic() - self.last_save >= self.interval and self.idle.is_set():
+            self.save()
+
+    def save(self) -> bool:
+        """Copie l'état du monde et le confie au fil de sauvegarde.
+
+        Returns
+        -------
+        bool
+            Si une sauvegarde a été lancée (rien n'est écrit si le monde et
+            les joueurs n'ont pas changé depuis la précédente)
+        """
+        self.last_save = time.monotonic()
+        if self.failed:
+            # l'état tenu par le fil de sauvegarde n'est plus sûr
+            self.failed = False
+            self.map.journal.reset()
+            self.exploration_version = -1
+            self.explored_versions = {}
+        walk, changes = self.map.journal.take()
+        full, self.next_full = self.next_full, None
+        if walk is not None:
+            # le monde a été remplacé depuis le relevé de ses tuiles
+            full = None
+        positions = self.positions()
+        exploration = self.map.exploration
+        changed_exploration = exploration.version != self.exploration_version
+        if full is None and walk is None and not changes and not changed_exploration and positions == self.last_positions:
+            return False
+        explored = None
+        if changed_exploration:
+            self.exploration_version = exploration.version
+            explored = {}
+            versions = self.explored_versions
+            for name, tiles in exploration.explored.items():
+                previous = versions.get(name)
+                if previous is None or previous[0] is not tiles or previous[1] != tiles.version:
+                    versions[name] = (tiles, tiles.version)
+                    explored[name] = tiles.to_bytes()
+        self.last_positions = positions
+        self.number += 1
+        header = {
+            "number": self.number,
+            "time": time.time(),
+            "seed": self.map.seed,
+            "level": self.level,
+            "spawn": list(self.map.spawn),
+            "background": self.map.background,
+            "positions": {name: [int(x), int(y)] for name, (x, y) in positions.items()},
+        }
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+            self.thread.start()
+        self.idle.clear()
+        self.pending.put(Snapshot(full, walk, changes, header, explored, list(exploration.explored)))
+        return True
+
+    def set_map(self, map: Map, level: int, arrays: Optional[TileArrays] = None) -> None:
+        """Sauvegarde désormais un autre monde (le niveau où les joueurs
+        viennent d'entrer), dès la prochaine image.
+
+        Attributes
+        ----------
+        map: Map
+            Le nouveau monde à sauvegarder
+        level: int
+            Le numéro du niveau de ce monde
+        arrays: Optional[TileArrays] = None
+            L'état de toutes les tuiles du monde, s'il a déjà été relevé par
+            un autre fil (sinon toutes les tuiles sont parcourues à la
+            première sauvegarde)
+        """
+        self.map = map
+        self.level = level
+        self.exploration_version = -1
+        self.explored_versions = {}
+        self.last_save = -self.interval
+        if arrays is not None:
+            # le journal ne note que les tuiles modifiées après le relevé
+            map.journal.changes = {}
+            self.next_full = arrays
+        else:
+            map.journal.reset()
+            self.next_full = None
+
+    def _run(self) -> None:
+        """Écrit les sauvegardes en attente jusqu'à la fin de la partie"""
+        while True:
+            snapshot = self.pending.get()
+            if snapshot is None:
+                return
+            try:
+                self._apply(snapshot)
+                self._write(snapshot.header)
+            except OSError as error:
+                logging.warning("Could not write save %d: %s", snapshot.header["number"], error)
+            except Exception:
+                # le fil continue : la prochaine sauvegarde repart de zéro
+                logging.exception("Could not save %d", snapshot.header["number"])
+                self.failed = True
+            finally:
+                if self.pending.empty():
+                    self.idle.set()
+
+    def _apply(self, snapshot: Snapshot) -> None:
+        """Met à jour l'état du monde tenu par le fil de sauvegarde"""
+        if snapshot.full is not None:
+            self.arrays = snapshot.full
+        elif snapshot.walk is not None:
+            self.arrays = snapshot.walk.build()
+        arrays = self.arrays
+        for index, layers in snapshot.changes.items():
+            arrays.set(index, layers)
+        if snapshot.explored is not None:
+            explored = dict(self.explored)
+            explored.update(snapshot.explored)
+            # les joueurs qui ne sont plus dans le monde sont oubliés
+            self.explored = {name: explored[name] for name in snapshot.explorers if name in explored}
+
+    def _write(self, header: Dict[str, Any]) -> None:
+        """Écrit une sauvegarde puis supprime les plus anciennes"""
+        path = os.path.join(self.directory, save_name(header["number"]))
+        write_save(path, header, self.arrays, self.explored)
+        for number in sorted(save_numbers(self.directory))[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.directory, save_name(number)))
+            except OSError:
+                pass
+        logging.debug("Saved %s", path)
+
+    def close(self) -> None:
+        """Fait une dernière sauvegarde et attend la fin de son écriture"""
+        self.save()
+        if self.thread is not None:
+            self.pending.put(None)
+            self.thread.join()
+            self.thread = None
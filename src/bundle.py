@@ -0,0 +1,212 @@
+"""Ce fichier contient le paquet des ressources du jeu.
+Au lieu de lire `textures.json`, `blocs.json` et des dizaines d'images PNG au
+démarrage, le jeu ouvre un seul fichier construit à l'avance : un index JSON
+suivi des pixels de toutes les images, déjà décodés dans le format des surfaces
+de SDL. Le fichier est projeté en mémoire, et chaque texture n'est lue qu'au
+moment où elle est utilisée, sans décompression.
+
+À construire depuis la racine du projet (après chaque modification des images) :
+    python -m src.bundle
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+
+import json
+import logging
+import mmap
+import os
+import struct
+
+import pygame
+import pygame.image
+import pygame.surface
+
+__all__ = [
+    "BUNDLE_PATH",
+    "IMAGE_PATH",
+    "Bundle",
+    "build",
+    "open_bundle",
+    "bundle",
+]
+
+BUNDLE_PATH = "./data/assets.bundle"
+IMAGE_PATH = "./data/images"
+TEXTURES_FILE = "./data/textures.json"
+BLOCS_FILE = "./data/blocs.json"
+
+MAGIC = b"SYLB"
+VERSION = 1
+HEADER = struct.Struct("<4sBI") # signature, version, taille de l'index
+# format des pixels des surfaces avec transparence de SDL (celui de `convert_alpha`),
+# les images n'ont donc pas besoin d'être converties avant d'être affichées
+PIXEL_FORMAT = "BGRA"
+ALIGNMENT = 16 # alignement des pixels de chaque image dans le fichier
+
+class Bundle:
+    """Un paquet de ressources projeté en mémoire"""
+    index: Dict[str, Any]
+    images: Dict[str, Tuple[int, int, int]]
+
+    def __init__(self, path: str = BUNDLE_PATH) -> None:
+        """Ouvre un paquet construit par `build`.
+
+        Attributes
+        ----------
+        path: str = BUNDLE_PATH
+            Le chemin du paquet
+
+        Raises
+        ------
+        ValueError
+            Si le fichier n'est pas un paquet valide
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            # copie à l'écriture : les surfaces peuvent être modifiées sans
+            # toucher au fichier, et les pages ne sont lues qu'à leur utilisation
+            self.memory = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        if len(self.memory) < HEADER.size:
+            raise ValueError(f"{path} is not a supported bundle")
+        magic, version, index_size = HEADER.unpack_from(self.memory)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a supported bundle")
+        start = HEADER.size + index_size
+        self.index = json.loads(self.memory[HEADER.size:start].decode("utf-8"))
+        self.data_offset = _align(start)
+        self.images = {name: tuple(entry) for name, entry in self.index["images"].items()}
+        end = max((offset + width * height * 4 for offset, width, height in self.images.values()), default=0)
+        if self.data_offset + end > len(self.memory):
+            raise ValueError(f"{path} is truncated")
+        self.view = memoryview(self.memory)
+
+    @property
+    def textures(self) -> Dict[str, Any]:
+        """Le contenu de `textures.json` au moment de la construction"""
+        return self.index["textures"]
+
+    @property
+    def blocs(self) -> List[Dict[str, Any]]:
+        """Le contenu de `blocs.json` au moment de la construction"""
+        return self.index["blocs"]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.images
+
+    def load(self, name: str) -> pygame.surface.Surface:
+        """Retourne la surface d'une image du paquet.
+        Les pixels ne sont pas copiés : la surface utilise directement la
+        mémoire du fichier projeté.
+
+        Attributes
+        ----------
+        name: str
+            Le chemin de l'image relatif à `IMAGE_PATH`
+
+        Returns
+        -------
+        pygame.surface.Surface
+            La surface de l'image
+        """
+        offset, width, height = self.images[name]
+        start = self.data_offset + offset
+        return pygame.image.frombuffer(
+            self.view[start:start + width * height * 4],
+            (width, height),
+            self.index["format"],
+        )
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def list_images(image_path: str = IMAGE_PATH) -> List[str]:
+    """Retourne le chemin relatif de toutes les images du jeu (le dossier
+    `output` de `extract.py` est ignoré)"""
+    names = []
+    for directory, subdirectories, files in os.walk(image_path):
+        subdirectories[:] = sorted(d for d in subdirectories if d != "output")
+        for file_name in sorted(files):
+            if file_name.endswith(".png"):
+                path = os.path.relpath(os.path.join(directory, file_name), image_path)
+                names.append(path.replace(os.sep, "/"))
+    return names
+
+def build(path: str = BUNDLE_PATH, image_path: str = IMAGE_PATH) -> int:
+    """Construit le paquet de ressources et retourne le nombre d'images.
+
+    Attributes
+    ----------
+    path: str = BUNDLE_PATH
+        Le chemin du paquet à écrire
+    image_path: str = IMAGE_PATH
+        Le dossier des images
+
+    Returns
+    -------
+    int
+        Le nombre d'images du paquet
+    """
+    with open(TEXTURES_FILE) as file:
+        textures = json.load(file)
+    with open(BLOCS_FILE) as file:
+        blocs = json.load(file)
+    images = {}
+    pixels = []
+    offset = 0
+    for name in list_images(image_path):
+        surface = pygame.image.load(os.path.join(image_path, name))
+        data = pygame.image.tobytes(surface, PIXEL_FORMAT)
+        images[name] = (offset, surface.get_width(), surface.get_height())
+        pixels.append(data)
+        offset = _align(offset + len(data))
+    index = json.dumps(
+        {"format": PIXEL_FORMAT, "textures": textures, "blocs": blocs, "images": images},
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(index)))
+        file.write(index)
+        file.write(bytes(_align(file.tell()) - file.tell()))
+        for data in pixels:
+            file.write(data)
+            file.write(bytes(_align(len(data)) - len(data)))
+    os.replace(temporary, path)
+    return len(images)
+
+def open_bundle(path: str = BUNDLE_PATH) -> Optional[Bundle]:
+    """Ouvre le paquet de ressources s'il peut être utilisé.
+    Le jeu lit les fichiers séparés si le paquet n'existe pas, s'il est plus
+    ancien que `textures.json`, `blocs.json` ou l'une des images, ou si la
+    variable d'environnement `SYLVAJIA_BUNDLE` vaut `0`.
+
+    Returns
+    -------
+    Optional[Bundle]
+        Le paquet, ou `None` s'il ne doit pas être utilisé
+    """
+    if os.environ.get("SYLVAJIA_BUNDLE") == "0" or not os.path.exists(path):
+        return None
+    built = os.path.getmtime(path)
+    sources = [TEXTURES_FILE, BLOCS_FILE]
+    # les sources ne sont pas distribuées avec l'exécutable
+    if os.path.isdir(IMAGE_PATH):
+        sources.extend(os.path.join(IMAGE_PATH, name) for name in list_images())
+    for source in sources:
+        if os.path.exists(source) and os.path.getmtime(source) > built:
+            logging.warning("%s is older than %s, rebuild it with `python -m src.bundle`", path, source)
+            return None
+    try:
+        return Bundle(path)
+    except (ValueError, KeyError) as error:
+        logging.warning("Could not open %s: %s", path, error)
+        return None
+
+# le paquet n'est pas ouvert pendant sa construction, pour pouvoir le remplacer
+bundle = open_bundle() if __name__ != "__main__" else None
+
+# Lancer ce script directement construit le paquet
+if __name__ == "__main__":
+    count = build()
+    print(f"{count} images written to {BUNDLE_PATH} ({os.path.getsize(BUNDLE_PATH) // 1024} KiB)")
@@ -0,0 +1,187 @@
+"""Ce fichier contient la caméra et le contexte de rendu de chaque image.
+Les informations utilisées par toutes les tuiles (position de la caméra, zoom,
+étape d'animation…) sont calculées une seule fois par image dans un
+`FrameContext`, passé à `Map.render`, `Tile.render` et `Players.render`.
+"""
+from __future__ import annotations
+from typing import Optional, Tuple, TYPE_CHECKING
+
+import math
+
+import pygame
+
+from .overview import OVERVIEW_TILE_SIZES
+from .players import Coords
+from .sprites import BASE_SIZE, MIN_SCALE
+
+if TYPE_CHECKING:
+    from .players import Player
+
+__all__ = [
+    "Camera",
+    "FrameContext",
+    "tile_size",
+]
+
+def tile_size(zoom: int) -> int:
+    """Retourne la taille des tuiles à l'écran en pixels pour un niveau de zoom
+    (en dessous de `MIN_SCALE`, celle de la vue d'ensemble)"""
+    if zoom >= MIN_SCALE:
+        return BASE_SIZE * zoom
+    return OVERVIEW_TILE_SIZES[min(MIN_SCALE - 1 - zoom, len(OVERVIEW_TILE_SIZES) - 1)]
+
+class Camera:
+    """La caméra du jeu.
+    Elle suit un joueur (le joueur local par défaut), ou peut être détachée pour
+    observer le monde librement (mode spectateur) : elle se déplace alors comme
+    un joueur, case par case, sans collisions.
+    """
+    target: Optional[Player]
+    coords: Coords
+
+    def __init__(self) -> None:
+        self.target = None
+        self.coords = Coords()
+        self.detached = False
+
+    def follow(self, player: Optional[Player]) -> None:
+        """Attache la caméra à un joueur"""
+        self.target = player
+        self.detached = False
+
+    def detach(self) -> None:
+        """Détache la caméra du joueur suivi, à sa position actuelle"""
+        x, y = self.position()
+        self.coords = Coords(round(x), round(y))
+        self.detached = True
+
+    def move_by(self, offset_x: int = 0, offset_y: int = 0) -> None:
+        """Déplace la caméra détachée d'une case (au rythme des joueurs)"""
+        x, y = self.coords.real_coords()
+        if offset_x != 0:
+            self.coords.x = x + offset_x
+        if offset_y != 0:
+            self.coords.y = y + offset_y
+
+    def position(self) -> Tuple[float, float]:
+        """Retourne la position actuelle de la caméra dans le monde"""
+        if not self.detached and self.target is not None:
+            # la transition du joueur est avancée avant d'être lue, pour que le
+            # monde et le joueur soient dessinés à la même position
+            self.target.update_animation()
+            return self.target.x, self.target.y
+        self.coords.update()
+        return self.coords.x, self.coords.y
+
+class FrameContext:
+    """Les informations de rendu de l'image en cours, calculées une seule fois
+    par image (voir `Pygame.frame_context`)."""
+    __slots__ = (
+        "camera_x",
+        "camera_y",
+        "width",
+        "height",
+        "zoom",
+        "tile_size",
+        "overview",
+        "animation_state",
+        "pixel_x",
+        "pixel_y",
+        "origin_x",
+        "origin_y",
+        "columns",
+        "rows",
+    )
+
+    def __init__(
+        self,
+        camera_x: float,
+        camera_y: float,
+        width: int,
+        height: int,
+        zoom: int,
+        animation_state: int,
+    ) -> None:
+        """Calcule le contexte de l'image.
+
+        Attributes
+        ----------
+        camera_x: float
+        camera_y: float
+            La position de la caméra dans le monde (le centre de l'écran)
+        width: int
+        height: int
+            La taille de l'écran en pixels
+        zoom: int
+            L'agrandissement des tuiles de 16 pixels (la vue d'ensemble en
+            dessous de `MIN_SCALE`)
+        animation_state: int
+            L'étape d'animation des tuiles
+        """
+        self.camera_x = camera_x
+        self.camera_y = camera_y
+        self.width = width
+        self.height = height
+        self.zoom = zoom
+        self.tile_size = tile_size(zoom)
+        # en dessous de `MIN_SCALE`, le monde est affiché en vue d'ensemble
+        self.overview = zoom < MIN_SCALE
+        self.animation_state = animation_state
+        # la caméra est arrondie au pixel pour que l'image du monde décalée
+        # d'une image à l'autre corresponde exactement
+        self.pixel_x = math.floor(camera_x * self.tile_size)
+        self.pixel_y = math.floor(camera_y * self.tile_size)
+        # position à l'écran du centre de la tuile 0
+        self.origin_x = width//2 - self.pixel_x
+        self.origin_y = height//2 - self.pixel_y
+        self.columns, self.rows = self.tiles_in(pygame.Rect(0, 0, width, height))
+
+    @classmethod
+    def area(cls, x: int, y: int, width: int, height: int, zoom: int, animation_state: int = 0) -> FrameContext:
+        """Retourne le contexte d'une image hors de l'écran dont le coin haut
+        gauche est le coin haut gauche de la tuile (x, y) (utilisé par
+        l'export du monde).
+
+        Attributes
+        ----------
+        x: int
+        y: int
+            La tuile du coin haut gauche de l'image
+        width: int
+        height: int
+            La taille de l'image en pixels
+        zoom: int
+            L'agrandissement des tuiles de 16 pixels
+        animation_state: int = 0
+            L'étape d'animation des tuiles
+        """
+        context = cls(x, y, width, height, zoom, animation_state)
+        # la position est donnée directement en pixels, sans passer par la
+        # caméra, pour ne dépendre d'aucun arrondi
+        half = context.tile_size // 2
+        context.pixel_x = x * context.tile_size + width//2 - half
+        context.pixel_y = y * context.tile_size + height//2 - half
+        context.origin_x = half - x * context.tile_size
+        context.origin_y = half - y * context.tile_size
+        context.columns, context.rows = context.tiles_in(pygame.Rect(0, 0, width, height))
+        return context
+
+    def tiles_in(self, rect: pygame.Rect) -> Tuple[range, range]:
+        """Retourne les colonnes et les lignes des tuiles visibles dans un
+        rectangle de l'écran"""
+        tile_size = self.tile_size
+        half = tile_size // 2
+        return (
+            range((rect.left - self.origin_x + half) // tile_size, (rect.right - 1 - self.origin_x + half) // tile_size + 1),
+            range((rect.top - self.origin_y + half) // tile_size, (rect.bottom - 1 - self.origin_y + half) // tile_size + 1),
+        )
+
+    def tile_rect(self, x: int, y: int) -> pygame.Rect:
+        """Retourne le rectangle occupé par une tuile à l'écran"""
+        tile_size = self.tile_size
+        return pygame.Rect(
+            x * tile_size + self.origin_x - tile_size//2,
+            y * tile_size + self.origin_y - tile_size//2,
+            tile_size,
+            tile_size,
+        )
@@ -0,0 +1,160 @@
+"""Ce fichier contient l'enregistrement vidéo des images du jeu.
+À chaque image, l'écran est copié (en un seul `blit`) dans une surface d'une
+réserve préparée à l'avance, puis confiée à un fil d'exécution qui l'écrit sur
+le disque directement depuis la mémoire de la surface, sans autre copie.
+Quand l'écriture prend du retard et qu'il n'y a plus de surface libre,
+l'image est abandonnée plutôt que de ralentir le jeu.
+
+Deux formats sont possibles :
+- une suite d'images PNG dans un dossier (`image_000042.png`, numérotées
+  par image du jeu) ;
+- une vidéo brute (fichier `.raw`), avec un fichier `.json` qui décrit le
+  format des pixels, lisible par exemple avec
+  `ffmpeg -f rawvideo -pixel_format bgr0 -video_size 650x500 -framerate 30 -i partie.raw partie.mp4`.
+"""
+from __future__ import annotations
+from typing import BinaryIO, List, Optional, Tuple
+
+import json
+import logging
+import os
+import queue
+import threading
+
+import pygame
+import pygame.image
+
+__all__ = [
+    "QUEUE_SIZE",
+    "pixel_format",
+    "FrameCapture",
+]
+
+QUEUE_SIZE = 8 # nombre d'images en attente d'écriture au maximum
+
+def pixel_format(surface: pygame.Surface) -> str:
+    """Retourne l'ordre des octets des pixels d'une surface de 32 bits, au
+    format des noms de ffmpeg (par exemple `bgr0` : bleu, vert, rouge puis
+    un octet inutilisé)"""
+    names = []
+    red, green, blue, alpha = surface.get_masks()
+    for byte in range(surface.get_bytesize()):
+        # les pixels sont rangés en petit-boutiste
+        names.append({red: "r", green: "g", blue: "b", alpha: "a"}.get(0xFF << (8 * byte), "0"))
+    return "".join(names)
+
+class FrameCapture:
+    """L'enregistrement des images du jeu dans un fil d'exécution séparé"""
+    file: Optional[BinaryIO]
+
+    def __init__(self, path: str, fps: int, wait: bool = False, queue_size: int = QUEUE_SIZE) -> None:
+        """Prépare l'enregistrement (la réserve de surfaces est créée à la
+        première image, à la taille de l'écran).
+
+        Attributes
+        ----------
+        path: str
+            Le fichier `.raw` de la vidéo brute, ou le dossier des images PNG
+        fps: int
+            Le nombre d'images par seconde du jeu (indiqué dans la description de la vidéo)
+        wait: bool = False
+            Attend que l'écriture rattrape son retard au lieu d'abandonner des
+            images (pour les parties rejouées, qui n'ont pas à tenir le rythme)
+        queue_size: int = QUEUE_SIZE
+            Le nombre d'images en attente d'écriture au maximum
+        """
+        self.path = path
+        self.fps = fps
+        self.wait = wait
+        self.raw = path.endswith(".raw")
+        self.queue_size = queue_size
+        self.free: queue.Queue[pygame.Surface] = queue.Queue() # surfaces libres
+        self.pending: queue.Queue[Optional[Tuple[int, pygame.Surface]]] = queue.Queue() # images à écrire
+        self.frame = 0 # numéro de l'image du jeu
+        self.written = 0
+        self.dropped: List[int] = []
+        self.size = (0, 0)
+        self.format = ""
+        self.file = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self, screen: pygame.Surface) -> None:
+        """Crée la réserve de surfaces au format de l'écran et lance l'écriture"""
+        self.size = screen.get_size()
+        self.format = pixel_format(screen)
+        for _ in range(self.queue_size):
+            self.free.put(pygame.Surface(self.size, 0, screen))
+        if self.raw:
+            self.file = open(self.path, "wb")
+        else:
+            os.makedirs(self.path, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="capture", daemon=True)
+        self.thread.start()
+
+    def capture(self, screen: pygame.Surface) -> None:
+        """Confie l'image actuelle de l'écran à l'écriture, ou l'abandonne s'il
+        n'y a plus de surface libre"""
+        if self.thread is None:
+            self.start(screen)
+        try:
+            frame = self.free.get(block=self.wait)
+        except queue.Empty:
+            self.dropped.append(self.frame)
+        else:
+            frame.blit(screen, (0, 0))
+            self.pending.put((self.frame, frame))
+        self.frame += 1
+
+    def _run(self) -> None:
+        """Écrit les images en attente jusqu'à la fin de l'enregistrement"""
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            number, frame = item
+            try:
+                if self.file is not None:
+                    self._write_raw(frame)
+                else:
+                    pygame.image.save(frame, os.path.join(self.path, f"image_{number:06}.png"))
+                self.written += 1
+            except (OSError, pygame.error) as error:
+                logging.warning("Could not write frame %d: %s", number, error)
+            self.free.put(frame)
+
+    def _write_raw(self, frame: pygame.Surface) -> None:
+        """Écrit les pixels de la surface directement depuis sa mémoire"""
+        view = memoryview(frame.get_buffer())
+        row = frame.get_width() * frame.get_bytesize()
+        pitch = frame.get_pitch()
+        if pitch == row:
+            self.file.write(view)
+        else:
+            # les lignes de la surface sont suivies d'octets d'alignement
+            for start in range(0, pitch * frame.get_height(), pitch):
+                self.file.write(view[start:start + row])
+        view.release()
+
+    def close(self) -> None:
+        """Attend l'écriture des dernières images et termine l'enregistrement"""
+        if self.thread is None:
+            return
+        self.pending.put(None)
+        self.thread.join()
+        self.thread = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            width, height = self.size
+            with open(os.path.splitext(self.path)[0] + ".json", "w") as file:
+                json.dump({
+                    "width": width,
+                    "height": height,
+                    "pixel_format": self.format,
+                    "fps": self.fps,
+                    "frames": self.written,
+                    "dropped": self.dropped,
+                }, file, indent=4)
+        if self.dropped:
+            logging.warning("%d of %d frames dropped while capturing", len(self.dropped), self.frame)
+        logging.info("%d frames written to %s", self.written, self.path)
@@ -0,0 +1,285 @@
+"""Ce fichier contient le client multijoueur.
+La connexion tourne dans une boucle asyncio sur un fil d'exécution séparé :
+la boucle du jeu récupère les trames reçues avec `Client.poll` à chaque image
+sans jamais attendre le réseau.
+"""
+from __future__ import annotations
+from typing import Callable, Deque, List, Optional, Tuple
+
+from collections import deque
+import asyncio
+import logging
+import queue
+import socket
+import threading
+import time
+
+from .protocol import (
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    TICK_RATE,
+    FrameReader,
+    Message,
+    ProtocolError,
+    pack_hello,
+    unpack_reject,
+)
+
+__all__ = [
+    "Client",
+    "ServerClock",
+    "Prediction",
+]
+
+Frame = Tuple[Optional[int], bytes]
+
+INTERPOLATION_DELAY = 2 / TICK_RATE # retard d'affichage des joueurs distants
+CLOCK_SMOOTHING = 0.1 # poids d'une nouvelle mesure dans l'estimation de l'heure du serveur
+
+class ServerClock:
+    """Estimation de l'heure du serveur côté client.
+    Chaque trame `Message.TICK` donne l'heure du serveur, et l'écart avec l'heure
+    locale est lissé pour ne pas suivre les irrégularités du réseau. Les joueurs
+    distants sont affichés à l'heure `render_time`, avec un léger retard qui
+    garantit d'avoir reçu les positions entre lesquelles interpoler.
+    """
+    server_time: float
+    offset: Optional[float]
+
+    def __init__(self, delay: float = INTERPOLATION_DELAY) -> None:
+        """Initialise l'horloge.
+
+        Attributes
+        ----------
+        delay: float = INTERPOLATION_DELAY
+            Le retard d'affichage des joueurs distants en secondes
+        """
+        self.delay = delay
+        self.server_time = 0.0
+        self.offset = None
+
+    def update(self, tick: int) -> None:
+        """Prend en compte le numéro de tick reçu du serveur"""
+        self.server_time = tick / TICK_RATE
+        sample = self.server_time - time.monotonic()
+        if self.offset is None or sample > self.offset:
+            # une trame arrivée plus tôt que prévu est la meilleure estimation
+            self.offset = sample
+        else:
+            self.offset += (sample - self.offset) * CLOCK_SMOOTHING
+
+    def render_time(self) -> float:
+        """Retourne l'heure du serveur à laquelle afficher les joueurs distants"""
+        if self.offset is None:
+            return 0.0
+        return time.monotonic() + self.offset - self.delay
+
+class Prediction:
+    """Prédiction des déplacements du joueur local.
+    Le joueur se déplace immédiatement sans attendre le serveur. Les déplacements
+    envoyés sont numérotés et gardés jusqu'à leur acquittement : à la réception
+    de la position officielle, les déplacements pas encore traités par le serveur
+    sont rejoués à partir de cette position pour obtenir la position corrigée.
+    """
+    pending: Deque[Tuple[int, int, int]]
+
+    def __init__(self) -> None:
+        self.sequence = 0
+        self.pending = deque()
+
+    def record(self, offset_x: int, offset_y: int) -> int:
+        """Enregistre un déplacement et retourne son numéro de séquence"""
+        self.sequence = (self.sequence + 1) & 0xFFFF
+        self.pending.append((self.sequence, offset_x, offset_y))
+        return self.sequence
+
+    def reconcile(
+        self,
+        sequence: int,
+        x: int,
+        y: int,
+        allow_move: Callable[[int, int], bool],
+    ) -> Tuple[int, int]:
+        """Retourne la position prédite à partir de la position officielle.
+
+        Attributes
+        ----------
+        sequence: int
+            Le numéro du dernier déplacement traité par le serveur
+        x: int
+        y: int
+            La position officielle après ce déplacement
+        allow_move: Callable[[int, int], bool]
+            La fonction qui indique si une case est accessible
+
+        Returns
+        -------
+        Tuple[int, int]
+            La position prédite
+        """
+        pending = self.pending
+        # les numéros de séquence reviennent à 0 après 65535
+        while pending and (sequence - pending[0][0]) & 0xFFFF < 0x8000:
+            pending.popleft()
+        for _, offset_x, offset_y in pending:
+            if allow_move(x + offset_x, y + offset_y):
+                x, y = x + offset_x, y + offset_y
+        return x, y
+
+class ClientConnection(asyncio.Protocol):
+    """La connexion avec le serveur, côté client"""
+
+    def __init__(self, client: Client) -> None:
+        self.client = client
+        self.reader = FrameReader()
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def data_received(self, data: bytes) -> None:
+        try:
+            frames = self.reader.feed(data)
+        except ProtocolError as error:
+            logging.warning("Invalid data from server: %s", error)
+            self.client.transport.close()
+            return
+        for received in frames:
+            self.client.inbox.put(received)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        # une trame sans type indique au jeu que la connexion est perdue
+        self.client.inbox.put((None, b""))
+
+class Client:
+    """Le client multijoueur"""
+    loop: Optional[asyncio.AbstractEventLoop]
+    transport: Optional[asyncio.Transport]
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, name: str = "") -> None:
+        """Prépare le client (la connexion est ouverte par `Client.start`).
+
+        Attributes
+        ----------
+        host: str = DEFAULT_HOST
+            L'adresse du serveur
+        port: int = DEFAULT_PORT
+            Le port du serveur
+        name: str = ""
+            Le nom du joueur
+        """
+        self.host = host
+        self.port = port
+        self.name = name
+        self.inbox: queue.SimpleQueue[Frame] = queue.SimpleQueue()
+        self.pending: List[Frame] = [] # trames reçues pendant `Client.wait`
+        self.loop = None
+        self.transport = None
+        self.thread = None
+        self.connected = threading.Event()
+        self.error: Optional[BaseException] = None
+
+    def start(self, timeout: float = 5) -> None:
+        """Ouvre la connexion et envoie le nom du joueur.
+
+        Attributes
+        ----------
+        timeout: float = 5
+            Le temps maximal d'attente de la connexion
+
+        Raises
+        ------
+        ConnectionError
+            Si la connexion n'a pas pu être établie
+        """
+        self.thread = threading.Thread(target=self._run, name="client", daemon=True)
+        self.thread.start()
+        if not self.connected.wait(timeout) or self.transport is None:
+            raise ConnectionError(f"could not connect to {self.host}:{self.port}: {self.error}")
+        self.send(pack_hello(self.name))
+
+    def _run(self) -> None:
+        """Fait tourner la boucle asyncio du client (fil d'exécution séparé)"""
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.transport, _ = self.loop.run_until_complete(
+                self.loop.create_connection(
+                    lambda: ClientConnection(self),
+                    self.host,
+                    self.port,
+                )
+            )
+        except OSError as error:
+            self.error = error
+            self.connected.set()
+            self.loop.close()
+            return
+        self.connected.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+
+    def send(self, data: bytes) -> None:
+        """Envoie une trame au serveur (peut être appelée depuis le jeu)"""
+        if self.loop is not None and self.transport is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.transport.write, data)
+
+    def poll(self) -> List[Frame]:
+        """Retourne toutes les trames reçues depuis le dernier appel, sans attendre"""
+        frames, self.pending = self.pending, []
+        try:
+            while True:
+                frames.append(self.inbox.get_nowait())
+        except queue.Empty:
+            pass
+        return frames
+
+    def wait(self, message: int, timeout: float = 10) -> bytes:
+        """Attend la réception d'un type de message et retourne son contenu.
+        Les autres trames reçues entre temps sont gardées pour `Client.poll`.
+
+        Attributes
+        ----------
+        message: int
+            Le type de message attendu
+        timeout: float = 10
+            Le temps maximal d'attente
+
+        Returns
+        -------
+        bytes
+            Le contenu du message
+
+        Raises
+        ------
+        ConnectionError
+            Si la connexion est perdue ou refusée par le serveur, ou si le
+            message n'arrive pas à temps
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ConnectionError("timed out waiting for the server")
+            try:
+                received, payload = self.inbox.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if received is None:
+                raise ConnectionError("connection to the server lost")
+            if received == Message.REJECT:
+                raise ConnectionError(f"refused by the server: {unpack_reject(payload)}")
+            if received == message:
+                return payload
+            self.pending.append((received, payload))
+
+    def close(self) -> None:
+        """Ferme la connexion et arrête la boucle du client"""
+        if self.loop is not None and not self.loop.is_closed():
+            if self.transport is not None:
+                self.loop.call_soon_threadsafe(self.transport.close)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread is not None:
+            self.thread.join(1)
@@ -1,3 +1,5 @@
+from typing import Dict
+
 import json
 
 CONFIGURATION_FILE = "./data/configuration.json"
@@ -32,6 +34,15 @@ class Configuration:
     def application_id(self, value):
         self.json["application_id"] = value
     
+    @property
+    def bindings(self) -> Dict[str, str]:
+        """Les touches associées aux commandes du jeu (voir `inputs.DEFAULT_BINDINGS`)"""
+        return self.json.get("bindings", {})
+    
+    @bindings.setter
+    def bindings(self, value: Dict[str, str]):
+        self.json["bindings"] = value
+    
     @property
     def version(self):
         return self.json["version"]
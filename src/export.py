@@ -0,0 +1,293 @@
+"""Ce script exporte le monde entier en image PNG, pour relire un niveau.
+Le monde est dessiné par bandes horizontales avec les mêmes textures que le
+jeu (`Map.draw`), et chaque bande est compressée dans le fichier PNG dès
+qu'elle est dessinée : l'image complète n'est jamais gardée en mémoire (un
+monde de 2000x2000 tuiles de 32 pixels ferait 4 Go).
+
+Pour les très grands mondes, l'image peut aussi être découpée en carreaux de
+256 pixels, avec des niveaux de plus en plus réduits (une pyramide, comme
+celles des cartes en ligne), construits eux aussi bande par bande.
+
+À lancer depuis la racine du projet (sans affichage) :
+    python -m src.export monde.png [--seed 1234 | --world monde.json] [--zoom 2] [--tiles ./export]
+"""
+from __future__ import annotations
+from typing import Any, BinaryIO, Callable, Dict, Optional
+
+import os
+if __name__ == "__main__":
+    # l'export n'ouvre pas de fenêtre
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
+
+import argparse
+import json
+import struct
+import time
+import zlib
+
+import pygame
+import pygame.display
+import pygame.image
+import pygame.transform
+
+from .camera import FrameContext, tile_size
+from .map import Map
+from .sprites import DEFAULT_SCALE, MIN_SCALE, MAX_SCALE
+
+__all__ = [
+    "PNGWriter",
+    "Pyramid",
+    "export",
+]
+
+STRIP_BYTES = 16 * 1024 * 1024 # taille maximale d'une bande dessinée
+CHUNK_SIZE = 1024 * 1024 # taille des blocs `IDAT` écrits dans le fichier PNG
+PYRAMID_TILE = 256 # taille des carreaux de la pyramide en pixels
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+class PNGWriter:
+    """Un encodeur PNG qui reçoit l'image ligne par ligne.
+    Les lignes sont compressées au fur et à mesure, et les données compressées
+    sont écrites par blocs de `CHUNK_SIZE` : seule une bande de l'image est
+    en mémoire à la fois.
+    """
+
+    def __init__(self, file: BinaryIO, width: int, height: int, level: int = 6) -> None:
+        """Écrit l'en-tête d'une image RGB de 8 bits par couleur.
+
+        Attributes
+        ----------
+        file: BinaryIO
+            Le fichier dans lequel écrire
+        width: int
+        height: int
+            La taille de l'image en pixels
+        level: int = 6
+            Le niveau de compression de zlib
+        """
+        self.file = file
+        self.width = width
+        self.height = height
+        self.rows = 0
+        self.compressor = zlib.compressobj(level)
+        self.pending = bytearray()
+        file.write(PNG_SIGNATURE)
+        # 8 bits par couleur, RGB, compression et filtres standard, pas d'entrelacement
+        self.write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def write_chunk(self, kind: bytes, data: bytes) -> None:
+        self.file.write(struct.pack(">I", len(data)))
+        self.file.write(kind)
+        self.file.write(data)
+        self.file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind))))
+
+    def write_rows(self, data: bytes) -> None:
+        """Ajoute des lignes de pixels RGB à l'image"""
+        stride = self.width * 3
+        count = len(data) // stride
+        view = memoryview(data)
+        compress = self.compressor.compress
+        for start in range(0, count * stride, stride):
+            # chaque ligne commence par son filtre (0 : aucun)
+            self.pending += compress(b"\x00")
+            self.pending += compress(view[start:start + stride])
+        self.rows += count
+        while len(self.pending) >= CHUNK_SIZE:
+            self.write_chunk(b"IDAT", bytes(self.pending[:CHUNK_SIZE]))
+            del self.pending[:CHUNK_SIZE]
+
+    def close(self) -> None:
+        """Termine l'image
+
+        Raises
+        ------
+        ValueError
+            Si toutes les lignes n'ont pas été écrites
+        """
+        if self.rows != self.height:
+            raise ValueError(f"{self.rows} rows written, {self.height} expected")
+        self.pending += self.compressor.flush()
+        if self.pending:
+            self.write_chunk(b"IDAT", bytes(self.pending))
+        self.write_chunk(b"IEND", b"")
+
+class Pyramid:
+    """Un niveau d'une pyramide de carreaux.
+    Les lignes reçues sont gardées jusqu'à former une rangée de carreaux, qui
+    est enregistrée puis réduite de moitié et envoyée au niveau suivant.
+    Les carreaux sont enregistrés dans `dossier/niveau/colonne_ligne.png`
+    (le niveau 0 est l'image en taille réelle).
+    """
+    next: Optional[Pyramid]
+
+    def __init__(self, directory: str, width: int, height: int, level: int = 0) -> None:
+        """Prépare le niveau et les niveaux suivants, jusqu'à celui qui tient
+        dans un seul carreau.
+
+        Attributes
+        ----------
+        directory: str
+            Le dossier de la pyramide
+        width: int
+        height: int
+            La taille de l'image de ce niveau en pixels
+        level: int = 0
+            Le numéro du niveau
+        """
+        self.directory = directory
+        self.width = width
+        self.height = height
+        self.level = level
+        self.row = 0 # rangée de carreaux suivante
+        self.buffer = bytearray()
+        os.makedirs(os.path.join(directory, str(level)), exist_ok=True)
+        if width > PYRAMID_TILE or height > PYRAMID_TILE:
+            self.next = Pyramid(directory, (width + 1) // 2, (height + 1) // 2, level + 1)
+        else:
+            self.next = None
+
+    @property
+    def levels(self) -> int:
+        """Le nombre de niveaux à partir de celui-ci"""
+        return 1 if self.next is None else 1 + self.next.levels
+
+    def write_rows(self, data: bytes) -> None:
+        """Ajoute des lignes de pixels RGB au niveau"""
+        self.buffer += data
+        stride = self.width * 3
+        while len(self.buffer) >= stride * PYRAMID_TILE:
+            self.flush(PYRAMID_TILE)
+
+    def flush(self, rows: int) -> None:
+        """Enregistre une rangée de carreaux de `rows` lignes"""
+        stride = self.width * 3
+        block = bytes(self.buffer[:stride * rows])
+        del self.buffer[:stride * rows]
+        surface = pygame.image.frombuffer(block, (self.width, rows), "RGB")
+        for column, x in enumerate(range(0, self.width, PYRAMID_TILE)):
+            tile = surface.subsurface((x, 0, min(PYRAMID_TILE, self.width - x), rows))
+            pygame.image.save(tile, os.path.join(self.directory, str(self.level), f"{column}_{self.row}.png"))
+        self.row += 1
+        if self.next is not None:
+            reduced = pygame.transform.smoothscale(surface, (self.next.width, (rows + 1) // 2))
+            self.next.write_rows(pygame.image.tobytes(reduced, "RGB"))
+
+    def close(self) -> None:
+        """Enregistre les dernières lignes de ce niveau et des suivants"""
+        remaining = len(self.buffer) // (self.width * 3)
+        if remaining:
+            self.flush(remaining)
+        if self.next is not None:
+            self.next.close()
+
+def load_world(path: str) -> Map:
+    """Charge un monde sérialisé par `Map.to_dict` (fichier JSON)"""
+    with open(path) as file:
+        data: Dict[str, Any] = json.load(file)
+    map = Map(None, generate_maze=False)
+    map.load_dict(data)
+    return map
+
+def export(
+    map: Map,
+    path: Optional[str] = None,
+    tiles: Optional[str] = None,
+    zoom: int = DEFAULT_SCALE,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> None:
+    """Dessine tout le monde, bande par bande, dans une image PNG et/ou une
+    pyramide de carreaux.
+
+    Attributes
+    ----------
+    map: Map
+        Le monde à exporter
+    path: Optional[str] = None
+        Le fichier PNG à écrire
+    tiles: Optional[str] = None
+        Le dossier de la pyramide de carreaux à écrire
+    zoom: int = DEFAULT_SCALE
+        L'agrandissement des tuiles de 16 pixels
+    progress: Optional[Callable[[int, int], None]] = None
+        Appelée après chaque bande avec le nombre de lignes de tuiles dessinées
+        et le nombre total
+    """
+    size = tile_size(zoom)
+    width, height = map.WIDTH * size, map.HEIGHT * size
+    # les bandes font un nombre entier de lignes de tuiles
+    strip_rows = max(1, min(map.HEIGHT, STRIP_BYTES // max(1, width * 4 * size)))
+    strip = pygame.Surface((width, strip_rows * size))
+
+    writers = []
+    file = None
+    if path is not None:
+        file = open(path + ".tmp", "wb")
+        png = PNGWriter(file, width, height)
+        writers.append(png)
+    pyramid = None
+    if tiles is not None:
+        pyramid = Pyramid(tiles, width, height)
+        writers.append(pyramid)
+
+    try:
+        for top in range(0, map.HEIGHT, strip_rows):
+            rows = min(strip_rows, map.HEIGHT - top)
+            context = FrameContext.area(0, top, width, rows * size, zoom)
+            area = pygame.Rect(0, 0, width, rows * size)
+            map.draw(strip, area, context)
+            data = pygame.image.tobytes(strip.subsurface(area), "RGB")
+            for writer in writers:
+                writer.write_rows(data)
+            # les couches gardées par les tuiles dessinées ne servent plus
+            for row in map.map[top:top + rows]:
+                for tile in row:
+                    tile.invalidate()
+            if progress is not None:
+                progress(top + rows, map.HEIGHT)
+        if file is not None:
+            png.close()
+            file.close()
+            file = None
+            # l'image n'apparaît qu'une fois entièrement écrite
+            os.replace(path + ".tmp", path)
+        if pyramid is not None:
+            pyramid.close()
+            with open(os.path.join(tiles, "pyramid.json"), "w") as metadata:
+                json.dump({
+                    "width": width,
+                    "height": height,
+                    "tile_size": PYRAMID_TILE,
+                    "levels": pyramid.levels,
+                }, metadata, indent=4)
+    finally:
+        if file is not None:
+            file.close()
+            os.remove(path + ".tmp")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Exporte le monde entier en image PNG")
+    parser.add_argument("output", nargs="?", help="le fichier PNG à écrire")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--seed", type=int, help="la graine du monde généré")
+    source.add_argument("--world", metavar="FILE", help="un monde sérialisé (JSON de `Map.to_dict`)")
+    parser.add_argument("--zoom", type=int, default=DEFAULT_SCALE, choices=range(MIN_SCALE, MAX_SCALE + 1))
+    parser.add_argument("--tiles", metavar="DIRECTORY", help="écrit aussi une pyramide de carreaux dans ce dossier")
+    args = parser.parse_args()
+    if args.output is None and args.tiles is None:
+        parser.error("give an output file and/or --tiles")
+
+    pygame.display.init()
+    # les textures sont converties au format de l'écran
+    pygame.display.set_mode((1, 1))
+    map = load_world(args.world) if args.world is not None else Map(None, seed=args.seed)
+    start = time.perf_counter()
+    def progress(done: int, total: int) -> None:
+        print(f"\r{done}/{total} rows", end="", flush=True)
+    export(map, args.output, args.tiles, args.zoom, progress)
+    size = tile_size(args.zoom)
+    print(f"\n{map.WIDTH * size}x{map.HEIGHT * size} pixels exported in {time.perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,182 @@
 """Ce script est utilisé pour extraire les images du pack de textures
 Il n'est pas utilisé par le jeu mais peut être utilisé pour recréer les textures facilement.
+
+Seules les images utilisées par `textures.json` sont extraites : leur position
+dans la planche est indiquée dans `./data/extract.json` (les images absentes de
+ce fichier sont dessinées à la main). Une image n'est réécrite que si la tuile
+correspondante de la planche a changé.
+
+À lancer depuis la racine du projet :
+    python src/extract.py [--atlas ./data/images/output/atlas.png] [--all] [--force]
 """
+from __future__ import annotations
+from typing import Dict, List, Tuple
 
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import hashlib
+import json
+import math
 import os
 
+from PIL import Image, ImageChops
+
 SOURCE = "./data/Toen's Medieval Strategy Sprite Pack v.1.0 (16x16)/Tile-set - Toen's Medieval Strategy (16x16) - v.1.0.png"
 
 OUTPUT = "./data/images/output"
+IMAGE_PATH = "./data/images"
+TEXTURES_FILE = "./data/textures.json"
+TILES_FILE = "./data/extract.json" # position des images dans la planche
+CACHE_FILE = "./data/.extract-cache.json" # empreinte des tuiles déjà extraites
+
+TILE_SIZE = 16 # taille des tuiles dans la planche
+SCALE = 2 # agrandissement des tuiles extraites
+KEY_COLOR = (255, 255, 255) # couleur du fond, rendue transparente
+
+def load_sheet(path: str = SOURCE) -> Image.Image:
+    """Ouvre la planche et rend le fond transparent.
+    Le masque du fond est calculé sur toute l'image par Pillow, sans boucle
+    sur les pixels.
+    """
+    sheet = Image.open(path).convert("RGBA")
+    masks = [
+        band.point(lambda value, key=key: 255 if value == key else 0)
+        for band, key in zip(sheet.split()[:3], KEY_COLOR)
+    ]
+    background = ImageChops.multiply(ImageChops.multiply(masks[0], masks[1]), masks[2])
+    transparent = Image.new("RGBA", sheet.size, (0, 0, 0, 0))
+    return Image.composite(transparent, sheet, background)
+
+def crop_tile(sheet: Image.Image, row: int, column: int) -> Image.Image:
+    """Retourne la tuile de la planche à la ligne et à la colonne données"""
+    return sheet.crop((
+        column * TILE_SIZE,
+        row * TILE_SIZE,
+        (column + 1) * TILE_SIZE,
+        (row + 1) * TILE_SIZE,
+    ))
+
+def referenced_images() -> List[str]:
+    """Retourne le nom de toutes les images utilisées par `textures.json`"""
+    with open(TEXTURES_FILE) as file:
+        textures = json.load(file)
+    names: List[str] = []
+    for entry in textures.values():
+        for name in [entry["location"], *entry.get("frames", []), *entry.get("datas", {}).values(), *entry.get("grid", [])]:
+            if name not in names:
+                names.append(name)
+    return names
+
+def fingerprint(tile: Image.Image) -> str:
+    """Retourne l'empreinte d'une tuile, qui change avec ses pixels ou l'agrandissement"""
+    return hashlib.sha256(f"{tile.size}:{SCALE}:".encode() + tile.tobytes()).hexdigest()
+
+def save_tile(tile: Image.Image, path: str) -> None:
+    """Agrandit une tuile et l'enregistre (appelée en parallèle : Pillow libère
+    le GIL pendant la compression)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tile.resize((TILE_SIZE * SCALE, TILE_SIZE * SCALE), resample=Image.NEAREST).save(path)
+
+def save_atlas(tiles: Dict[str, Image.Image], path: str) -> None:
+    """Regroupe les tuiles dans une seule image, avec un index JSON du même nom
+    qui donne le rectangle `[x, y, largeur, hauteur]` de chaque image"""
+    size = TILE_SIZE * SCALE
+    columns = max(1, math.ceil(math.sqrt(len(tiles))))
+    rows = max(1, math.ceil(len(tiles) / columns))
+    atlas = Image.new("RGBA", (columns * size, rows * size), (0, 0, 0, 0))
+    rectangles = {}
+    for position, (name, tile) in enumerate(tiles.items()):
+        x, y = position % columns * size, position // columns * size
+        atlas.paste(tile.resize((size, size), resample=Image.NEAREST), (x, y))
+        rectangles[name] = [x, y, size, size]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    atlas.save(path)
+    with open(os.path.splitext(path)[0] + ".json", "w") as file:
+        json.dump(rectangles, file, indent=4)
+
+def extract(force: bool = False, workers: int = 0) -> Tuple[int, int]:
+    """Extrait les images utilisées par le jeu dans `IMAGE_PATH`.
+
+    Attributes
+    ----------
+    force: bool = False
+        Réécrit toutes les images, même celles qui n'ont pas changé
+    workers: int = 0
+        Le nombre de fils d'exécution pour l'enregistrement (0 : un par processeur)
+
+    Returns
+    -------
+    Tuple[int, int]
+        Le nombre d'images écrites et le nombre d'images inchangées
+    """
+    sheet = load_sheet()
+    with open(TILES_FILE) as file:
+        positions: Dict[str, List[int]] = json.load(file)
+    cache: Dict[str, str] = {}
+    if not force and os.path.exists(CACHE_FILE):
+        with open(CACHE_FILE) as file:
+            cache = json.load(file)
+
+    jobs = []
+    skipped = 0
+    for name in referenced_images():
+        if name not in positions:
+            continue # image dessinée à la main
+        tile = crop_tile(sheet, *positions[name])
+        digest = fingerprint(tile)
+        path = os.path.join(IMAGE_PATH, name)
+        if cache.get(name) == digest and os.path.exists(path):
+            skipped += 1
+            continue
+        cache[name] = digest
+        jobs.append((tile, path))
 
-# Créé le dossier de sortie si il n'existe pas
-if not os.path.exists(OUTPUT):
-    os.makedirs(OUTPUT)
+    with ThreadPoolExecutor(workers or None) as executor:
+        for _ in executor.map(lambda job: save_tile(*job), jobs):
+            pass
+    with open(CACHE_FILE, "w") as file:
+        json.dump(cache, file, indent=4, sort_keys=True)
+    return len(jobs), skipped
 
-image = Image.open(SOURCE)
+def extract_all(output: str = OUTPUT) -> int:
+    """Extrait toutes les tuiles de la planche dans `output` (nommées
+    `ligne_colonne.png`), pour trouver de nouvelles textures"""
+    sheet = load_sheet()
+    columns, rows = sheet.width // TILE_SIZE, sheet.height // TILE_SIZE
+    jobs = [
+        (crop_tile(sheet, y, x), os.path.join(output, f"{y}_{x}.png"))
+        for y in range(rows)
+        for x in range(columns)
+    ]
+    with ThreadPoolExecutor() as executor:
+        for _ in executor.map(lambda job: save_tile(*job), jobs):
+            pass
+    return len(jobs)
 
-image_data = image.load()
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Extrait les textures du pack de textures")
+    parser.add_argument("--force", action="store_true", help="réécrit toutes les images")
+    parser.add_argument("--all", action="store_true", help=f"extrait toutes les tuiles de la planche dans {OUTPUT}")
+    parser.add_argument("--atlas", metavar="FILE", help="écrit aussi les images utilisées dans un atlas")
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
 
-height,width = image.size
-for loop1 in range(height):
-    for loop2 in range(width):
-        r,g,b, a = image_data[loop1,loop2]
-        if r == 255 and g == 255 and b == 255:
-            image_data[loop1,loop2] = 0,0, 0, 0
+    if args.all:
+        print(f"{extract_all()} tiles written to {OUTPUT}")
+        return
+    written, skipped = extract(args.force, args.workers)
+    print(f"{written} images written, {skipped} unchanged")
+    if args.atlas:
+        sheet = load_sheet()
+        with open(TILES_FILE) as file:
+            positions = json.load(file)
+        tiles = {
+            name: crop_tile(sheet, *positions[name])
+            for name in referenced_images()
+            if name in positions
+        }
+        save_atlas(tiles, args.atlas)
+        print(f"{len(tiles)} images written to {args.atlas}")
 
-for y in range(44):
-    for x in range(7):
-        actual = image.crop((x*16,y*16,(x+1)*16,(y+1)*16))
-        actual = actual.resize((32, 32), resample=Image.NEAREST)
-        actual.save(f"{OUTPUT}/{y}_{x}.png")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
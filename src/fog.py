@@ -0,0 +1,278 @@
+"""Ce fichier contient le brouillard de guerre.
+Chaque joueur a un ensemble de bits des tuiles qu'il a déjà vues (un bit par
+tuile, `Explored`), mis à jour quand il se déplace. Les ensembles sont gardés
+par le monde (`Map.exploration`), avec lequel ils sont sérialisés, et sont
+aussi tenus à jour par le serveur pour tous les joueurs.
+
+Le joueur local voit les tuiles inexplorées assombries : `FogOverlay` garde un
+masque d'un octet par tuile, utilisé comme pixels d'une surface à palette, et
+n'agrandit que la partie visible du monde. L'image agrandie est gardée d'une
+image à l'autre et n'est modifiée que quand de nouvelles tuiles sont explorées.
+"""
+from __future__ import annotations
+from typing import Dict, Optional, TYPE_CHECKING
+
+import base64
+import zlib
+
+import pygame
+import pygame.image
+import pygame.transform
+
+if TYPE_CHECKING:
+    from .camera import FrameContext
+    from .map import Map
+
+__all__ = [
+    "SIGHT_RADIUS_X",
+    "SIGHT_RADIUS_Y",
+    "Explored",
+    "Exploration",
+    "FogOverlay",
+]
+
+# zone vue par un joueur autour de lui : l'écran au zoom par défaut (21x15 tuiles)
+SIGHT_RADIUS_X = 10
+SIGHT_RADIUS_Y = 7
+
+FOG_COLOR = (0, 0, 0)
+FOG_ALPHA = 170 # opacité du brouillard sur les tuiles inexplorées
+FOG_MARGIN = 8 # tuiles agrandies en plus autour de l'écran, pour ne pas tout refaire à chaque déplacement
+
+# les 8 octets du masque correspondant à chaque octet de l'ensemble de bits
+# (1 : tuile inexplorée, 0 : tuile explorée)
+EXPAND = [bytes(1 - (value >> bit & 1) for bit in range(8)) for value in range(256)]
+
+class Explored:
+    """Les tuiles déjà vues par un joueur.
+    La tuile (x, y) correspond au bit `y * width + x` (bit de poids faible en
+    premier) : pour un monde de 2000x2000 tuiles, l'ensemble prend 500 Ko.
+    """
+    __slots__ = ("width", "height", "bits", "version")
+
+    def __init__(self, width: int, height: int, bits: Optional[bytes] = None) -> None:
+        """Crée l'ensemble des tuiles explorées.
+
+        Attributes
+        ----------
+        width: int
+        height: int
+            La taille du monde en tuiles
+        bits: Optional[bytes] = None
+            Les bits sérialisés par `to_bytes` (aucune tuile explorée si non donnés)
+        """
+        self.width = width
+        self.height = height
+        size = (width * height + 7) // 8
+        if bits is not None and len(bits) == size:
+            self.bits = bytearray(bits)
+        else:
+            self.bits = bytearray(size)
+        self.version = 0 # incrémentée quand de nouvelles tuiles sont explorées
+
+    def __contains__(self, coords) -> bool:
+        x, y = coords
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return False
+        index = y * self.width + x
+        return bool(self.bits[index >> 3] >> (index & 7) & 1)
+
+    def set_range(self, start: int, stop: int) -> bool:
+        """Marque les bits de `start` à `stop` (exclus) et retourne si l'un
+        d'eux ne l'était pas encore. Les octets entiers sont écrits d'un coup."""
+        bits = self.bits
+        first, last = start >> 3, (stop - 1) >> 3
+        first_mask = 0xFF << (start & 7) & 0xFF
+        last_mask = 0xFF >> (7 - ((stop - 1) & 7))
+        if first == last:
+            mask = first_mask & last_mask
+            if bits[first] & mask == mask:
+                return False
+            bits[first] |= mask
+            return True
+        changed = bits[first] & first_mask != first_mask or bits[last] & last_mask != last_mask
+        bits[first] |= first_mask
+        bits[last] |= last_mask
+        if last - first > 1:
+            middle = b"\xff" * (last - first - 1)
+            if bits[first + 1:last] != middle:
+                bits[first + 1:last] = middle
+                changed = True
+        return changed
+
+    def reveal(self, x: int, y: int, radius_x: int = SIGHT_RADIUS_X, radius_y: int = SIGHT_RADIUS_Y) -> Optional[pygame.Rect]:
+        """Marque comme explorées les tuiles autour d'une position.
+
+        Attributes
+        ----------
+        x: int
+        y: int
+            La position du joueur
+        radius_x: int = SIGHT_RADIUS_X
+        radius_y: int = SIGHT_RADIUS_Y
+            La distance de vue
+
+        Returns
+        -------
+        Optional[pygame.Rect]
+            La zone vue (en tuiles), ou `None` si elle était déjà entièrement explorée
+        """
+        area = pygame.Rect(x - radius_x, y - radius_y, 2 * radius_x + 1, 2 * radius_y + 1)
+        area = area.clip((0, 0, self.width, self.height))
+        if area.width <= 0 or area.height <= 0:
+            return None
+        changed = False
+        for row in range(area.top, area.bottom):
+            start = row * self.width + area.left
+            if self.set_range(start, start + area.width):
+                changed = True
+        if not changed:
+            return None
+        self.version += 1
+        return area
+
+    def count(self) -> int:
+        """Retourne le nombre de tuiles explorées"""
+        return sum(bin(value).count("1") for value in self.bits)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.bits)
+
+class Exploration:
+    """Les tuiles explorées par chaque joueur du monde, rangées par nom de
+    joueur (les identifiants changent d'une connexion à l'autre)"""
+    explored: Dict[str, Explored]
+
+    def __init__(self, map: Map) -> None:
+        self.map = map
+        self.explored = {}
+        self.version = 0 # incrémentée quand un joueur explore de nouvelles tuiles
+
+    def get(self, name: str) -> Explored:
+        """Retourne les tuiles explorées par un joueur (créées si besoin, ou
+        recréées si la taille du monde a changé)"""
+        explored = self.explored.get(name)
+        if explored is None or (explored.width, explored.height) != (self.map.WIDTH, self.map.HEIGHT):
+            explored = self.explored[name] = Explored(self.map.WIDTH, self.map.HEIGHT)
+        return explored
+
+    def reveal(self, name: str, x: int, y: int) -> Optional[pygame.Rect]:
+        """Marque les tuiles vues par un joueur à une position et retourne la
+        zone nouvellement explorée (voir `Explored.reveal`)"""
+        area = self.get(name).reveal(x, y)
+        if area is not None:
+            self.version += 1
+        return area
+
+    def set(self, name: str, bits: bytes) -> None:
+        """Remplace les tuiles explorées par un joueur par des bits sérialisés
+        par `Explored.to_bytes` (ignorés s'ils ne correspondent pas à la
+        taille du monde)"""
+        self.explored[name] = Explored(self.map.WIDTH, self.map.HEIGHT, bits)
+        self.version += 1
+
+    def discard(self, name: str) -> None:
+        """Oublie les tuiles explorées par un joueur"""
+        if self.explored.pop(name, None) is not None:
+            self.version += 1
+
+    def to_dict(self) -> Dict[str, str]:
+        """Retourne les tuiles explorées de chaque joueur, compressées et
+        encodées en base64 pour le sérialisateur"""
+        return {
+            name: base64.b64encode(zlib.compress(explored.to_bytes())).decode("ascii")
+            for name, explored in self.explored.items()
+        }
+
+    def load_dict(self, dict: Dict[str, str]) -> None:
+        """Charge les tuiles explorées sérialisées par `to_dict` (celles qui ne
+        correspondent pas à la taille du monde sont ignorées)"""
+        self.explored = {}
+        size = (self.map.WIDTH * self.map.HEIGHT + 7) // 8
+        for name, data in dict.items():
+            bits = zlib.decompress(base64.b64decode(data))
+            if len(bits) == size:
+                self.explored[name] = Explored(self.map.WIDTH, self.map.HEIGHT, bits)
+        self.version += 1
+
+class FogOverlay:
+    """Le brouillard affiché par dessus le monde pour le joueur local"""
+    scaled: Optional[pygame.Surface]
+
+    def __init__(self, explored: Explored) -> None:
+        """Construit le masque à partir des tuiles déjà explorées.
+
+        Attributes
+        ----------
+        explored: Explored
+            Les tuiles explorées par le joueur local
+        """
+        self.explored = explored
+        width, height = explored.width, explored.height
+        self.mask = bytearray(b"".join(EXPAND[value] for value in explored.bits)[:width * height])
+        # la surface partage la mémoire du masque
+        self.surface = pygame.image.frombuffer(self.mask, (width, height), "P")
+        self.surface.set_palette([FOG_COLOR] * 256)
+        self.scaled = None # partie agrandie du masque
+        self.window = pygame.Rect(0, 0, 0, 0) # tuiles de `scaled`
+        self.tile_size = 0
+        self.thumbnail: Optional[pygame.Surface] = None
+
+    def reveal(self, area: pygame.Rect) -> None:
+        """Retire le brouillard d'une zone nouvellement explorée (en tuiles).
+        L'image agrandie est effacée sur place au lieu d'être recalculée."""
+        width = self.explored.width
+        clear = bytes(area.width)
+        for row in range(area.top, area.bottom):
+            start = row * width + area.left
+            self.mask[start:start + area.width] = clear
+        if self.scaled is not None:
+            overlap = area.clip(self.window)
+            if overlap.width > 0 and overlap.height > 0:
+                tile_size = self.tile_size
+                self.scaled.fill(0, (
+                    (overlap.x - self.window.x) * tile_size,
+                    (overlap.y - self.window.y) * tile_size,
+                    overlap.width * tile_size,
+                    overlap.height * tile_size,
+                ))
+        self.thumbnail = None
+
+    def render(self, surface: pygame.Surface, context: FrameContext) -> None:
+        """Assombrit les tuiles inexplorées visibles.
+
+        Attributes
+        ----------
+        surface: pygame.Surface
+            La surface sur laquelle le monde est affiché (l'écran)
+        context: FrameContext
+            Le contexte de rendu de l'image (tuiles visibles, taille des tuiles)
+        """
+        bounds = self.surface.get_rect()
+        visible = pygame.Rect(
+            context.columns.start,
+            context.rows.start,
+            len(context.columns),
+            len(context.rows),
+        ).clip(bounds)
+        if visible.width <= 0 or visible.height <= 0:
+            return
+        tile_size = context.tile_size
+        if self.scaled is None or tile_size != self.tile_size or not self.window.contains(visible):
+            self.window = visible.inflate(2 * FOG_MARGIN, 2 * FOG_MARGIN).clip(bounds)
+            self.tile_size = tile_size
+            self.scaled = pygame.transform.scale(
+                self.surface.subsurface(self.window),
+                (self.window.width * tile_size, self.window.height * tile_size),
+            )
+            self.scaled.set_colorkey(0)
+            self.scaled.set_alpha(FOG_ALPHA)
+        surface.blit(self.scaled, context.tile_rect(self.window.x, self.window.y))
+
+    def render_thumbnail(self, surface: pygame.Surface, rect: pygame.Rect) -> None:
+        """Assombrit les tuiles inexplorées de la mini-carte affichée dans `rect`"""
+        if self.thumbnail is None or self.thumbnail.get_size() != rect.size:
+            self.thumbnail = pygame.transform.scale(self.surface, rect.size)
+            self.thumbnail.set_colorkey(0)
+            self.thumbnail.set_alpha(FOG_ALPHA)
+        surface.blit(self.thumbnail, rect)
@@ -1,20 +1,55 @@
 from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
 
 import logging
+import time
+import tracemalloc
 
 import pygame
 import pygame.display
+import pygame.draw
 import pygame.time
 import pygame.event
-import pygame.key
 import pygame.font
 import pygame.image
 
+from .autosave import Autosave
+from .camera import Camera, FrameContext, tile_size
+from .capture import FrameCapture
 from .players import Players
 from . import players
+from .client import Client, Prediction, ServerClock
+from .fog import FogOverlay
 from .map import Map
+from .memory import MemorySnapshot
+from . import memory
+from .metrics import FRAME_TIME, FRAMES, metrics
+from .players import InterpolatedCoords, Player
+from .configuration import configuration
+from .levels import Levels
+from .inputs import MOVES, SECOND_MOVES, Command, InputHandler, command_mask, mask_commands
+from .replay import Recording
+from .overview import OVERVIEW_TILE_SIZES
+from .sprites import DEFAULT_SCALE, MAX_SCALE, MIN_SCALE, load_image, prescale, preload
+from .protocol import (
+    Message,
+    decode_world,
+    pack_move,
+    unpack_ack,
+    unpack_join,
+    unpack_leave,
+    unpack_position,
+    unpack_tick,
+    unpack_tile,
+    unpack_welcome,
+)
+from .text import GlyphLine, text_cache
+from .viewport import MAX_VIEWPORTS, Viewport, split_screen
 
 FPS = 30
+MIN_ZOOM = MIN_SCALE - len(OVERVIEW_TILE_SIZES) # niveau de zoom le plus éloigné (vue d'ensemble)
+SECOND_PLAYER_ID = 1 # identifiant du deuxième joueur local (écran partagé)
+SECOND_PLAYER_NAME = "player 2" # nom du deuxième joueur local, pour l'exploration et les sauvegardes
 
 class Pygame:
     """Ceci est la classe principale de l'affichage.
@@ -24,17 +59,48 @@ class Pygame:
     exit = 0
     animation_state = 0
     debug: int
-    debug_key_pressed: bool = False
     noclip: bool = False
+    minimap: bool = False
+    grid: bool = False
 
-    def __init__(self):
+    def __init__(self, client: Optional[Client] = None, seed: Optional[int] = None, split: bool = False):
         """Initialise le jeu.
         Cette fonction charge les fonts, prépare l'écran et l'horloge du jeu, créé la classe qui gère les joueurs
         et la classe contenant le terrain.
+        
+        Attributes
+        ----------
+        client: Optional[Client] = None
+            Le client connecté au serveur pour une partie multijoueur.
+            Si il n'est pas donné, la partie est locale et le monde est généré.
+        seed: Optional[int] = None
+            La graine du monde généré pour une partie locale
+        split: bool = False
+            Partage l'écran avec un deuxième joueur local (partie locale seulement)
         """
         pygame.init()
 
+        self.client = client
+
+        # heure du jeu en secondes, avancée de la durée de chaque image.
+        # Les transitions des joueurs l'utilisent pour que la partie puisse être rejouée.
+        self.time = 0.0
+        players.clock = self.get_time
+
         self.debug = 0
+        # position des joueurs locaux au lancement, rangée par leur nom : celle
+        # d'une sauvegarde reprise (par défaut le point d'apparition)
+        self.start_positions: Dict[str, Tuple[int, int]] = {}
+        self.split = split and client is None
+        self.second_player: Optional[Player] = None # deuxième joueur local (écran partagé)
+        self.viewports: List[Viewport] = [] # parties de l'écran, la première suit `self.camera`
+        self.spectated: List[int] = [] # joueurs suivis par la grille du mode spectateur
+        # niveaux du monde d'une partie locale (créés au lancement de la
+        # partie s'ils ne sont pas donnés, voir `levels.py`)
+        self.levels: Optional[Levels] = None
+        self.autosave: Optional[Autosave] = None
+        self.memory_snapshot: Optional[MemorySnapshot] = None # dernier rapport de mémoire
+        self.zoom = DEFAULT_SCALE # agrandissement des tuiles de 16 pixels
 
         self.font = pygame.font.Font(
             "./data/fonts/04B_30__.TTF",
@@ -46,110 +112,433 @@ class Pygame:
             10
         )
 
+        # ligne de texte du menu de débogage, mise à jour caractère par caractère
+        self.debug_line = GlyphLine(self.font, (255, 255, 255))
+
         self.screen = pygame.display.set_mode((650, 500))
         pygame.display.set_caption("Sylvajia")
-        pygame_icon = pygame.image.load('./data/images/player.png')
+        pygame_icon = load_image("player.png")
         pygame.display.set_icon(pygame_icon)
+        # toutes les textures sont chargées avant la partie pour que les
+        # premières images ne lisent aucun fichier
+        preload(self.show_progress)
         self.clock = pygame.time.Clock()
+        self.inputs = InputHandler(configuration.bindings)
 
         self.players = Players(self)
+        self.camera = Camera()
 
-        if True:
-            self.map = Map(self)
+        if self.client is None:
+            self.map = Map(self, seed=seed)
+        else:
+            # le monde est envoyé par le serveur lors de la connexion
+            self.map = Map(self, generate_maze=False)
+            self.server_clock = ServerClock()
+            self.prediction = Prediction()
         
     
-    def loop(self):
+    def show_progress(self, done: int, total: int) -> None:
+        """Affiche l'écran de chargement des textures.
+
+        Attributes
+        ----------
+        done: int
+            Le nombre de textures chargées
+        total: int
+            Le nombre total de textures
+        """
+        pygame.event.pump()
+        width, height = self.screen.get_size()
+        self.screen.fill((0, 0, 0))
+        text = self.small_font.render(f"Chargement des textures {done}/{total}", True, (255, 255, 255))
+        self.screen.blit(text, ((width - text.get_width()) // 2, height // 2 - 2 * text.get_height()))
+        bar = pygame.Rect(width // 4, height // 2, width // 2, 12)
+        pygame.draw.rect(self.screen, (255, 255, 255), bar, 1)
+        bar.width = bar.width * done // total
+        pygame.draw.rect(self.screen, (255, 255, 255), bar)
+        pygame.display.update()
+
+    def get_time(self) -> float:
+        """Retourne l'heure du jeu (la somme des durées des images précédentes)"""
+        return self.time
+    
+    def loop(
+        self,
+        replay: Optional[Recording] = None,
+        recording: Optional[Recording] = None,
+        capture: Optional[FrameCapture] = None,
+        autosave: Optional[Autosave] = None,
+    ):
         """Cette fonction fait tourner le jeu tant qu'il n'est pas quitté (avec la croix ou alt+f4).
+        
+        Attributes
+        ----------
+        replay: Optional[Recording] = None
+            Si il est donné, les commandes et la durée de chaque image sont lues dans
+            cet enregistrement au lieu du clavier, et le jeu tourne aussi vite que
+            possible jusqu'à la fin de l'enregistrement.
+        recording: Optional[Recording] = None
+            Si il est donné, les commandes et la durée de chaque image y sont enregistrées.
+        capture: Optional[FrameCapture] = None
+            Si il est donné, chaque image affichée y est enregistrée.
+        autosave: Optional[Autosave] = None
+            Si il est donné, le monde et la position du joueur y sont
+            régulièrement sauvegardés.
         """
-        self.players.init()
+        self.autosave = autosave
+        # les tuiles explorées sont rangées par nom de joueur
+        self.explorer = self.client.name if self.client is not None else ""
+        if self.client is None:
+            self.players.init(0, *self.start_positions.get(self.explorer, (None, None)))
+        else:
+            self.join()
+        self.camera.follow(self.players.player)
+        self.fog = FogOverlay(self.map.exploration.get(self.explorer))
+        if self.split:
+            self.players.new(SECOND_PLAYER_ID, *self.start_positions.get(SECOND_PLAYER_NAME, (None, None)))
+            self.second_player = self.players[SECOND_PLAYER_ID]
+            self.second_player.color = 2
+            self.second_camera = Camera()
+            self.second_camera.follow(self.second_player)
+            self.second_fog = FogOverlay(self.map.exploration.get(SECOND_PLAYER_NAME))
+        self.layout()
+        if self.client is None and self.levels is None:
+            self.levels = Levels(self.map)
+
+        ticks = iter(replay) if replay is not None else None
 
         while not self.exit:
+            frame_start = time.perf_counter()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.exit=True
+                elif ticks is None:
+                    self.inputs.handle_event(event)
+
+            if self.client is not None:
+                self.process_network()
 
-            self.process_keys()
+            if ticks is not None:
+                tick = next(ticks, None)
+                if tick is None:
+                    break
+                mask, duration = tick
+                commands = mask_commands(mask)
+            else:
+                commands = self.inputs.tick()
+            if commands:
+                self.process_commands(commands)
+            if self.levels is not None:
+                self.levels.update()
+                self.change_level()
+            self.explore()
 
-            self.screen.fill((255,255,255))
-            self.map.render()
-            self.players.render()
+            # les vues recouvrent tout l'écran
+            self.animation_state += 1
+            if self.grid and self.spectated != self.spectated_players():
+                self.layout()
+            contexts = [
+                viewport.render(self.screen, self.players, self.zoom, self.animation_state)
+                for viewport in self.viewports
+            ]
+            if len(self.viewports) > 1:
+                for viewport in self.viewports:
+                    viewport.render_border()
+            context = contexts[0]
+            if self.minimap:
+                minimap = self.map.overview.render_minimap(self.screen, context, self.players)
+                self.fog.render_thumbnail(self.screen, minimap)
             if self.debug == 1:
                 self.screen.blit(
-                    self.font.render(
-                        f"{int(self.clock.get_fps())} fps, x={round(self.players.player.x, 2)}, y={round(self.players.player.y, 2)}",
-                        True, (255, 255, 255)
+                    self.debug_line.update(
+                        f"{int(self.clock.get_fps())} fps, x={round(self.players.player.x, 2)}, y={round(self.players.player.y, 2)}"
                     ),
                     (0,0)
                 )
             elif self.debug == 2:
                 tile = self.map[self.players.player.x, self.players.player.y]
                 self.screen.blit(
-                    self.font.render(
+                    text_cache.render(
+                        self.font,
                         f"Tile type={tile.type}, data={tile.data}, x={tile.x}, y={tile.y}",
-                        True, (255, 255, 255)
+                        (255, 255, 255)
                     ),
                     (0,0)
                 )
 
             pygame.display.update()
+            if capture is not None:
+                capture.capture(self.screen)
+            if autosave is not None:
+                autosave.tick()
+            if metrics.enabled:
+                # durée de traitement de l'image, sans l'attente de l'horloge
+                FRAME_TIME.observe(time.perf_counter() - frame_start)
+                FRAMES.inc()
+                metrics.maybe_write()
+
+            if ticks is not None:
+                self.clock.tick()
+            else:
+                duration = self.clock.tick(FPS)
+            if recording is not None:
+                recording.append(command_mask(commands), duration)
+            self.time += duration / 1000
+
+        for viewport in self.viewports:
+            viewport.close()
+        self.viewports = []
+        if self.levels is not None:
+            self.levels.close()
+        if self.client is not None:
+            self.client.close()
+
+    def change_level(self) -> None:
+        """Fait changer de niveau les joueurs locaux quand le joueur local
+        arrive sur une entrée (à la fin de son déplacement). Le niveau est
+        normalement déjà en mémoire : seul le monde affiché change."""
+        player = self.players.player
+        number = self.levels.door(player.x, player.y)
+        if number is None:
+            return
+        if self.levels.get(number) is None:
+            # le niveau n'a pas pu être chargé : l'entrée ne mène plus nulle part
+            return
+        arrival = self.levels.arrival(number)
+        map, arrays = self.levels.enter(number)
+        # l'image du niveau quitté est libérée, il est redessiné s'il revient
+        self.map.view.image = None
+        map.set_parent(self)
+        self.map = map
+        for local in (player, self.second_player):
+            if local is not None:
+                local.coords.jump(*arrival)
+        self.fog = FogOverlay(map.exploration.get(self.explorer))
+        if self.second_player is not None:
+            self.second_fog = FogOverlay(map.exploration.get(SECOND_PLAYER_NAME))
+        if self.camera.detached:
+            self.camera.follow(player)
+        self.layout()
+        if self.autosave is not None:
+            self.autosave.set_map(map, number, arrays)
+
+    def spectated_players(self) -> List[int]:
+        """Retourne les joueurs distants à suivre dans la grille du mode
+        spectateur (ceux qui ont le plus petit identifiant, autant qu'il reste
+        de places dans la grille)"""
+        places = MAX_VIEWPORTS - (1 if self.second_player is None else 2)
+        local = (self.players.player_id, SECOND_PLAYER_ID if self.second_player is not None else None)
+        return sorted(player_id for player_id in self.players.players if player_id not in local)[:places]
+
+    def layout(self) -> None:
+        """Découpe l'écran en vues : celle du joueur local (ou de la caméra
+        détachée), celle du deuxième joueur local avec l'écran partagé, et
+        celles des joueurs suivis par la grille du mode spectateur.
+        Toutes les vues partagent les caches de textures et de tuiles ; la
+        première garde l'image du monde de l'écran entier (`Map.view`)."""
+        for viewport in self.viewports:
+            viewport.close()
+        views: List[Tuple[Camera, Optional[FogOverlay]]] = [(self.camera, self.fog)]
+        if self.second_player is not None:
+            views.append((self.second_camera, self.second_fog))
+        self.spectated = self.spectated_players() if self.grid else []
+        for player_id in self.spectated:
+            # le brouillard des autres joueurs n'est pas connu du client
+            camera = Camera()
+            camera.follow(self.players[player_id])
+            views.append((camera, None))
+        rects = split_screen(self.screen.get_rect(), len(views))
+        self.viewports = [
+            Viewport(self.map, camera, rect, fog, self.map.view if index == 0 else None)
+            for index, ((camera, fog), rect) in enumerate(zip(views, rects))
+        ]
+    
+    def join(self):
+        """Attend le monde et l'identifiant du joueur envoyés par le serveur puis
+        initialise le joueur local.
+        """
+        player_id, world, explored = unpack_welcome(self.client.wait(Message.WELCOME))
+        self.map.load_dict(decode_world(world))
+        self.map.exploration.set(self.explorer, explored)
+        self.players.init(player_id)
+    
+    def process_network(self):
+        """Applique les messages reçus du serveur depuis la dernière image
+        (arrivées, départs et déplacements des joueurs proches, tuiles modifiées).
+        """
+        for message, payload in self.client.poll():
+            if message is None:
+                logging.warning("Connection to the server lost")
+                self.exit = True
+            elif message == Message.TICK:
+                self.server_clock.update(unpack_tick(payload))
+            elif message == Message.JOIN:
+                player_id, x, y, name = unpack_join(payload)
+                if player_id != self.players.player_id:
+                    self.players.new(player_id, coords=InterpolatedCoords(
+                        x, y,
+                        self.server_clock.server_time,
+                        self.server_clock.render_time,
+                    ))
+                    self.players[player_id].name = name
+            elif message == Message.LEAVE:
+                self.players.remove(unpack_leave(payload))
+            elif message == Message.POSITION:
+                player_id, x, y = unpack_position(payload)
+                if player_id != self.players.player_id and player_id in self.players.players:
+                    self.players[player_id].coords.push(self.server_clock.server_time, x, y)
+            elif message == Message.ACK:
+                sequence, x, y = unpack_ack(payload)
+                predicted = self.prediction.reconcile(sequence, x, y, self.map.allow_move)
+                coords = self.players.player.coords
+                if predicted != tuple(coords.real_coords()):
+                    logging.debug("Prediction corrected to %s", predicted)
+                    coords.set(*predicted)
+            elif message == Message.TILE:
+                x, y, type, data = unpack_tile(payload)
+                self.map.set_tile(x, y, type, data)
+    
+    def positions(self) -> Dict[str, Tuple[int, int]]:
+        """Retourne la position des joueurs locaux, rangée par leur nom (pour
+        la sauvegarde automatique)"""
+        positions = {}
+        for name, player in ((self.explorer, self.players.player), (SECOND_PLAYER_NAME, self.second_player)):
+            if player is not None:
+                x, y = player.coords.real_coords()
+                positions[name] = (int(x), int(y))
+        return positions
 
-            self.clock.tick(FPS)
+    def explore(self) -> None:
+        """Marque comme explorées les tuiles autour des joueurs locaux et retire
+        le brouillard de celles qui viennent d'être découvertes"""
+        x, y = self.players.player.coords.real_coords()
+        area = self.map.exploration.reveal(self.explorer, x, y)
+        if area is not None:
+            self.fog.reveal(area)
+        if self.second_player is not None:
+            x, y = self.second_player.coords.real_coords()
+            area = self.map.exploration.reveal(SECOND_PLAYER_NAME, x, y)
+            if area is not None:
+                self.second_fog.reveal(area)
     
-    def process_keys(self):
-        global MOVE_INTERVAL
-        """Cette fonction regarde les touches pressées et agit en conséquence
+    def move(self, offset_x: int, offset_y: int):
+        """Déplace le joueur local et prévient le serveur si le déplacement a eu lieu.
+        
+        Attributes
+        ----------
+        offset_x: int
+            Le déplacement sur l'axe x
+        offset_y: int
+            Le déplacement sur l'axe y
+        """
+        player = self.players.player
+        before = player.coords.real_coords()
+        player.move_by(offset_x, offset_y, not self.noclip)
+        if self.client is not None and player.coords.real_coords() != before:
+            sequence = self.prediction.record(offset_x, offset_y)
+            self.client.send(pack_move(sequence, offset_x, offset_y))
+    
+    def process_commands(self, commands: List[Command]):
+        """Cette fonction exécute les commandes de l'image
         (c'est elle qui gère le mouvement, et le menu de débogage)
+        
+        Attributes
+        ----------
+        commands: List[Command]
+            Les commandes à exécuter, dans l'ordre
         """
-        key_input = pygame.key.get_pressed()
-        if key_input[pygame.K_UP]:
-            self.players.player.move_by(0, -1, not self.noclip)
-        if key_input[pygame.K_DOWN]:
-            self.players.player.move_by(0, 1, not self.noclip)
-        if key_input[pygame.K_RIGHT]:
-            self.players.player.move_by(1, 0, not self.noclip)
-        if key_input[pygame.K_LEFT]:
-            self.players.player.move_by(-1, 0, not self.noclip)
-        if not key_input[pygame.K_F3] and self.debug_key_pressed:
-            if self.debug_mode_input==1:
+        for command in commands:
+            if command in MOVES:
+                if self.camera.detached:
+                    self.camera.move_by(*MOVES[command])
+                else:
+                    self.move(*MOVES[command])
+            elif command in SECOND_MOVES:
+                # sans écran partagé (une partie rejouée…), la commande est ignorée
+                if self.second_player is not None:
+                    self.second_player.move_by(*SECOND_MOVES[command], not self.noclip)
+            elif command == Command.TOGGLE_CAMERA:
+                if self.camera.detached:
+                    self.camera.follow(self.players.player)
+                else:
+                    self.camera.detach()
+                logging.info("Spectator camera %s", "enabled" if self.camera.detached else "disabled")
+            elif command == Command.TOGGLE_NOCLIP:
                 self.noclip = not self.noclip
                 logging.info("Noclip %s", "enabled" if self.noclip else "disabled")
-            elif self.debug_mode_input==2:
+            elif command == Command.TOGGLE_SPEED:
                 if players.MOVE_INTERVAL == 0:
                     players.MOVE_INTERVAL = 0.15
                 elif players.MOVE_INTERVAL == 0.15:
                     players.MOVE_INTERVAL = 0
                 logging.info("Speed %s", "enabled" if players.MOVE_INTERVAL==0 else "disabled")
-            else:
+            elif command in (Command.ZOOM_IN, Command.ZOOM_OUT):
+                self.set_zoom(self.zoom + (1 if command == Command.ZOOM_IN else -1))
+            elif command == Command.TOGGLE_MINIMAP:
+                self.minimap = not self.minimap
+            elif command == Command.TOGGLE_GRID:
+                self.grid = not self.grid
+                self.layout()
+                logging.info("Spectator grid %s (%d players followed)", "enabled" if self.grid else "disabled", len(self.spectated))
+            elif command == Command.MEMORY_REPORT:
+                self.memory_report()
+            elif command == Command.TOGGLE_DEBUG:
                 self.debug += 1
                 if self.debug >= 3:
                     self.debug = 0
                 logging.info("Debug %s", "enabled" if self.debug else "disabled")
-            self.debug_key_pressed=False
-        if key_input[pygame.K_F3] and not self.debug_key_pressed:
-            self.debug_key_pressed = True
-            self.debug_mode_input = 0
-        if self.debug_key_pressed:
-            if key_input[pygame.K_n]:
-                self.debug_mode_input = 1
-            elif key_input[pygame.K_s]:
-                self.debug_mode_input = 2
     
-    @property
-    def camera_x(self):
-        """camera_x et camera_y sont utilisées pour le point central de l'écran.
-        Ces propriétés pourront être utilisées plus tard pour décaler l'écran quand on arrive au bord du monde si besoin.
+    def memory_report(self) -> None:
+        """Écrit l'utilisation de la mémoire dans le journal, comparée au
+        rapport précédent. Au premier appel, `tracemalloc` est lancé s'il ne
+        l'est pas encore (avec `--trace-memory`, il l'est dès le démarrage)."""
+        if not tracemalloc.is_tracing():
+            memory.start()
+            logging.info("Memory tracing started, press the key again to compare")
+        snapshot = MemorySnapshot(self.map, self.fog)
+        logging.info("Memory report:\n%s", snapshot.format(self.memory_snapshot))
+        self.memory_snapshot = snapshot
+
+    def set_zoom(self, zoom: int) -> None:
+        """Change l'agrandissement des tuiles (limité entre `MIN_ZOOM` et `MAX_SCALE`)
+        et prépare les textures à ce niveau de zoom. En dessous de `MIN_SCALE`,
+        le monde est affiché en vue d'ensemble, sans textures.
+
+        Attributes
+        ----------
+        zoom: int
+            L'agrandissement des tuiles de 16 pixels
         """
-        if self.players.player is not None:
-            return self.players.player.x
-        else:
-            return 0
+        zoom = max(MIN_ZOOM, min(MAX_SCALE, zoom))
+        if zoom != self.zoom:
+            if zoom >= MIN_SCALE:
+                prescale(zoom)
+            self.zoom = zoom
+            logging.info("Zoom x%d", zoom)
+
+    @property
+    def tile_size(self) -> int:
+        """La taille des tuiles à l'écran en pixels"""
+        return tile_size(self.zoom)
+
+    def frame_context(self) -> FrameContext:
+        """Retourne le contexte de rendu de l'image en cours (position de la
+        caméra, taille de l'écran, zoom et étape d'animation)"""
+        return FrameContext(
+            *self.camera.position(),
+            *self.screen.get_size(),
+            self.zoom,
+            self.animation_state,
+        )
+
+    @property
+    def camera_x(self) -> float:
+        """camera_x et camera_y sont utilisées pour le point central de l'écran
+        (le joueur suivi par la caméra, ou la caméra détachée)."""
+        return self.camera.position()[0]
     
     @property
-    def camera_y(self):
-        """camera_x et camera_y sont utilisées pour le point central de l'écran.
-        Ces propriétés pourront être utilisées plus tard pour décaler l'écran quand on arrive au bord du monde si besoin.
-        """
-        if self.players.player is not None:
-            return self.players.player.y
-        else:
-            return 0
\ No newline at end of file
+    def camera_y(self) -> float:
+        """camera_x et camera_y sont utilisées pour le point central de l'écran
+        (le joueur suivi par la caméra, ou la caméra détachée)."""
+        return self.camera.position()[1]
@@ -0,0 +1,176 @@
+"""Ce fichier traduit les évènements du clavier en commandes pour le jeu.
+Au lieu de lire l'état de tout le clavier à chaque image, les évènements
+`KEYDOWN` et `KEYUP` mettent à jour les touches maintenues et une file de
+commandes, que la simulation récupère une fois par image avec `InputHandler.tick`.
+"""
+from __future__ import annotations
+from typing import Deque, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from collections import deque
+from enum import IntEnum
+import logging
+
+import pygame
+import pygame.key
+
+__all__ = [
+    "Command",
+    "MOVES",
+    "SECOND_MOVES",
+    "DEFAULT_BINDINGS",
+    "InputHandler",
+    "command_mask",
+    "mask_commands",
+]
+
+class Command(IntEnum):
+    """Les commandes du jeu, dans l'ordre où elles sont exécutées dans une image"""
+    MOVE_UP = 0
+    MOVE_DOWN = 1
+    MOVE_RIGHT = 2
+    MOVE_LEFT = 3
+    TOGGLE_DEBUG = 4
+    TOGGLE_NOCLIP = 5
+    TOGGLE_SPEED = 6
+    ZOOM_IN = 7
+    ZOOM_OUT = 8
+    TOGGLE_CAMERA = 9
+    TOGGLE_MINIMAP = 10
+    MEMORY_REPORT = 11
+    SECOND_MOVE_UP = 12
+    SECOND_MOVE_DOWN = 13
+    SECOND_MOVE_RIGHT = 14
+    SECOND_MOVE_LEFT = 15
+    TOGGLE_GRID = 16
+
+# déplacement correspondant à chaque commande de mouvement
+MOVES: Dict[Command, Tuple[int, int]] = {
+    Command.MOVE_UP: (0, -1),
+    Command.MOVE_DOWN: (0, 1),
+    Command.MOVE_RIGHT: (1, 0),
+    Command.MOVE_LEFT: (-1, 0),
+}
+# … et du deuxième joueur local (écran partagé)
+SECOND_MOVES: Dict[Command, Tuple[int, int]] = {
+    Command.SECOND_MOVE_UP: (0, -1),
+    Command.SECOND_MOVE_DOWN: (0, 1),
+    Command.SECOND_MOVE_RIGHT: (1, 0),
+    Command.SECOND_MOVE_LEFT: (-1, 0),
+}
+# commandes répétées à chaque image tant que leur touche est maintenue
+HELD_COMMANDS = frozenset(MOVES) | frozenset(SECOND_MOVES)
+
+# les touches par défaut (noms de touches de pygame).
+# `toggle_noclip` et `toggle_speed` s'utilisent en maintenant la touche de `toggle_debug`.
+DEFAULT_BINDINGS: Dict[str, str] = {
+    "move_up": "up",
+    "move_down": "down",
+    "move_right": "right",
+    "move_left": "left",
+    "toggle_debug": "f3",
+    "toggle_noclip": "n",
+    "toggle_speed": "s",
+    "zoom_in": "page up",
+    "zoom_out": "page down",
+    "toggle_camera": "c",
+    "toggle_minimap": "m",
+    "memory_report": "f9",
+    "second_move_up": "i",
+    "second_move_down": "k",
+    "second_move_right": "l",
+    "second_move_left": "j",
+    "toggle_grid": "g",
+}
+
+# commandes qui ne sont produites qu'en maintenant la touche de `toggle_debug`
+CHORD_COMMANDS = (Command.TOGGLE_NOCLIP, Command.TOGGLE_SPEED)
+
+def command_mask(commands: Iterable[Command]) -> int:
+    """Retourne le masque de bits correspondant aux commandes"""
+    mask = 0
+    for command in commands:
+        mask |= 1 << command
+    return mask
+
+def mask_commands(mask: int) -> List[Command]:
+    """Retourne les commandes d'un masque de bits, dans l'ordre d'exécution"""
+    return [command for command in Command if mask & (1 << command)]
+
+class InputHandler:
+    """Traduit les évènements du clavier en commandes.
+    Les touches de mouvement maintenues produisent une commande à chaque image
+    (la répétition est donc gérée par la simulation et pas par le système), les
+    autres commandes ne sont produites qu'une fois.
+    """
+    keys: Dict[int, Command]
+    held: Set[Command]
+    tapped: Set[Command]
+    queue: Deque[Command]
+
+    def __init__(self, bindings: Optional[Mapping[str, str]] = None) -> None:
+        """Initialise le gestionnaire avec les touches indiquées.
+
+        Attributes
+        ----------
+        bindings: Optional[Mapping[str, str]] = None
+            Le nom de la touche de chaque commande (les commandes absentes
+            utilisent `DEFAULT_BINDINGS`)
+        """
+        names = dict(DEFAULT_BINDINGS)
+        if bindings is not None:
+            names.update(bindings)
+        self.keys = {}
+        for command in Command:
+            name = names[command.name.lower()]
+            try:
+                self.keys[pygame.key.key_code(name)] = command
+            except ValueError:
+                logging.warning("Unknown key %r for %s", name, command.name.lower())
+        self.held = set()
+        self.tapped = set()
+        self.queue = deque()
+        self.chord: Optional[Command] = None # commande lancée au relâchement de la touche de débogage
+
+    def handle_event(self, event: pygame.event.Event) -> None:
+        """Prend en compte un évènement de pygame (les autres évènements que
+        `KEYDOWN` et `KEYUP` sont ignorés)"""
+        if event.type == pygame.KEYDOWN:
+            command = self.keys.get(event.key)
+            if command is None:
+                return
+            if command in HELD_COMMANDS:
+                self.held.add(command)
+                # un appui très court est quand même pris en compte à la prochaine image
+                self.tapped.add(command)
+            elif command == Command.TOGGLE_DEBUG:
+                self.chord = Command.TOGGLE_DEBUG
+            elif command in CHORD_COMMANDS:
+                if self.chord is not None:
+                    self.chord = command
+            else:
+                self.queue.append(command)
+        elif event.type == pygame.KEYUP:
+            command = self.keys.get(event.key)
+            if command is None:
+                return
+            if command in HELD_COMMANDS:
+                self.held.discard(command)
+            elif command == Command.TOGGLE_DEBUG and self.chord is not None:
+                self.queue.append(self.chord)
+                self.chord = None
+
+    def push(self, command: Command) -> None:
+        """Ajoute une commande à exécuter à la prochaine image"""
+        self.queue.append(command)
+
+    def tick(self) -> List[Command]:
+        """Retourne les commandes à exécuter pour cette image, dans l'ordre de
+        `Command`"""
+        if not self.queue and not self.held and not self.tapped:
+            return []
+        commands = set(self.held)
+        commands.update(self.tapped)
+        commands.update(self.queue)
+        self.tapped.clear()
+        self.queue.clear()
+        return sorted(commands)
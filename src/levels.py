@@ -0,0 +1,360 @@
+"""Ce fichier contient les niveaux du monde.
+Le monde d'une partie locale est une suite de labyrinthes de plus en plus
+grands : la sortie d'un niveau (l'entrée au sud-est, près du moulin) mène au
+niveau suivant, et l'entrée au nord-ouest des niveaux suivants ramène au
+niveau précédent.
+
+Seuls le niveau actuel et ses voisins sont gardés en mémoire :
+- dès que les joueurs entrent dans un niveau, ses voisins sont générés (ou
+  relus depuis le disque) par un fil d'exécution séparé, bien avant que les
+  joueurs n'atteignent une sortie ;
+- les niveaux plus éloignés sont écrits sur le disque par le même fil, au
+  format des sauvegardes automatiques, puis oubliés.
+Le changement de niveau ne fait donc qu'échanger le monde affiché.
+
+Un grand niveau compte des centaines de milliers d'objets : le ramasse-miettes
+est suspendu pendant son chargement, pour ne pas les parcourir plusieurs fois
+en gardant le GIL pendant qu'ils sont créés. Il l'est pour tout le processus,
+le jeu compris, mais seulement le temps du chargement (quelques secondes au
+plus pour les plus grands niveaux), et la boucle du jeu ne crée presque pas de
+références circulaires. Un niveau oublié rompt lui-même
+ses références circulaires (`Map.close`) pour être libéré tout de suite, sans
+attendre le ramasse-miettes.
+
+Les niveaux sont écrits dans le dossier des sauvegardes automatiques
+(`--autosave`), ou dans un dossier temporaire supprimé à la fin de la partie.
+"""
+from __future__ import annotations
+from typing import Dict, Optional, Set, Tuple, Union
+
+import gc
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+from .autosave import TileArrays, read_save, write_save
+from .map import Map, types
+from .metrics import LEVELS_RESIDENT, metrics
+
+__all__ = [
+    "MAZE_SIZE",
+    "MAX_MAZE_SIZE",
+    "level_seed",
+    "world_seed",
+    "maze_size",
+    "generate_level",
+    "Level",
+    "Levels",
+]
+
+MAZE_SIZE = 30 # taille du labyrinthe du premier niveau, en cellules
+LEVEL_GROWTH = 10 # cellules ajoutées au labyrinthe à chaque niveau
+MAX_MAZE_SIZE = 100 # taille maximale (sa génération prend déjà quelques secondes)
+SEED_STEP = 0x9E3779B9 # écart entre les graines de deux niveaux successifs
+
+Coords = Tuple[int, int]
+
+def level_seed(seed: int, level: int) -> int:
+    """Retourne la graine du labyrinthe d'un niveau (celle du monde pour le
+    premier niveau)"""
+    return (seed + level * SEED_STEP) % 2**32
+
+def world_seed(seed: int, level: int) -> int:
+    """Retourne la graine du monde d'après celle d'un de ses niveaux (l'inverse
+    de `level_seed`)"""
+    return (seed - level * SEED_STEP) % 2**32
+
+def maze_size(level: int) -> int:
+    """Retourne la taille du labyrinthe d'un niveau, en cellules"""
+    return min(MAZE_SIZE + LEVEL_GROWTH * level, MAX_MAZE_SIZE)
+
+def level_name(level: int) -> str:
+    return f"level_{level:04}.sav"
+
+def exits(map: Map) -> Tuple[Coords, Coords]:
+    """Retourne les tuiles qui mènent au niveau suivant (l'entrée au sud-est)"""
+    return (map.WIDTH-3, map.HEIGHT-2), (map.WIDTH-2, map.HEIGHT-3)
+
+def returns(map: Map) -> Tuple[Coords, Coords]:
+    """Retourne les tuiles qui ramènent au niveau précédent (l'entrée au
+    nord-ouest, absente du premier niveau)"""
+    return (1, 2), (2, 1)
+
+def generate_level(seed: int, level: int) -> Map:
+    """Génère le labyrinthe d'un niveau (sans affichage : utilisable depuis un
+    autre fil d'exécution)
+
+    Attributes
+    ----------
+    seed: int
+        La graine du monde
+    level: int
+        Le numéro du niveau
+    """
+    size = maze_size(level)
+    map = Map(None, size, size, seed=level_seed(seed, level))
+    if level > 0:
+        entrance = types.index("entrance")
+        for x, y in returns(map):
+            map[x, y] = map.get_tile(x, y, entrance, 0, 0)
+        # les murs autour de l'entrée sont reconnectés
+        map.update_all()
+    return map
+
+class Level:
+    """Un niveau gardé en mémoire"""
+    __slots__ = ("number", "map", "arrays")
+
+    def __init__(self, number: int, map: Map, arrays: Optional[TileArrays] = None) -> None:
+        self.number = number
+        self.map = map
+        # l'état de toutes les tuiles, relevé par le fil des niveaux pour la
+        # première sauvegarde automatique du niveau
+        self.arrays = arrays
+
+class Levels:
+    """Les niveaux du monde, chargés et écrits sur le disque dans un fil
+    d'exécution séparé"""
+    levels: Dict[int, Level]
+
+    def __init__(self, map: Map, level: int = 0, directory: Optional[str] = None) -> None:
+        """Prépare les niveaux autour du niveau actuel.
+
+        Attributes
+        ----------
+        map: Map
+            Le monde du niveau actuel
+        level: int = 0
+            Le numéro du niveau actuel (celui d'une sauvegarde reprise)
+        directory: Optional[str] = None
+            Le dossier où les niveaux éloignés sont écrits, gardés d'une partie
+            à l'autre (par défaut un dossier temporaire, supprimé à la fin)
+        """
+        self.seed = world_seed(map.seed, level)
+        self.temporary = directory is None
+        self.directory = directory if directory is not None else tempfile.mkdtemp(prefix="sylvajia-levels-")
+        os.makedirs(self.directory, exist_ok=True)
+        self.current = level
+        self.levels = {level: Level(level, map)}
+        self.loading: Set[int] = set() # niveaux demandés au fil des niveaux
+        self.tasks: queue.Queue[Optional[Tuple[str, Union[int, Level]]]] = queue.Queue()
+        # niveaux chargés, ou numéro d'un niveau dont le chargement a échoué
+        self.loaded: queue.Queue[Union[Level, int]] = queue.Queue()
+        self.failed: Set[int] = set() # niveaux qui n'ont pas pu être chargés
+        self.thread: Optional[threading.Thread] = None
+        self.closing = False
+        self.prepare()
+
+    @property
+    def map(self) -> Map:
+        """Le monde du niveau actuel"""
+        return self.levels[self.current].map
+
+    def door(self, x: float, y: float) -> Optional[int]:
+        """Retourne le niveau où mène la tuile indiquée du niveau actuel, ou
+        `None` si elle ne mène nulle part (ou vers un niveau qui n'a pas pu
+        être chargé)"""
+        coords = (x, y)
+        if coords in exits(self.map):
+            number = self.current + 1
+        elif self.current > 0 and coords in returns(self.map):
+            number = self.current - 1
+        else:
+            return None
+        return None if number in self.failed else number
+
+    def arrival(self, level: int) -> Coords:
+        """Retourne la position des joueurs qui entrent dans un niveau depuis
+        le niveau actuel : le point d'apparition en avançant, la dernière
+        cellule du labyrinthe (devant sa sortie) en revenant"""
+        map = self.levels[level].map
+        if level > self.current:
+            return map.spawn
+        return map.WIDTH-3, map.HEIGHT-3
+
+    def prepare(self) -> None:
+        """Demande le chargement des voisins du niveau actuel qui ne sont pas
+        en mémoire"""
+        for number in (self.current - 1, self.current + 1):
+            if number >= 0 and number not in self.levels and number not in self.loading and number not in self.failed:
+                self.loading.add(number)
+                self.submit("load", number)
+
+    def update(self) -> None:
+        """Garde les niveaux chargés depuis l'appel précédent (appelée à chaque
+        image)"""
+        while True:
+            try:
+                level = self.loaded.get_nowait()
+            except queue.Empty:
+                return
+            self.add(level)
+
+    def add(self, level: Union[Level, int]) -> None:
+        if isinstance(level, int):
+            # l'erreur a été journalisée par le fil des niveaux
+            self.loading.discard(level)
+            self.failed.add(level)
+            return
+        self.loading.discard(level.number)
+        if abs(level.number - self.current) > 1:
+            # les joueurs sont repartis entre-temps : le niveau est écrit et
+            # oublié comme les autres
+            self.submit("evict", level)
+            return
+        self.levels[level.number] = level
+        if metrics.enabled:
+            LEVELS_RESIDENT.set(len(self.levels))
+
+    def get(self, number: int) -> Optional[Level]:
+        """Retourne un niveau, en attendant la fin de son chargement s'il n'est
+        pas encore en mémoire (le niveau est normalement prêt bien avant que
+        les joueurs n'atteignent la sortie), ou `None` si son chargement a
+        échoué"""
+        self.update()
+        if number in self.failed:
+            return None
+        if number not in self.levels:
+            if number not in self.loading:
+                self.loading.add(number)
+                self.submit("load", number)
+            logging.warning("Waiting for level %d to load", number)
+            while number not in self.levels:
+                self.add(self.loaded.get())
+                if number in self.failed:
+                    return None
+        return self.levels[number]
+
+    def enter(self, number: int) -> Tuple[Map, Optional[TileArrays]]:
+        """Fait du niveau indiqué le niveau actuel : ses voisins sont
+        chargés et les niveaux plus éloignés écrits sur le disque.
+
+        Attributes
+        ----------
+        number: int
+            Le numéro du niveau où entrent les joueurs (chargé : `Levels.get`
+            ne retourne pas `None`)
+
+        Returns
+        -------
+        Tuple[Map, Optional[TileArrays]]
+            Le monde du niveau, et l'état de ses tuiles s'il a déjà été relevé
+            par le fil des niveaux (confié à l'appelant, pour `Autosave.set_map`)
+        """
+        level = self.get(number)
+        previous = self.levels[self.current]
+        self.current = number
+        for other in list(self.levels):
+            if abs(other - number) > 1:
+                self.submit("evict", self.levels.pop(other))
+        if previous.number in self.levels:
+            # relevé pour la prochaine sauvegarde automatique du niveau
+            self.submit("index", previous)
+        self.prepare()
+        if metrics.enabled:
+            LEVELS_RESIDENT.set(len(self.levels))
+        logging.info("Entered level %d (%dx%d tiles)", number, level.map.WIDTH, level.map.HEIGHT)
+        arrays, level.arrays = level.arrays, None
+        return level.map, arrays
+
+    def submit(self, action: str, value: Union[int, Level]) -> None:
+        """Confie une tâche au fil des niveaux (lancé à la première tâche)"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="levels", daemon=True)
+            self.thread.start()
+        self.tasks.put((action, value))
+
+    def _run(self) -> None:
+        """Exécute les tâches dans l'ordre : un niveau écrit sur le disque puis
+        redemandé est donc relu une fois complètement écrit"""
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+            action, value = task
+            try:
+                if action == "load":
+                    if not self.closing:
+                        self.loaded.put(self._load(value))
+                elif action == "index":
+                    value.arrays = TileArrays.build(value.map)
+                elif action == "evict":
+                    self._write(value)
+            except Exception:
+                # le fil continue : `Levels.get` attendrait sinon indéfiniment
+                logging.exception("Level task %s failed", action)
+                if action == "load":
+                    self.loaded.put(value)
+
+    def _load(self, number: int) -> Level:
+        """Relit un niveau depuis le disque, ou le génère s'il n'a jamais été
+        écrit ou ne peut pas être relu. Le ramasse-miettes est suspendu pour
+        tout le processus pendant le chargement."""
+        start = time.perf_counter()
+        path = os.path.join(self.directory, level_name(number))
+        map = None
+        gc.disable()
+        try:
+            if os.path.exists(path):
+                try:
+                    saved = read_save(path)
+                except (OSError, ValueError, KeyError) as error:
+                    logging.warning("Regenerating level %d: %s", number, error)
+                else:
+                    map = Map(None, 1, 1, generate_maze=False)
+                    try:
+                        saved.apply(map)
+                    except Exception:
+                        logging.exception("Regenerating level %d", number)
+                        map = None
+            if map is None:
+                map = generate_level(self.seed, number)
+            level = Level(number, map, TileArrays.build(map))
+        finally:
+            gc.enable()
+        logging.debug("Level %d ready in %.2f s", number, time.perf_counter() - start)
+        return level
+
+    def _write(self, level: Level) -> None:
+        """Écrit un niveau sur le disque (il n'est plus utilisé par le jeu)"""
+        map = level.map
+        arrays = level.arrays if level.arrays is not None else TileArrays.build(map)
+        header = {
+            "number": 0,
+            "time": time.time(),
+            "seed": map.seed,
+            "level": level.number,
+            "spawn": list(map.spawn),
+            "background": map.background,
+            "positions": {},
+        }
+        explored = {name: tiles.to_bytes() for name, tiles in map.exploration.explored.items()}
+        path = os.path.join(self.directory, level_name(level.number))
+        try:
+            write_save(path, header, arrays, explored)
+        except OSError as error:
+            logging.warning("Could not write level %d: %s", level.number, error)
+        else:
+            logging.debug("Level %d written to %s", level.number, path)
+        map.close()
+
+    def close(self) -> None:
+        """Termine le fil des niveaux. Les niveaux en mémoire autres que le
+        niveau actuel (sauvegardé par `Autosave`) sont écrits si le dossier
+        est gardé ; le dossier temporaire est supprimé."""
+        # les niveaux pas encore chargés ne le seront plus
+        self.closing = True
+        if not self.temporary:
+            for number in list(self.levels):
+                if number != self.current:
+                    self.submit("evict", self.levels.pop(number))
+        if self.thread is not None:
+            self.tasks.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
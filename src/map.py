@@ -1,18 +1,29 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING, Union
+from typing import Any, Dict, List, Optional, Set, Tuple, TYPE_CHECKING, Union
 
 import json
-from discordsdk.sdk import DiscordTimestamp
+import random
 
 import pygame
 
+from .autosave import TileJournal
+from .bundle import BLOCS_FILE, bundle
+from .fog import Exploration
 from .maze_generator import Maze
-from .discord import Discord
-from .enums import Channels, World, WorldKey, WorldType
-from .payloads import Payload
-from .sprites import Sprite
+from .metrics import BLITS, MAP_UPDATES, TILES_RENDERED, metrics
+from .overview import Overview
+from .sprites import (
+    ANIMATED_TEXTURES,
+    ANIMATION_INTERVALS,
+    IMAGE_SCALE,
+    Sprite,
+    composite_cache,
+    get_image,
+    scaled_cache,
+)
 
 if TYPE_CHECKING:
+    from .camera import FrameContext
     from .game import Pygame
 
 __all__ = [
@@ -23,37 +34,52 @@ __all__ = [
     "Connected",
     "ElaborateConnected",
     "OneWayConnected",
+    "MapView",
     "Map"
 ]
 
-types = [
-    "grass",
-    "sea",
-    "path",
-    "moulin",
-    "gravel_path",
-    "river",
-    "muraille",
-    "border",
-    "bridge",
-    "stone_bridge",
-    "entrance",
-    "lake"
-]
-
-with open("./data/blocs.json") as file:
-    blocs_metadata: List[Dict[str, Any]] = json.load(file)
 
-def get_type(type):
-    if type in [2, 4, 5, 6]:
-        cls = Connected
-    elif type in [7]:
-        cls = ElaborateConnected
-    elif type in [8, 9, 10]:
-        cls = OneWayConnected
-    else:
-        cls = Tile
-    return cls
+# tables de conversion entre la donnée d'une tuile connectée et ses connexions
+# (haut, bas, gauche, droite) : chaque direction est un bit pour `Connected`…
+CONNECTED_UNPACK: List[Tuple[bool, bool, bool, bool]] = [
+    (bool(data & 1), bool(data & 2), bool(data & 4), bool(data & 8)) for data in range(16)
+]
+CONNECTED_PACK: Dict[Tuple[bool, bool, bool, bool], int] = {
+    connections: data for data, connections in enumerate(CONNECTED_UNPACK)
+}
+# … et la donnée affichée selon les voisins connectés : une seule branche est
+# prolongée en ligne droite, et une tuile isolée est connectée partout
+CONNECTED_SHAPE: List[int] = [15, 3, 3, 3, 12, 5, 6, 7, 12, 9, 10, 11, 12, 13, 14, 15]
+# … et un chiffre en base 3 pour `ElaborateConnected` (0 : rien, 1 : bord, 2 : intérieur)
+ELABORATE_UNPACK: List[Tuple[int, int, int, int]] = [
+    (data % 3, data // 3 % 3, data // 9 % 3, data // 27 % 3) for data in range(81)
+]
+ELABORATE_PACK: Dict[Tuple[int, int, int, int], int] = {
+    connections: data for data, connections in enumerate(ELABORATE_UNPACK)
+}
+
+BACKGROUND_COLOR = (255, 255, 255) # couleur derrière les tuiles
+
+blocs_metadata: List[Dict[str, Any]]
+if bundle is not None:
+    blocs_metadata = bundle.blocs
+else:
+    with open(BLOCS_FILE) as file:
+        blocs_metadata = json.load(file)
+
+# tables compilées à partir de `blocs.json` par `compile_blocs`, indexées par le type de tuile.
+# Les ensembles de types sont des masques de bits (le bit `n` correspond au type `n`).
+types: List[str] = [] # nom de chaque type (et de sa texture)
+TILE_CLASSES: List[type] = [] # classe des tuiles
+HITBOX: List[bool] = [] # la tuile bloque-t-elle les joueurs
+CONNECTS: List[int] = [] # types auxquels la tuile se connecte
+INSIDE: List[int] = [] # types considérés comme l'intérieur (`ElaborateConnected`)
+BACK: List[Optional[int]] = [] # type affiché derrière la tuile (`OneWayConnected`)
+LINKS: List[int] = [] # types qui passent sous la tuile (`OneWayConnected`)
+
+def get_type(type: int) -> type:
+    """Retourne la classe des tuiles du type indiqué"""
+    return TILE_CLASSES[type]
 
 class Tile:
     """Classe représentant une tuile du jeu (un "bloc")"""
@@ -62,6 +88,8 @@ class Tile:
     type: int
     data: int
     background: Optional[Tile]
+    layers: Optional[List[Tile]] = None # les tuiles superposées à afficher, voir `Tile.get_layers`
+    animated: bool = False # une des couches est animée (calculé avec `layers`)
 
     # def __new__(cls: Tile, x: int, y: int, type: int, data: int, parent: Map, background: Tile = None) -> Union[Tile, Connected, ElaborateConnected]:
     #     if type in [2, 4, 5] and cls is not Connected:
@@ -95,10 +123,14 @@ class Tile:
         """
         self.x, self.y = x, y
         self.type = type
-        self.hitbox = blocs_metadata[self.type].get('hitbox', False)
+        self.hitbox = HITBOX[self.type]
         self.data = data
         self.parent = parent
         self.background = background
+        # couches calculées par `cached_layers`, initialisées ici pour que
+        # l'ajout du cache n'agrandisse pas le dictionnaire de chaque tuile
+        self.layers = None
+        self.animated = False
 
     @property
     def sprite(self) -> Sprite:
@@ -111,27 +143,59 @@ class Tile:
         """
         return Sprite(types[self.type], self.data)
     
-    def render(self, surface: pygame.Surface):
+    def get_layers(self) -> List[Tile]:
+        """Retourne les tuiles à afficher à cet emplacement, du fond vers le dessus
+        (le fond de la tuile puis la tuile elle-même)."""
+        layers = self.background.get_layers() if self.background is not None else []
+        layers.append(self)
+        return layers
+
+    def invalidate(self) -> None:
+        """Indique que les couches de la tuile ont changé (elles sont
+        recalculées au prochain affichage)"""
+        self.layers = None
+
+    def cached_layers(self) -> List[Tile]:
+        """Retourne les couches de la tuile, calculées une seule fois jusqu'au
+        prochain appel de `Tile.invalidate`"""
+        if self.layers is None:
+            self.layers = self.get_layers()
+            self.animated = any(types[layer.type] in ANIMATED_TEXTURES for layer in self.layers)
+        return self.layers
+
+    def image(self, animation_state: int = 0) -> pygame.Surface:
+        """Retourne l'image de la tuile seule, à la taille d'origine"""
+        return get_image(types[self.type]).image(self.data, animation_state, self.x, self.y)
+
+    def render(self, surface: pygame.Surface, context: FrameContext):
         """Traite le rendu de la tuile sur la surface données.
         La surface est un objet utilisé par pygame sur lequel on peut dessiner.
+        Une tuile à plusieurs couches est aplatie dans `composite_cache` et
+        n'est donc dessinée qu'en une fois.
         
         Attributes
         ----------
         surface: pygame.Surface
             La surface sur laquelle afficher la tuile.
+        context: FrameContext
+            Le contexte de rendu de l'image (caméra, zoom, animation)
         """
-        # on récupère les coordonnées de la tuile sur l'écran en fonction de la position de la caméra.
-        x = (self.x - self.parent.camera_x) * 32 + surface.get_width()//2
-        y = (self.y - self.parent.camera_y) * 32 + surface.get_height()//2
-
-        sprite = self.sprite
-        # on met la tuile au bon emplacement
-        sprite.center_at(x, y)
-
-        #on affiche le fond si besoin puis la tuile actuelle
-        if self.background is not None:
-            self.background.render(surface)
-        sprite.blit(surface, self.parent.animation_state, self.x, self.y)
+        layers = self.cached_layers()
+        zoom = context.zoom
+        if len(layers) == 1:
+            image = self.image(context.animation_state)
+            if zoom != IMAGE_SCALE:
+                image = scaled_cache.get(image, zoom)
+        else:
+            # la clé dépend des données et de l'animation de chaque couche
+            animation_state = context.animation_state
+            image = composite_cache.get(tuple(layer.image(animation_state) for layer in layers), zoom)
+
+        # l'image est centrée sur la position de la tuile à l'écran
+        tile_size = context.tile_size
+        x = self.x * tile_size + context.origin_x - image.get_width()//2
+        y = self.y * tile_size + context.origin_y - image.get_height()//2
+        surface.blit(image, (x, y))
     
     def update(self, recursive: bool = True) -> None:
         """Met à jour les données de la tuile, implémenté par des sous-classes.
@@ -166,7 +230,7 @@ class Tile:
         return state
     
     @classmethod
-    def from_dict(cls, dict: Dict[str, Any], parent: Pygame) -> Tile:
+    def from_dict(cls, dict: Dict[str, Any], parent: Map) -> Tile:
         x, y = dict.get("x", 0), dict.get("y", 0)
         type = dict.get("type", 0)
         data = dict.get("data", 0)
@@ -179,62 +243,55 @@ class Tile:
 
 
 class Connected(Tile):
-    """Représente une tuile utilisant de la connexion avec ses voisins"""
-    top: bool = True
-    bottom: bool = True
-    right: bool = True
-    left: bool = True
+    """Représente une tuile utilisant de la connexion avec ses voisins.
+    La donnée de la tuile est un entier gardé tel quel (c'est elle que lit
+    l'affichage) : les connexions `top`, `bottom`, `left` et `right` en sont
+    déduites.
+    """
+    data: int = 15
+
+    def connections(self) -> Tuple[bool, bool, bool, bool]:
+        """Retourne les connexions (haut, bas, gauche, droite) déduites de la
+        donnée, réduite aux valeurs possibles (elle peut venir du réseau)"""
+        return CONNECTED_UNPACK[self.data % len(CONNECTED_UNPACK)]
+
+    def _set_connection(self, index: int, value: bool) -> None:
+        connections = list(self.connections())
+        connections[index] = bool(value)
+        self.data = CONNECTED_PACK[tuple(connections)]
 
-    def __init__(self, x: int, y: int, type: int, data: int, parent: Map, background: Optional[Tile] = None) -> None:
-        """Initialise la tuile connectée avec un appel à Tile.__init__ et en initialisant les données des voisins
-        Cette fonction prépare la classe pour lui permettre de fonctionner correctement
-        Par rapport à la classe parente, cette classe regarde les tuiles voisines et change ses données en conséquence si
-        besoin est de se connecter aux voisines (comme par exemple un chemin à un autre chemin ou à un pont...)
-        
-        Attributes
-        ----------
-        x: int
-            La coordonnée `x` de la tuile
-        y: int
-            La coordonnée `y` de la tuile
-        type: int
-            Le type de tuile (la version du type lisible est trouvable dans la liste `types`)
-        data: int
-            Les données de la tuile.
-            Typiquement, cette valeur indique si la tuile est connectée ou non.
-        parent: Map
-            Le parent de la tuile
-            Cette valeur est utilisée afin de récupérer certaines informations comme par exemple lors de la mise à jour de la tuile
-            (récupérer les tuiles voisines, etc...)
-        background: Optional[Tile] = None
-            Si la tuile a un fond, ce fond est alors spécifié ici.
-        """
-        super().__init__(x, y, type, data, parent, background)
-        if self.type in [2, 4]:
-            self.connected = [2, 4]
-        elif type == 5:
-            self.connected = [5, 8, 9]
-        elif type == 6:
-            self.connected = [6, 10]
-        else:
-            self.connected = []
+    @property
+    def top(self) -> bool:
+        return self.connections()[0]
+
+    @top.setter
+    def top(self, value: bool) -> None:
+        self._set_connection(0, value)
 
     @property
-    def data(self) -> int:
-        """Retourne les données de la tuile en utilisant les variables de connexion local"""
-        return self.top*(2**0) + self.bottom*(2**1) + self.left*(2**2) + self.right*(2**3)
-
-    @data.setter
-    def data(self, data: int) -> None:
-        """Met à jour les données de la tuile en dépaquetant l'entier passé en paramètre"""
-        self.right = bool(data//(2**3))
-        data = data % (2**3)
-        self.left = bool(data//(2**2))
-        data = data % (2**2)
-        self.bottom = bool(data//(2**1))
-        data = data % (2**1)
-        self.top = bool(data//(2**0))
-    
+    def bottom(self) -> bool:
+        return self.connections()[1]
+
+    @bottom.setter
+    def bottom(self, value: bool) -> None:
+        self._set_connection(1, value)
+
+    @property
+    def left(self) -> bool:
+        return self.connections()[2]
+
+    @left.setter
+    def left(self, value: bool) -> None:
+        self._set_connection(2, value)
+
+    @property
+    def right(self) -> bool:
+        return self.connections()[3]
+
+    @right.setter
+    def right(self, value: bool) -> None:
+        self._set_connection(3, value)
+
     def update(self, recursive: bool = True) -> None:
         """Met à jour les données de la tuile en prenant en compte les connexions aux tuiles voisines
         
@@ -243,80 +300,67 @@ class Connected(Tile):
         recursive: bool = True
             Ne fait rien pour l'instant mais à terme permet de faire une mise à jour en cascade
         """
-        self.top = self.get_data(self.x, self.y-1)
-        self.bottom = self.get_data(self.x, self.y+1)
-        self.left = self.get_data(self.x-1, self.y)
-        self.right = self.get_data(self.x+1, self.y)
-        if sum([self.top, self.bottom, self.left, self.right]) == 1:
-            # Si une seule des branches est liée, on active aussi celle en face pour faire une ligne dans la continuité
-            reverse = {
-                0: "bottom",
-                1: "top",
-                2: "right",
-                3: "left"
-            }
-            setattr(self, reverse[[self.top, self.bottom, self.left, self.right].index(True)], True)
-        elif sum([self.top, self.bottom, self.left, self.right]) == 0:
-            self.data = 15
+        # Si une seule des branches est liée, on active aussi celle en face pour faire une ligne
+        # dans la continuité, et une tuile sans voisin est connectée partout (voir `CONNECTED_SHAPE`)
+        self.data = CONNECTED_SHAPE[
+            self.get_data(self.x, self.y-1)
+            | self.get_data(self.x, self.y+1) << 1
+            | self.get_data(self.x-1, self.y) << 2
+            | self.get_data(self.x+1, self.y) << 3
+        ]
     
     def get_data(self, x: int, y: int) -> bool:
         """Retourne les données de connexion correspondant à la tuile aux coordonnées `x` et `y`"""
-        return self.parent[x, y].type in self.connected
+        return CONNECTS[self.type] >> self.parent[x, y].type & 1
 
 class ElaborateConnected(Tile):
-    """Représente une tuile possédant une connexion élaborée, avec deux types de voisins : le bord et intérieur."""
-    top: int = 1
-    bottom: int = 1
-    left: int = 1
-    right: int = 1
-    connected: List[int]
-    inside: List[int]
+    """Représente une tuile possédant une connexion élaborée, avec deux types de voisins : le bord et intérieur.
+    Comme pour `Connected`, la donnée de la tuile est gardée telle quelle et les
+    connexions en sont déduites.
+    """
+    data: int = 40
+
+    def connections(self) -> Tuple[int, int, int, int]:
+        """Retourne les connexions (haut, bas, gauche, droite) déduites de la
+        donnée, réduite aux valeurs possibles (elle peut venir du réseau)"""
+        return ELABORATE_UNPACK[self.data % len(ELABORATE_UNPACK)]
+
+    def _set_connection(self, index: int, value: int) -> None:
+        connections = list(self.connections())
+        connections[index] = value
+        self.data = ELABORATE_PACK[tuple(connections)]
 
-    def __init__(self, x: int, y: int, type: int, data: int, parent: Map, background: Optional[Tile] = None) -> None:
-        """Initialise la tuile connectée avec un appel à Tile.__init__ et en initialisant les données des voisins
-        
-        Attributes
-        ----------
-        x: int
-            La coordonnée `x` de la tuile
-        y: int
-            La coordonnée `y` de la tuile
-        type: int
-            Le type de tuile (la version du type lisible est trouvable dans la liste `types`)
-        data: int
-            Les données de la tuile.
-            Typiquement, cette valeur indique si la tuile est connectée ou non.
-        parent: Map
-            Le parent de la tuile
-            Cette valeur est utilisée afin de récupérer certaines informations comme par exemple lors de la mise à jour de la tuile
-            (récupérer les tuiles voisines, etc...)
-        background: Optional[Tile] = None
-            Si la tuile a un fond, ce fond est alors spécifié ici.
-        """
-        super().__init__(x, y, type, data, parent, background)
-        if self.type == 7:
-            self.connected = [7]
-            self.inside = [0]
-        else:
-            self.connected = []
-            self.inside = []
-    
     @property
-    def data(self) -> int:
-        """Retourne les données de la tuile en utilisant les variables de connexion local"""
-        data = self.top + self.bottom*(3**1) + self.left*(3**2) + self.right*(3**3)
-        return data
-    
-    @data.setter
-    def data(self, data: int) -> None:
-        """Met à jour les données de la tuile en dépaquetant l'entier passé en paramètre"""
-        self.right = data//(3**3)
-        data = data % (3**3)
-        self.left = data//(3**2)
-        data = data % (3**2)
-        self.bottom = data//(3**1)
-        data = data % (3**1)
-        self.top = data//(3**0)
+    def top(self) -> int:
+        return self.connections()[0]
+
+    @top.setter
+    def top(self, value: int) -> None:
+        self._set_connection(0, value)
+
+    @property
+    def bottom(self) -> int:
+        return self.connections()[1]
+
+    @bottom.setter
+    def bottom(self, value: int) -> None:
+        self._set_connection(1, value)
+
+    @property
+    def left(self) -> int:
+        return self.connections()[2]
+
+    @left.setter
+    def left(self, value: int) -> None:
+        self._set_connection(2, value)
+
+    @property
+    def right(self) -> int:
+        return self.connections()[3]
+
+    @right.setter
+    def right(self, value: int) -> None:
+        self._set_connection(3, value)
     
     def update(self, recursive=True) -> None:
         """Met à jour les données de la tuile en prenant en compte les connexions aux tuiles voisines
@@ -326,17 +370,20 @@ class ElaborateConnected(Tile):
         recursive: bool = True
             Ne fait rien pour l'instant mais à terme permet de faire une mise à jour en cascade
         """
-        self.top = self.get_value(self.x, self.y-1)
-        self.bottom = self.get_value(self.x, self.y+1)
-        self.left = self.get_value(self.x-1, self.y)
-        self.right = self.get_value(self.x+1, self.y)
+        self.data = (
+            self.get_value(self.x, self.y-1)
+            + self.get_value(self.x, self.y+1) * 3
+            + self.get_value(self.x-1, self.y) * 9
+            + self.get_value(self.x+1, self.y) * 27
+        )
     
     def get_value(self, x: int, y: int) -> int:
         """Retourne les données de connexion correspondant à la tuile aux coordonnées `x` et `y`"""
         tile = self.parent[x, y]
-        data = 1 if tile.type in self.connected else 2 if tile.type in self.inside else 0
+        connects, inside = CONNECTS[self.type], INSIDE[self.type]
+        data = 1 if connects >> tile.type & 1 else 2 if inside >> tile.type & 1 else 0
         if data == 0 and tile.background is not None:
-            data = 1 if tile.background.type in self.connected else 2 if tile.background.type in self.inside else 0
+            data = 1 if connects >> tile.background.type & 1 else 2 if inside >> tile.background.type & 1 else 0
         return data
 
 class OneWayConnected(Tile):
@@ -345,38 +392,6 @@ class OneWayConnected(Tile):
     back_tile: Optional[Tile] = None
     linked_tile: Optional[Tile] = None
 
-    def __init__(self, x: int, y: int, type: int, data: int, parent: Map, background: Optional[Tile] = None) -> None:
-        """Initialise la tuile connectée avec un appel à Tile.__init__ et en initialisant les données des voisins
-        
-        Attributes
-        ----------
-        x: int
-            La coordonnée `x` de la tuile
-        y: int
-            La coordonnée `y` de la tuile
-        type: int
-            Le type de tuile (la version du type lisible est trouvable dans la liste `types`)
-        data: int
-            Les données de la tuile.
-            Typiquement, cette valeur indique si la tuile est connectée ou non.
-        parent: Map
-            Le parent de la tuile
-            Cette valeur est utilisée afin de récupérer certaines informations comme par exemple lors de la mise à jour de la tuile
-            (récupérer les tuiles voisines, etc...)
-        background: Optional[Tile] = None
-            Si la tuile a un fond, ce fond est alors spécifié ici.
-        """
-        super().__init__(x, y, type, data, parent, background)
-        if self.type == 8:
-            self.connected = 5
-            self.linked = [2, 4]
-        if self.type == 9:
-            self.connected = 5
-            self.linked = [2, 4]
-        if self.type == 10:
-            self.connected = 6
-            self.linked = [2, 4, 5]
-    
     def update(self, recursive: bool = True) -> None:
         """Met à jour les données de la tuile en prenant en compte les connexions aux tuiles voisines
         
@@ -386,50 +401,111 @@ class OneWayConnected(Tile):
             Ne fait rien pour l'instant mais à terme permet de faire une mise à jour en cascade
         """
         self.data = self.get_data(self.x, self.y+1)
-        self.back_tile = self.parent.get_tile(self.x, self.y, self.connected, 0)
+        links = LINKS[self.type]
+        self.back_tile = self.parent.get_tile(self.x, self.y, BACK[self.type], 0)
         self.back_tile.update(recursive=False)
         if self.data:
-            if self.parent[self.x-1, self.y].type in self.linked:
+            if links >> self.parent[self.x-1, self.y].type & 1:
                 type_linked = self.parent[self.x-1, self.y].type
-            elif self.parent[self.x+1, self.y].type in self.linked:
+            elif links >> self.parent[self.x+1, self.y].type & 1:
                 type_linked = self.parent[self.x+1, self.y].type
             else:
                 type_linked = None
         else:
-            if self.parent[self.x, self.y-1].type in self.linked:
+            if links >> self.parent[self.x, self.y-1].type & 1:
                 type_linked = self.parent[self.x, self.y-1].type
-            elif self.parent[self.x, self.y+1].type in self.linked:
+            elif links >> self.parent[self.x, self.y+1].type & 1:
                 type_linked = self.parent[self.x, self.y+1].type
             else:
                 type_linked = None
         if type_linked is not None:
             self.linked_tile = self.parent.get_tile(self.x, self.y, type_linked)
             self.linked_tile.update()
+        self.invalidate()
     
     def get_data(self, x: int, y: int) -> bool:
         """Retourne les données de connexion correspondant à la tuile aux coordonnées `x` et `y`"""
-        return self.parent[x, y].type == self.connected
+        return self.parent[x, y].type == BACK[self.type]
     
-    def render(self, surface: pygame.Surface):
-        """Traite le rendu de la tuile sur la surface passé en paramètre
-        La surface est un objet utilisé par pygame sur lequel on peut dessiner.
-        
-        Attributes
-        ----------
-        surface: pygame.Surface
-            La surface sur laquelle afficher la tuile.
-        """
-        x = (self.x - self.parent.camera_x) * 32 + surface.get_width()//2
-        y = (self.y - self.parent.camera_y) * 32 + surface.get_height()//2
-        sprite = self.sprite
-        sprite.center_at(x, y)
-        if self.background is not None:
-            self.background.render(surface)
+    def get_layers(self) -> List[Tile]:
+        """Retourne les tuiles à afficher à cet emplacement, du fond vers le dessus
+        (le fond, la tuile liée, la tuile de derrière puis le pont lui-même)."""
+        layers = self.background.get_layers() if self.background is not None else []
         if self.linked_tile is not None:
-            self.linked_tile.render(surface)
+            layers.extend(self.linked_tile.get_layers())
         if self.back_tile is not None:
-            self.back_tile.render(surface)
-        sprite.blit(surface, self.parent.animation_state, self.x, self.y)
+            layers.extend(self.back_tile.get_layers())
+        layers.append(self)
+        return layers
+
+CLASS_NAMES = {
+    "tile": Tile,
+    "connected": Connected,
+    "elaborate_connected": ElaborateConnected,
+    "one_way_connected": OneWayConnected,
+}
+
+def compile_blocs(blocs: List[Dict[str, Any]]) -> None:
+    """Compile les règles des tuiles de `blocs.json` dans les tables du module
+    (`types`, `TILE_CLASSES`, `HITBOX`, `CONNECTS`, `INSIDE`, `BACK` et `LINKS`),
+    partagées par toutes les tuiles.
+
+    Chaque tuile peut indiquer :
+    - `hitbox` : si elle bloque les joueurs
+    - `class` : `tile` (par défaut), `connected`, `elaborate_connected` ou `one_way_connected`
+    - `connects` : les types auxquels elle se connecte
+    - `inside` : les types de l'intérieur, pour `elaborate_connected`
+    - `back` et `linked` : le type affiché derrière elle et ceux qui passent
+      dessous, pour `one_way_connected`
+
+    Raises
+    ------
+    ValueError
+        Si une classe ou un nom de type est inconnu
+    """
+    names = [bloc["name"] for bloc in blocs]
+    def type_of(name: str) -> int:
+        if name not in names:
+            raise ValueError(f"unknown tile type {name!r} in blocs.json")
+        return names.index(name)
+    def mask(type_names: List[str]) -> int:
+        result = 0
+        for name in type_names:
+            result |= 1 << type_of(name)
+        return result
+
+    classes = []
+    for bloc in blocs:
+        class_name = bloc.get("class", "tile")
+        if class_name not in CLASS_NAMES:
+            raise ValueError(f"unknown tile class {class_name!r} for {bloc['name']!r} in blocs.json")
+        classes.append(CLASS_NAMES[class_name])
+    # les listes sont modifiées sur place pour les modules qui les ont importées
+    types[:] = names
+    TILE_CLASSES[:] = classes
+    HITBOX[:] = [bloc.get("hitbox", False) for bloc in blocs]
+    CONNECTS[:] = [mask(bloc.get("connects", [])) for bloc in blocs]
+    INSIDE[:] = [mask(bloc.get("inside", [])) for bloc in blocs]
+    BACK[:] = [type_of(bloc["back"]) if "back" in bloc else None for bloc in blocs]
+    LINKS[:] = [mask(bloc.get("linked", [])) for bloc in blocs]
+
+compile_blocs(blocs_metadata)
+
+class MapView:
+    """L'image du monde d'une vue (l'écran entier ou une partie de l'écran
+    partagé), gardée d'une image à l'autre (voir `Map.render`).
+    Chaque vue a sa propre image et ses propres tuiles à redessiner, mais les
+    textures, les tuiles composées et la vue d'ensemble sont partagées par
+    toutes les vues : une vue de plus ne coûte que les bandes découvertes par
+    sa caméra et la copie de son image.
+    """
+    __slots__ = ("image", "camera", "tile_size", "dirty")
+
+    def __init__(self) -> None:
+        self.image: Optional[pygame.Surface] = None
+        self.camera = (0, 0) # position de la caméra en pixels lors du dernier rendu
+        self.tile_size = 0
+        self.dirty: Set[Tuple[int, int]] = set() # tuiles modifiées depuis le dernier rendu
 
 class Map:
     """Classe contenant toutes les données des tuiles et permettant certaines actions sur le monde"""
@@ -438,14 +514,31 @@ class Map:
     background: int # type de la tuile de remplissage 
     parent: Pygame
 
-    def __init__(self, parent: Pygame, width=30, height=30, generate_maze=True) -> None:
+    def __init__(self, parent: Pygame, width=30, height=30, generate_maze=True, seed: Optional[int] = None) -> None:
         """Initialise le monde (en version actuelle, une génération est effectuée)
         
         Attributes
         ----------
         parent: Any
+        width: int = 30
+        height: int = 30
+            La taille du labyrinthe généré en cellules (la taille du monde en
+            tuiles sans génération)
+        generate_maze: bool = True
+            Génère un labyrinthe, sinon le monde est rempli d'herbe
+        seed: Optional[int] = None
+            La graine utilisée pour générer le labyrinthe (tirée au hasard si elle
+            n'est pas donnée)
         """
         self.parent = parent
+        self.seed = seed if seed is not None else random.randrange(2**32)
+
+        # images du monde gardées d'une image à l'autre (voir `Map.render`)
+        self.views: List[MapView] = []
+        self._view: Optional[MapView] = None # celle de l'écran entier (voir `Map.view`)
+        self.overview = Overview(self, types) # vue d'ensemble (mini-carte et vue dézoomée)
+        self.exploration = Exploration(self) # tuiles explorées par chaque joueur
+        self.journal = TileJournal(self) # tuiles modifiées depuis la dernière sauvegarde automatique
 
         # self.map = [
         #     [
@@ -458,14 +551,14 @@ class Map:
         if generate_maze:
             self.background = 1
 
-            self.MAZE_WIDTH = 30
-            self.MAZE_HEIGHT = 30
+            self.MAZE_WIDTH = width
+            self.MAZE_HEIGHT = height
 
             self.WIDTH = self.MAZE_WIDTH * 2 + 3
             self.HEIGHT = self.MAZE_HEIGHT * 2 + 3
 
-            self.maze = Maze(self.MAZE_WIDTH, self.MAZE_HEIGHT)
-            self.maze.generate()
+            maze = Maze(self.MAZE_WIDTH, self.MAZE_HEIGHT, self.seed)
+            maze.generate()
 
             self.map = [
                 [
@@ -484,7 +577,10 @@ class Map:
                 for x in range(1, self.WIDTH, 2):
                     self[x, y] = self.get_tile(x, y, 6, 0, 0)
                 
-            for row in self.maze.cells:
+            # le labyrinthe n'est pas gardé : ses cellules et lui se
+            # référencent mutuellement, il ne serait libéré que par le
+            # ramasse-miettes
+            for row in maze.cells:
                 for cell in row:
                     x, y = cell.x*2+2, cell.y*2+2
                     if cell.O:
@@ -512,7 +608,7 @@ class Map:
                 fond_moulin,
             )
             self.update_all()
-        elif False:
+        else:
             self.background = 1
             self.WIDTH = width
             self.HEIGHT = height
@@ -521,6 +617,7 @@ class Map:
                     self.get_tile(x, y, 0) for x in range(self.WIDTH)
                 ] for y in range(self.HEIGHT)
             ]
+            self.spawn = (0, 0)
     
     def __getitem__(self, coords:Tuple[Union[int, float], Union[int, float]]) -> Tile:
         """Retourne la tuile au coordonnées indiquées
@@ -539,22 +636,170 @@ class Map:
         """
         x, y = coords
         if x >= 0 and y >= 0 and x < len(self.map[0]) and y < len(self.map):
+            # le journal lit la tuile remplacée (voir `TileWalk`)
+            self.journal.set(x, y, value)
             self.map[y][x] = value
+            for view in self.views:
+                view.dirty.add((x, y))
+            self.overview.set(x, y, value.type)
+        
+    def set_tile(self, x: int, y: int, type: int, data: int = 0) -> Tile:
+        """Remplace la tuile aux coordonnées indiquées et met à jour la tuile et
+        ses voisines (pour les textures connectées)
+        
+        Attributes
+        ----------
+        x: int
+            La coordonnée `x` de la tuile
+        y: int
+            La coordonnée `y` de la tuile
+        type: int
+            Le type de la nouvelle tuile
+        data: int = 0
+            Les données de la nouvelle tuile
+        
+        Returns
+        -------
+        Tile
+            La tuile créée
+        """
+        if metrics.enabled:
+            MAP_UPDATES.inc()
+        tile = self.get_tile(x, y, type, data)
+        self[x, y] = tile
+        for neighbour_x, neighbour_y in ((x, y), (x, y-1), (x, y+1), (x-1, y), (x+1, y)):
+            self[neighbour_x, neighbour_y].update()
+            for view in self.views:
+                view.dirty.add((neighbour_x, neighbour_y))
+        return tile
         
     def update_all(self) -> None:
         """Met à jour toutes les tuiles de la carte"""
         for row in self.map:
             for tile in row:
                 tile.update()
+        for view in self.views:
+            view.image = None
+        self.overview.reset()
+        self.journal.reset()
+
+    @property
+    def view(self) -> MapView:
+        """L'image du monde de l'écran entier, créée au premier rendu : un
+        monde jamais affiché (celui du serveur, d'un niveau en attente ou d'un
+        export) ne garde pas la liste des tuiles modifiées"""
+        if self._view is None:
+            self._view = self.new_view()
+        return self._view
+
+    def new_view(self) -> MapView:
+        """Crée une vue du monde, tenue au courant des tuiles modifiées"""
+        view = MapView()
+        self.views.append(view)
+        return view
+
+    def remove_view(self, view: MapView) -> None:
+        """Retire une vue du monde (son image est libérée)"""
+        if view in self.views:
+            self.views.remove(view)
+        if view is self._view:
+            self._view = None
+        view.image = None
+        view.dirty.clear()
     
-    def render(self) -> None:
+    def render(self, context: FrameContext, surface: Optional[pygame.Surface] = None, view: Optional[MapView] = None) -> None:
         """Traite le rendu du monde
-        Cette fonction affiche sur l'écran de élément parent les tuiles affichables
+        Cette fonction affiche sur l'écran de élément parent (ou sur la surface
+        indiquée) les tuiles affichables.
+        L'image du monde est gardée d'une image à l'autre : quand la caméra se
+        déplace, l'image est décalée et seules les bandes découvertes sont
+        dessinées, ainsi que les tuiles modifiées et les tuiles animées quand
+        leur animation change. Le coût d'un défilement dépend donc de la
+        longueur du bord de l'écran et plus de sa surface.
+
+        Attributes
+        ----------
+        context: FrameContext
+            Le contexte de rendu de l'image (caméra, zoom, animation), à la
+            taille de la surface
+        surface: Optional[pygame.Surface] = None
+            La surface sur laquelle afficher le monde (par défaut l'écran, ou
+            une partie de l'écran pour l'écran partagé)
+        view: Optional[MapView] = None
+            L'image du monde gardée pour cette surface (par défaut celle de
+            l'écran entier, `self.view`)
+        """
+        if surface is None:
+            surface = self.parent.screen
+        if view is None:
+            view = self.view
+        width, height = context.width, context.height
+        offset_x = context.pixel_x - view.camera[0]
+        offset_y = context.pixel_y - view.camera[1]
+
+        image = view.image
+        if image is None or image.get_size() != (width, height):
+            image = view.image = pygame.Surface((width, height), 0, surface)
+            self.draw(image, image.get_rect(), context)
+        elif context.tile_size != view.tile_size or abs(offset_x) >= width or abs(offset_y) >= height:
+            self.draw(image, image.get_rect(), context)
+        else:
+            if offset_x or offset_y:
+                image.scroll(-offset_x, -offset_y)
+                if offset_x > 0:
+                    self.draw(image, pygame.Rect(width - offset_x, 0, offset_x, height), context)
+                elif offset_x < 0:
+                    self.draw(image, pygame.Rect(0, 0, -offset_x, height), context)
+                if offset_y > 0:
+                    self.draw(image, pygame.Rect(0, height - offset_y, width, offset_y), context)
+                elif offset_y < 0:
+                    self.draw(image, pygame.Rect(0, 0, width, -offset_y), context)
+            if any(context.animation_state % interval == 0 for interval in ANIMATION_INTERVALS):
+                self.redraw_animated(image, context)
+            bounds = image.get_rect()
+            for x, y in view.dirty:
+                rect = context.tile_rect(x, y)
+                # les tuiles modifiées hors de cette vue n'y sont pas dessinées
+                if bounds.colliderect(rect):
+                    self.draw(image, rect, context)
+        view.dirty.clear()
+        view.camera = (context.pixel_x, context.pixel_y)
+        view.tile_size = context.tile_size
+        surface.blit(image, (0, 0))
+        if metrics.enabled:
+            BLITS.inc()
+
+    def draw(self, surface: pygame.Surface, rect: pygame.Rect, context: FrameContext) -> None:
+        """Dessine les tuiles d'un rectangle d'une surface (l'image du monde,
+        ou une bande de l'export, voir `export.py`).
+
+        Attributes
+        ----------
+        surface: pygame.Surface
+            La surface sur laquelle dessiner
+        rect: pygame.Rect
+            Le rectangle de la surface à dessiner
+        context: FrameContext
+            Le contexte de rendu qui place les tuiles sur la surface
         """
-        self.animation_state += 1
-        for y in range(int(self.parent.camera_y)-8, int(self.parent.camera_y)+10):
-            for x in range(int(self.parent.camera_x)-11, int(self.parent.camera_x)+12):
-                self[x, y].render(self.parent.screen)
+        surface.set_clip(rect)
+        surface.fill(BACKGROUND_COLOR)
+        columns, rows = context.tiles_in(rect)
+        for y in rows:
+            for x in columns:
+                self[x, y].render(surface, context)
+        surface.set_clip(None)
+        if metrics.enabled:
+            TILES_RENDERED.inc(len(columns) * len(rows))
+
+    def redraw_animated(self, image: pygame.Surface, context: FrameContext) -> None:
+        """Redessine les tuiles animées visibles dans l'image d'une vue"""
+        for y in context.rows:
+            for x in context.columns:
+                tile = self[x, y]
+                tile.cached_layers()
+                if tile.animated:
+                    self.draw(image, context.tile_rect(x, y), context)
             
     def get_tile(
         self,
@@ -623,8 +868,14 @@ class Map:
         """Paramètre l'index de texture général sur la valeur donnée"""
         self.parent.animation_state = value
     
-    def to_dict(self) -> Dict[str, Any]:
-        """Retourne le status actuel de la classe pour le sérialisateur"""
+    def to_dict(self, explored: bool = True) -> Dict[str, Any]:
+        """Retourne le status actuel de la classe pour le sérialisateur
+
+        Attributes
+        ----------
+        explored: bool = True
+            Si les tuiles explorées de chaque joueur sont incluses
+        """
         map = []
         for row in self.map:
             dict_row = []
@@ -635,6 +886,8 @@ class Map:
             "map": map,
             "spawn": self.spawn,
         }
+        if explored:
+            state["explored"] = self.exploration.to_dict()
         return state
     
     def load_dict(self, dict: Dict[str, Any]) -> None:
@@ -647,11 +900,31 @@ class Map:
         for row in map_to_load:
             loading_row = []
             for tile in row:
-                loading_row.append(Tile.from_dict(tile, self.parent))
+                loading_row.append(Tile.from_dict(tile, self))
             map.append(loading_row)
-        self.spawn = dict.get("spawn", (0, 0))
+        self.spawn = tuple(dict.get("spawn", (0, 0)))
         self.map = map
+        self.HEIGHT = len(map)
+        self.WIDTH = len(map[0]) if map else 0
+        self.exploration.load_dict(dict.get("explored", {}))
+        # les tuiles liées (fond des ponts...) ne sont pas sérialisées et sont recalculées
+        self.update_all()
     
+    def close(self) -> None:
+        """Libère le monde quand il n'est plus utilisé (un niveau écrit sur le
+        disque, voir `levels.py`) : les références circulaires entre le monde,
+        ses tuiles et leurs couches sont rompues pour que la mémoire soit
+        rendue tout de suite, sans attendre le ramasse-miettes"""
+        for row in self.map:
+            for tile in row:
+                tile.layers = None
+        self.map = []
+        self.views = []
+        self._view = None
+        self.overview = None
+        self.exploration = None
+        self.journal = None
+
     def set_parent(self, parent):
         """Paramètre le parent de la classe et des enfants (les tuiles) pour
         correspondre aux informations données"""
@@ -100,7 +100,7 @@ class Maze:
     cells: List[List[Cell]]
     zones: List[List[Cell]]
 
-    def __init__(self, width: int, height: int) -> None:
+    def __init__(self, width: int, height: int, seed: Optional[int] = None) -> None:
         """Prépare le labyrinthe pour pouvoir être généré avec `Maze.generate`
         
         Attributes
@@ -109,9 +109,13 @@ class Maze:
             La largeur du labyrinthe.
         height: int
             La hauteur du labyrinthe.
+        seed: Optional[int] = None
+            La graine du générateur aléatoire : une même graine donne toujours
+            le même labyrinthe.
         """
         self.width = width
         self.height = height
+        self.random = random.Random(seed)
         self.cells = [
             [Cell(x, y, self) for x in range(self.width)]
             for y in range(self.height)
@@ -128,9 +132,9 @@ class Maze:
         (hauteur et largeur)
         """
         while len(self.zones) > 1:
-            x, y = (random.randint(0, self.width-1), random.randint(0, self.height-1))
+            x, y = (self.random.randint(0, self.width-1), self.random.randint(0, self.height-1))
             cell = self.cells[y][x]
-            side = random.randint(1, 4)
+            side = self.random.randint(1, 4)
             neighbour = cell.get_side(side)
             if neighbour is not None and cell.get_wall(side) and neighbour not in cell.zone:
                 self.fusionner(cell, neighbour)
@@ -0,0 +1,264 @@
+"""Ce fichier contient le rapport d'utilisation de la mémoire du jeu.
+La mémoire des objets Python (tuiles, cellules du labyrinthe, joueurs…) est
+mesurée avec `tracemalloc` et attribuée à une partie du jeu selon le fichier
+qui l'a allouée. Les pixels des surfaces pygame ne sont pas alloués par
+Python et ne sont pas vus par `tracemalloc` : leur taille est donc ajoutée à
+partir des caches qui les gardent.
+
+Deux rapports successifs peuvent être comparés pour trouver ce qui grandit
+pendant une longue partie (une fuite de mémoire).
+
+Pendant le jeu, la touche `memory_report` (F9) écrit un rapport dans le
+journal, comparé au rapport précédent. Sans affichage :
+    python -m src.memory [--seed 1234 | --world monde.json] [--replay partie.rec]
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+import os
+if __name__ == "__main__":
+    # le rapport n'ouvre pas de fenêtre
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "hide"
+
+import argparse
+import tracemalloc
+
+import pygame
+
+from . import sprites
+from .text import text_cache
+
+if TYPE_CHECKING:
+    from .fog import FogOverlay
+    from .map import Map
+
+__all__ = [
+    "TRACE_FRAMES",
+    "SUBSYSTEMS",
+    "start",
+    "surface_bytes",
+    "MemorySnapshot",
+]
+
+TRACE_FRAMES = 16 # nombre d'appels gardés pour chaque allocation
+TOP_LINES = 10 # nombre de lignes du code affichées dans les comparaisons
+
+# partie du jeu de chaque fichier de `src`, les allocations des autres fichiers
+# (pygame, bibliothèque standard) sont attribuées au fichier de `src` qui les a demandées
+SUBSYSTEMS: Dict[str, str] = {
+    "map.py": "map",
+    "bundle.py": "map",
+    "maze_generator.py": "maze",
+    "sprites.py": "sprites",
+    "text.py": "sprites",
+    "players.py": "players",
+    "spatial.py": "players",
+    "fog.py": "fog",
+    "overview.py": "overview",
+}
+OTHER = "other"
+CODE = "code" # modules importés (code compilé, constantes)
+
+SOURCE_DIRECTORY, REPORT_FILE = os.path.split(os.path.abspath(__file__))
+
+def start(frames: int = TRACE_FRAMES) -> None:
+    """Lance `tracemalloc` s'il ne l'est pas déjà (seule la mémoire allouée
+    après le lancement est mesurée)"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+def surface_bytes(surface: pygame.Surface) -> int:
+    """Retourne la taille des pixels d'une surface, octets d'alignement compris"""
+    return surface.get_pitch() * surface.get_height()
+
+def source_file(traceback: tracemalloc.Traceback) -> Optional[str]:
+    """Retourne le fichier de `src` responsable d'une allocation : celui du
+    dernier appel fait depuis `src`"""
+    for frame in reversed(traceback):
+        directory, name = os.path.split(frame.filename)
+        if directory == SOURCE_DIRECTORY:
+            return name
+    return None
+
+def format_size(size: int, sign: bool = False) -> str:
+    """Retourne une taille en octets lisible (`12.3 MiB`)"""
+    prefix = "+" if sign and size > 0 else ""
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{prefix}{size:.0f} {unit}" if unit == "B" else f"{prefix}{size:.1f} {unit}"
+        size /= 1024
+    return f"{prefix}{size:.1f} GiB"
+
+class MemorySnapshot:
+    """L'état de la mémoire du jeu à un instant.
+    Seuls les totaux par partie du jeu et par ligne du code sont gardés, pas
+    l'instantané de `tracemalloc` lui-même (qui prendrait autant de mémoire
+    que ce qu'il mesure).
+    """
+    traced: bool
+    python: Dict[str, int]
+    lines: Dict[Tuple[str, int], int]
+    surfaces: Dict[str, Tuple[int, int]]
+
+    def __init__(self, map: Optional[Map] = None, fog: Optional[FogOverlay] = None) -> None:
+        """Mesure la mémoire actuelle.
+
+        Attributes
+        ----------
+        map: Optional[Map] = None
+            Le monde, dont les images gardées sont comptées
+        fog: Optional[FogOverlay] = None
+            Le brouillard du joueur local, dont les images gardées sont comptées
+        """
+        self.traced = tracemalloc.is_tracing()
+        self.python = {}
+        self.lines = {}
+        if self.traced:
+            # les allocations sont regroupées une seule fois par pile d'appels,
+            # bien plus rapide que `Snapshot.filter_traces` sur chaque allocation
+            for statistic in tracemalloc.take_snapshot().statistics("traceback"):
+                traceback = statistic.traceback
+                file = source_file(traceback)
+                if file == REPORT_FILE:
+                    # la mémoire des rapports eux-mêmes
+                    continue
+                if traceback[-1].filename.startswith("<frozen importlib"):
+                    name = CODE
+                else:
+                    name = SUBSYSTEMS.get(file, OTHER)
+                self.python[name] = self.python.get(name, 0) + statistic.size
+                line = (traceback[-1].filename, traceback[-1].lineno)
+                self.lines[line] = self.lines.get(line, 0) + statistic.size
+        self.surfaces = self.measure_surfaces(map, fog)
+
+    @staticmethod
+    def measure_surfaces(map: Optional[Map], fog: Optional[FogOverlay]) -> Dict[str, Tuple[int, int]]:
+        """Retourne le nombre de surfaces et la taille de leurs pixels pour
+        chaque cache. Une surface gardée par plusieurs caches (une texture
+        affichée sans agrandissement…) n'est comptée qu'une fois."""
+        groups: List[Tuple[str, Iterable[Optional[pygame.Surface]]]] = [
+            ("textures", sprites.surface_cache.values()),
+            ("scaled textures", list(sprites.scaled_cache.surfaces.values()) + list(sprites.scaled_cache.sources.values())),
+            ("composite tiles", sprites.composite_cache.surfaces.values()),
+            ("text", text_cache.surfaces.values()),
+        ]
+        if map is not None:
+            # les surfaces de la vue d'ensemble et du brouillard utilisent la
+            # mémoire d'un tableau Python, déjà mesurée par `tracemalloc`
+            groups.append(("map views", [view.image for view in map.views]))
+            groups.append(("overview", (map.overview.thumbnail,)))
+        if fog is not None:
+            groups.append(("fog", (fog.scaled, fog.thumbnail)))
+        seen = set()
+        surfaces = {}
+        for name, group in groups:
+            count = size = 0
+            for surface in group:
+                if surface is None or id(surface) in seen:
+                    continue
+                seen.add(id(surface))
+                count += 1
+                size += surface_bytes(surface)
+            surfaces[name] = (count, size)
+        return surfaces
+
+    @property
+    def python_total(self) -> int:
+        return sum(self.python.values())
+
+    @property
+    def surfaces_total(self) -> int:
+        return sum(size for _, size in self.surfaces.values())
+
+    def format(self, previous: Optional[MemorySnapshot] = None, top: int = TOP_LINES) -> str:
+        """Retourne le rapport, comparé à un rapport précédent s'il est donné.
+
+        Attributes
+        ----------
+        previous: Optional[MemorySnapshot] = None
+            Le rapport précédent (les différences sont ajoutées à chaque ligne)
+        top: int = TOP_LINES
+            Le nombre de lignes du code qui ont le plus alloué (ou dont les
+            allocations ont le plus grandi depuis `previous`) à afficher
+
+        Returns
+        -------
+        str
+            Le rapport, sur plusieurs lignes
+        """
+        def difference(size: int, before: Optional[int]) -> str:
+            if before is None:
+                return ""
+            return f" ({format_size(size - before, sign=True)})"
+
+        lines = []
+        if not self.traced:
+            lines.append("Python objects: not traced (start with --trace-memory, or press the key again)")
+        else:
+            total_before = previous.python_total if previous is not None and previous.traced else None
+            lines.append(f"Python objects: {format_size(self.python_total)}{difference(self.python_total, total_before)}")
+            for name in sorted(self.python, key=self.python.get, reverse=True):
+                before = None
+                if total_before is not None:
+                    before = previous.python.get(name, 0)
+                lines.append(f"  {name:<16}{format_size(self.python[name]):>12}{difference(self.python[name], before)}")
+        total_before = previous.surfaces_total if previous is not None else None
+        lines.append(f"Surface pixels: {format_size(self.surfaces_total)}{difference(self.surfaces_total, total_before)}")
+        for name, (count, size) in self.surfaces.items():
+            before = None
+            if previous is not None:
+                before = previous.surfaces.get(name, (0, 0))[1]
+            lines.append(f"  {name:<16}{format_size(size):>12}{difference(size, before)}, {count} surfaces")
+        if self.traced and top > 0:
+            if previous is not None and previous.traced:
+                lines.append("Largest growth since the previous report:")
+                changes = {
+                    line: self.lines.get(line, 0) - previous.lines.get(line, 0)
+                    for line in self.lines.keys() | previous.lines.keys()
+                }
+                sign = True
+            else:
+                lines.append("Largest allocations:")
+                changes = self.lines
+                sign = False
+            for (filename, lineno), size in sorted(changes.items(), key=lambda item: abs(item[1]), reverse=True)[:top]:
+                if size:
+                    lines.append(f"  {format_size(size, sign):>12} {os.path.relpath(filename)}:{lineno}")
+        return "\n".join(lines)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Affiche l'utilisation de la mémoire du jeu")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--seed", type=int, help="la graine du monde généré")
+    source.add_argument("--world", metavar="FILE", help="un monde sérialisé (JSON de `Map.to_dict`)")
+    source.add_argument("--replay", metavar="FILE",
+                        help="rejoue une partie enregistrée et compare la mémoire avant et après")
+    parser.add_argument("--top", type=int, default=TOP_LINES, help="le nombre de lignes du code affichées")
+    args = parser.parse_args()
+
+    # tout ce qui est chargé à partir d'ici est mesuré
+    start()
+    from .game import Pygame
+    recording = None
+    if args.replay is not None:
+        from .replay import Recording
+        recording = Recording.load(args.replay)
+        game = Pygame(seed=recording.seed)
+    else:
+        game = Pygame(seed=args.seed)
+        if args.world is not None:
+            from .export import load_world
+            game.map = load_world(args.world)
+            game.map.parent = game
+    before = MemorySnapshot(game.map)
+    print("After loading:")
+    print(before.format(top=args.top))
+    if recording is not None:
+        game.loop(replay=recording)
+        after = MemorySnapshot(game.map, game.fog)
+        print(f"\nAfter {len(recording)} frames:")
+        print(after.format(before, args.top))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""Ce fichier contient les mesures du jeu pendant son exécution (métriques).
+Les compteurs, jauges et histogrammes sont déclarés ici, une seule fois, et
+mis à jour par le jeu, le monde, les textures, les joueurs et le serveur.
+Ils sont écrits régulièrement dans un fichier, au format texte de Prometheus
+(fichier `.prom`, remplacé à chaque écriture) ou en lignes JSON (fichier
+`.jsonl`, une ligne ajoutée à chaque écriture).
+
+Les mesures sont désactivées par défaut : chaque mise à jour est précédée
+d'un test de `metrics.enabled`, et ne coûte donc presque rien quand elles ne
+sont pas écrites.
+
+À activer avec :
+    python main.py --metrics metrics.prom
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Sequence, Union
+
+import bisect
+import json
+import math
+import os
+import time
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "Registry",
+    "MetricsWriter",
+    "metrics",
+]
+
+# limites des histogrammes de durées, en secondes
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.25, 1.0)
+WRITE_INTERVAL = 10.0 # secondes entre deux écritures du fichier
+
+class Counter:
+    """Une valeur qui ne fait qu'augmenter (un nombre d'évènements)"""
+    __slots__ = ("name", "help", "value")
+    kind = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount: Union[int, float] = 1) -> None:
+        self.value += amount
+
+    def lines(self) -> List[str]:
+        return [f"{self.name} {self.value}"]
+
+    def to_json(self) -> Union[int, float]:
+        return self.value
+
+class Gauge:
+    """Une valeur qui peut monter et descendre (un nombre de joueurs…)"""
+    __slots__ = ("name", "help", "value")
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def set(self, value: Union[int, float]) -> None:
+        self.value = value
+
+    def lines(self) -> List[str]:
+        return [f"{self.name} {self.value}"]
+
+    def to_json(self) -> Union[int, float]:
+        return self.value
+
+class Histogram:
+    """La répartition d'une valeur (la durée des images…) dans des intervalles
+    fixés à l'avance, avec leur somme et leur nombre"""
+    __slots__ = ("name", "help", "buckets", "counts", "sum", "count")
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DURATION_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # le dernier intervalle est +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Retourne une estimation du quantile `q` (la limite de l'intervalle
+        qui le contient)"""
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        total = 0
+        for limit, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            if total >= target:
+                return limit
+        return math.inf
+
+    def lines(self) -> List[str]:
+        lines = []
+        total = 0
+        for limit, count in zip(self.buckets, self.counts):
+            total += count
+            lines.append(f'{self.name}_bucket{{le="{limit}"}} {total}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+Metric = Union[Counter, Gauge, Histogram]
+
+class Registry:
+    """L'ensemble des mesures du jeu"""
+    metrics: Dict[str, Metric]
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.metrics = {}
+        self.writers: List[MetricsWriter] = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.register(Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self.register(Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DURATION_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, buckets))
+
+    def register(self, metric: Metric) -> Metric:
+        """Ajoute une mesure
+
+        Raises
+        ------
+        ValueError
+            Si une mesure porte déjà ce nom
+        """
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def to_prometheus(self) -> str:
+        """Retourne toutes les mesures au format texte de Prometheus"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.lines())
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> Dict[str, Any]:
+        """Retourne toutes les mesures pour une ligne JSON"""
+        return {name: metric.to_json() for name, metric in self.metrics.items()}
+
+    def maybe_write(self) -> None:
+        """Écrit les mesures dans les fichiers dont la dernière écriture est
+        assez ancienne (appelée à chaque image du jeu et à chaque tick du serveur)"""
+        now = time.monotonic()
+        for writer in self.writers:
+            if now - writer.last_write >= writer.interval:
+                writer.last_write = now
+                writer.write()
+
+metrics = Registry()
+
+# mesures du jeu
+FRAME_TIME = metrics.histogram("sylvajia_frame_seconds", "Durée de traitement d'une image")
+FRAMES = metrics.counter("sylvajia_frames_total", "Nombre d'images affichées")
+TILES_RENDERED = metrics.counter("sylvajia_tiles_rendered_total", "Nombre de tuiles dessinées")
+BLITS = metrics.counter("sylvajia_blits_total", "Nombre de copies d'images à l'écran (les tuiles sont comptées par sylvajia_tiles_rendered_total)")
+MAP_UPDATES = metrics.counter("sylvajia_map_updates_total", "Nombre de tuiles modifiées")
+IMAGE_HITS = metrics.counter("sylvajia_sprite_cache_hits_total", "Textures trouvées dans le cache")
+IMAGE_MISSES = metrics.counter("sylvajia_sprite_cache_misses_total", "Textures absentes du cache")
+TEXTURE_LOADS = metrics.counter("sylvajia_texture_loads_total", "Nombre d'images décodées")
+PLAYERS = metrics.gauge("sylvajia_players", "Nombre de joueurs connus")
+LEVELS_RESIDENT = metrics.gauge("sylvajia_levels_resident", "Nombre de niveaux du monde gardés en mémoire")
+# mesures du serveur
+TICK_TIME = metrics.histogram("sylvajia_tick_seconds", "Durée d'un tick du serveur")
+
+class MetricsWriter:
+    """L'écriture régulière des mesures dans un fichier"""
+
+    def __init__(self, path: str, interval: float = WRITE_INTERVAL, registry: Registry = metrics) -> None:
+        """Active les mesures et prépare l'écriture.
+
+        Attributes
+        ----------
+        path: str
+            Le fichier à écrire : en lignes JSON s'il finit par `.jsonl`, au
+            format texte de Prometheus sinon
+        interval: float = WRITE_INTERVAL
+            Le nombre de secondes entre deux écritures
+        registry: Registry = metrics
+            Les mesures à écrire
+        """
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self.json = path.endswith(".jsonl")
+        self.last_write = time.monotonic()
+        registry.writers.append(self)
+        registry.enabled = True
+
+    def write(self) -> None:
+        """Écrit les mesures actuelles"""
+        if self.json:
+            line = json.dumps({"time": time.time(), **self.registry.to_json()}, separators=(",", ":"))
+            with open(self.path, "a", encoding="utf-8") as file:
+                file.write(line + "\n")
+        else:
+            # le fichier est remplacé d'un coup pour ne jamais être lu à moitié écrit
+            temporary = self.path + ".tmp"
+            # le format texte de Prometheus est en UTF-8 (les descriptions sont en français)
+            with open(temporary, "w", encoding="utf-8") as file:
+                file.write(self.registry.to_prometheus())
+            os.replace(temporary, self.path)
+
+    def close(self) -> None:
+        """Écrit les dernières mesures (les mesures sont désactivées s'il n'y
+        a plus de fichier à écrire)"""
+        self.write()
+        self.registry.writers.remove(self)
+        self.registry.enabled = bool(self.registry.writers)
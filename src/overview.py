@@ -0,0 +1,222 @@
+"""Ce fichier contient la vue d'ensemble du monde (mini-carte et vue dézoomée).
+Au lieu d'afficher les textures des tuiles, chaque tuile est représentée par un
+seul pixel de la couleur moyenne de sa texture. L'image est construite
+directement à partir du type des tuiles : un tableau d'un octet par tuile,
+utilisé sans copie comme les pixels d'une surface pygame à palette. Modifier
+une tuile revient donc à écrire un octet, et le coût de l'affichage ne dépend
+que de la taille de l'écran, pas de celle du monde.
+"""
+from __future__ import annotations
+from typing import List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+import pygame
+import pygame.draw
+import pygame.image
+import pygame.transform
+
+from .sprites import get_image
+
+if TYPE_CHECKING:
+    from .camera import FrameContext
+    from .map import Map
+    from .players import Players
+
+__all__ = [
+    "OVERVIEW_TILE_SIZES",
+    "MINIMAP_SIZE",
+    "average_color",
+    "Overview",
+]
+
+# taille des tuiles en pixels pour chaque niveau de zoom de la vue d'ensemble,
+# en dessous de `MIN_SCALE` (zoom 0, puis -1, puis -2)
+OVERVIEW_TILE_SIZES = (4, 2, 1)
+MINIMAP_SIZE = 128 # taille maximale de la mini-carte en pixels
+MINIMAP_MARGIN = 8
+EMPTY_COLOR = (255, 255, 255) # couleur des textures entièrement transparentes
+PLAYER_COLOR = (255, 0, 0)
+LOCAL_PLAYER_COLOR = (255, 255, 0)
+
+def average_color(surface: pygame.Surface) -> Tuple[int, int, int]:
+    """Retourne la couleur moyenne des pixels visibles d'une surface (pondérée
+    par leur opacité, pour que le fond transparent des textures ne les
+    assombrisse pas)"""
+    pixels = pygame.image.tobytes(surface, "RGBA")
+    red = green = blue = total = 0
+    for index in range(0, len(pixels), 4):
+        alpha = pixels[index + 3]
+        red += pixels[index] * alpha
+        green += pixels[index + 1] * alpha
+        blue += pixels[index + 2] * alpha
+        total += alpha
+    if total == 0:
+        return EMPTY_COLOR
+    return (red // total, green // total, blue // total)
+
+class Overview:
+    """La vue d'ensemble d'un monde.
+    La grille des types n'est construite qu'à la première utilisation, puis
+    tenue à jour par `Map.__setitem__`. Les types sont les index de la palette
+    de la surface : il ne peut donc pas y en avoir plus de 256.
+    """
+    grid: Optional[bytearray]
+    surface: Optional[pygame.Surface]
+
+    def __init__(self, map: Map, names: Sequence[str]) -> None:
+        """Initialise la vue d'ensemble.
+
+        Attributes
+        ----------
+        map: Map
+            Le monde représenté
+        names: Sequence[str]
+            Le nom de la texture de chaque type de tuile
+        """
+        self.map = map
+        self.names = names
+        self.palette: Optional[List[Tuple[int, int, int]]] = None
+        self.grid = None
+        self.surface = None
+        self.thumbnail: Optional[pygame.Surface] = None # mini-carte mise à l'échelle
+
+    def reset(self) -> None:
+        """Oublie la grille (quand tout le monde est remplacé), elle sera
+        reconstruite à la prochaine utilisation"""
+        self.grid = None
+        self.surface = None
+        self.thumbnail = None
+
+    def build(self) -> pygame.Surface:
+        """Construit la grille des types et la surface qui l'utilise"""
+        if self.palette is None:
+            self.palette = [average_color(get_image(name).default) for name in self.names]
+        width, height = self.map.WIDTH, self.map.HEIGHT
+        self.grid = bytearray(tile.type for row in self.map.map for tile in row)
+        # la surface partage la mémoire de la grille : une tuile modifiée dans
+        # la grille l'est aussi dans la surface
+        self.surface = pygame.image.frombuffer(self.grid, (width, height), "P")
+        self.surface.set_palette(self.palette + [EMPTY_COLOR] * (256 - len(self.palette)))
+        self.thumbnail = None
+        return self.surface
+
+    def set(self, x: int, y: int, type: int) -> None:
+        """Met à jour le type d'une tuile (sans effet si la grille n'est pas
+        encore construite)"""
+        if self.grid is not None:
+            self.grid[y * self.map.WIDTH + x] = type
+            self.thumbnail = None
+
+    def get_surface(self) -> pygame.Surface:
+        """Retourne la surface de la vue d'ensemble, un pixel par tuile"""
+        if self.surface is None:
+            return self.build()
+        return self.surface
+
+    def color(self, type: int) -> Tuple[int, int, int]:
+        """Retourne la couleur d'un type de tuile"""
+        self.get_surface()
+        return self.palette[type]
+
+    def render(self, surface: pygame.Surface, context: FrameContext, players: Players) -> None:
+        """Affiche la partie visible du monde en vue d'ensemble (remplace
+        `Map.render` en dessous de `MIN_SCALE`).
+        Seules les tuiles visibles sont agrandies, quelle que soit la taille
+        du monde.
+
+        Attributes
+        ----------
+        surface: pygame.Surface
+            La surface sur laquelle afficher le monde (l'écran)
+        context: FrameContext
+            Le contexte de rendu de l'image (caméra, taille des tuiles)
+        players: Players
+            Les joueurs, affichés par un point
+        """
+        overview = self.get_surface()
+        tile_size = context.tile_size
+        surface.fill(self.color(self.map.background))
+        area = pygame.Rect(
+            context.columns.start,
+            context.rows.start,
+            len(context.columns),
+            len(context.rows),
+        ).clip(overview.get_rect())
+        if area.width > 0 and area.height > 0:
+            visible = overview.subsurface(area)
+            if tile_size != 1:
+                visible = pygame.transform.scale(visible, (area.width * tile_size, area.height * tile_size))
+            surface.blit(visible, context.tile_rect(area.x, area.y))
+        columns, rows = context.columns, context.rows
+        radius = max(1, tile_size // 2)
+        # les joueurs ne sont pas dessinés par `Players.render` : leur
+        # animation est avancée ici, avant de placer leur point
+        if players.player is not None:
+            players.player.update_animation()
+        for player in players.in_area(columns.start, rows.start, columns.stop - 1, rows.stop - 1):
+            if player is not players.player:
+                player.update_animation()
+            pygame.draw.circle(
+                surface,
+                LOCAL_PLAYER_COLOR if player is players.player else PLAYER_COLOR,
+                (
+                    round(player.x * tile_size) + context.origin_x,
+                    round(player.y * tile_size) + context.origin_y,
+                ),
+                radius,
+            )
+
+    def get_thumbnail(self) -> pygame.Surface:
+        """Retourne la mini-carte (le monde entier réduit ou agrandi pour tenir
+        dans `MINIMAP_SIZE`), recalculée seulement si une tuile a changé"""
+        if self.thumbnail is None:
+            overview = self.get_surface()
+            width, height = overview.get_size()
+            scale = MINIMAP_SIZE / max(width, height, 1)
+            size = (max(1, int(width * scale)), max(1, int(height * scale)))
+            self.thumbnail = pygame.transform.scale(overview, size)
+        return self.thumbnail
+
+    def render_minimap(self, surface: pygame.Surface, context: FrameContext, players: Players) -> pygame.Rect:
+        """Affiche la mini-carte dans le coin de l'écran, avec la zone visible
+        et la position des joueurs.
+
+        Attributes
+        ----------
+        surface: pygame.Surface
+            La surface sur laquelle afficher la mini-carte (l'écran)
+        context: FrameContext
+            Le contexte de rendu de l'image (zone visible)
+        players: Players
+            Les joueurs, affichés par un point
+
+        Returns
+        -------
+        pygame.Rect
+            Le rectangle occupé par la mini-carte à l'écran
+        """
+        thumbnail = self.get_thumbnail()
+        width, height = thumbnail.get_size()
+        x = surface.get_width() - width - MINIMAP_MARGIN
+        y = MINIMAP_MARGIN
+        scale_x = width / max(self.map.WIDTH, 1)
+        scale_y = height / max(self.map.HEIGHT, 1)
+        surface.blit(thumbnail, (x, y))
+        pygame.draw.rect(surface, (0, 0, 0), (x - 1, y - 1, width + 2, height + 2), 1)
+        view = pygame.Rect(
+            x + int(context.columns.start * scale_x),
+            y + int(context.rows.start * scale_y),
+            max(1, int(len(context.columns) * scale_x)),
+            max(1, int(len(context.rows) * scale_y)),
+        ).clip((x, y, width, height))
+        if view.width > 0 and view.height > 0:
+            pygame.draw.rect(surface, (255, 255, 255), view, 1)
+        for player in players.players.values():
+            # les joueurs hors de l'écran ne sont pas animés par `Players.render`
+            player.update_animation()
+            pygame.draw.circle(
+                surface,
+                LOCAL_PLAYER_COLOR if player is players.player else PLAYER_COLOR,
+                (x + int((player.x + 0.5) * scale_x), y + int((player.y + 0.5) * scale_y)),
+                2,
+            )
+        return pygame.Rect(x, y, width, height)
@@ -1,18 +1,28 @@
 from __future__ import annotations
-from typing import Dict, List, Optional, TYPE_CHECKING, Tuple
+from typing import Callable, Deque, Dict, Iterator, List, Optional, TYPE_CHECKING, Tuple, Union
 
+from collections import deque
 import time
 
 import pygame
 import pygame.image
 from pygame.surface import Surface
 
+from .metrics import BLITS, PLAYERS, metrics
+from .spatial import SpatialHash
 from .sprites import Sprite
+from .text import text_cache
 
 if TYPE_CHECKING:
+    from .camera import FrameContext
     from .game import Pygame
 
 MOVE_INTERVAL = 0.15
+# horloge utilisée pour les transitions, remplacée par le jeu par l'horloge des images
+# pour que les déplacements ne dépendent que de la durée des images (voir `replay.py`)
+clock: Callable[[], float] = time.time
+VIEW_MARGIN = 2 # nombre de tuiles affichées en plus autour de l'écran
+SNAPSHOT_COUNT = 32 # nombre maximal de positions gardées pour un joueur distant
 
 class Transition:
     def __init__(
@@ -38,7 +48,7 @@ class Transition:
         self.begin = begin
         self.end = end
         self.value = self.begin
-        self.start_time = time.time()
+        self.start_time = clock()
         self.end_time = self.start_time + duration
         self.duration = duration
     
@@ -51,7 +61,7 @@ class Transition:
         bool
             Le booléen indiquant si la transition est finie ou non
         """
-        return time.time() >= self.end_time
+        return clock() >= self.end_time
 
     def get_state(self) -> float:
         """Retourne le stade actuel de la transition
@@ -61,7 +71,7 @@ class Transition:
         float
             Le point actuel de la transition
         """
-        act_time = time.time()
+        act_time = clock()
         if act_time >= self.end_time:
             return 1
         return (act_time-self.start_time) / self.duration
@@ -69,13 +79,14 @@ class Transition:
     def update(self) -> None:
         """Met à jour la valeur de la transition
         """
-        if time.time() >= self.end_time:
+        if clock() >= self.end_time:
             self.value = self.end
         self.value = self.begin + (self.end-self.begin)*self.get_state()
 
 class Coords:
     coords: List[float, float]
     transition: List[Optional[Transition]]
+    listener: Optional[Callable[[int, int], None]] = None
 
     def __init__(self, x: int = 0, y: int = 0) -> None:
         """Initialise le joueur
@@ -106,6 +117,8 @@ class Coords:
                 value,
                 MOVE_INTERVAL,
             )
+            if self.listener is not None:
+                self.listener(*self.real_coords())
     
     @property
     def y(self) -> float:
@@ -123,6 +136,8 @@ class Coords:
                 value,
                 MOVE_INTERVAL,
             )
+            if self.listener is not None:
+                self.listener(*self.real_coords())
         
     def update(self) -> None:
         """Met à jour les transition du joueur
@@ -151,6 +166,120 @@ class Coords:
         else:
             y = self.coords[1]
         return (x, y)
+    
+    def set(self, x: int, y: int) -> None:
+        """Déplace les coordonnées vers le point indiqué même si une transition est
+        en cours : la nouvelle transition part de la position affichée.
+        Cette fonction est utilisée pour corriger la position prédite du joueur.
+        
+        Attributes
+        ----------
+        x: int
+            La nouvelle coordonnée x
+        y: int
+            La nouvelle coordonnée y
+        """
+        for i, value in enumerate((x, y)):
+            transition = self.transition[i]
+            current = transition.value if transition is not None else self.coords[i]
+            if current == value:
+                self.coords[i] = value
+                self.transition[i] = None
+            else:
+                self.coords[i] = current
+                self.transition[i] = Transition(current, value, MOVE_INTERVAL)
+        if self.listener is not None:
+            self.listener(x, y)
+
+    def jump(self, x: int, y: int) -> None:
+        """Place les coordonnées au point indiqué, sans transition (utilisée
+        pour le changement de niveau)"""
+        self.coords = [x, y]
+        self.transition = [None, None]
+        if self.listener is not None:
+            self.listener(x, y)
+
+class InterpolatedCoords:
+    """Coordonnées d'un joueur distant.
+    Les positions envoyées par le serveur sont gardées avec l'heure du serveur
+    à laquelle elles ont été envoyées, et le joueur est affiché légèrement dans le
+    passé (voir `ServerClock`) en interpolant entre les deux positions qui
+    encadrent ce moment. Les irrégularités du réseau sont ainsi invisibles.
+    """
+    coords: List[float]
+    snapshots: Deque[Tuple[float, int, int]]
+    transition: Tuple[None, None] = (None, None) # compatibilité avec `Coords`
+    listener: Optional[Callable[[int, int], None]] = None
+
+    def __init__(self, x: int, y: int, time: float, clock: Callable[[], float]) -> None:
+        """Initialise les coordonnées avec une première position.
+        
+        Attributes
+        ----------
+        x: int
+            La coordonnée x du joueur
+        y: int
+            La coordonnée y du joueur
+        time: float
+            L'heure du serveur de cette position
+        clock: Callable[[], float]
+            La fonction qui retourne l'heure du serveur à afficher
+        """
+        self.clock = clock
+        self.coords = [x, y]
+        self.snapshots = deque([(time, x, y)], maxlen=SNAPSHOT_COUNT)
+    
+    def push(self, time: float, x: int, y: int) -> None:
+        """Ajoute une position reçue du serveur.
+        
+        Attributes
+        ----------
+        time: float
+            L'heure du serveur de cette position
+        x: int
+            La coordonnée x
+        y: int
+            La coordonnée y
+        """
+        last_time, last_x, last_y = self.snapshots[-1]
+        if time < last_time:
+            return
+        if time - last_time > MOVE_INTERVAL:
+            # le joueur était immobile : il commence son déplacement au plus
+            # tard `MOVE_INTERVAL` avant d'arriver, comme le joueur local
+            self.snapshots.append((time - MOVE_INTERVAL, last_x, last_y))
+        self.snapshots.append((time, x, y))
+        if self.listener is not None:
+            self.listener(x, y)
+    
+    @property
+    def x(self) -> float:
+        return self.coords[0]
+    
+    @property
+    def y(self) -> float:
+        return self.coords[1]
+    
+    def update(self) -> None:
+        """Met à jour la position affichée en fonction de l'heure donnée par `clock`"""
+        time = self.clock()
+        snapshots = self.snapshots
+        # on oublie les positions dépassées (en gardant celle qui précède l'heure affichée)
+        while len(snapshots) > 1 and snapshots[1][0] <= time:
+            snapshots.popleft()
+        begin_time, begin_x, begin_y = snapshots[0]
+        if len(snapshots) == 1 or time <= begin_time:
+            self.coords[0], self.coords[1] = begin_x, begin_y
+            return
+        end_time, end_x, end_y = snapshots[1]
+        state = (time - begin_time) / (end_time - begin_time)
+        self.coords[0] = begin_x + (end_x - begin_x) * state
+        self.coords[1] = begin_y + (end_y - begin_y) * state
+    
+    def real_coords(self) -> Tuple[int, int]:
+        """Retourne la dernière position reçue du serveur"""
+        _, x, y = self.snapshots[-1]
+        return (x, y)
 
 class Player:
     """Cette classe contient un joueur et procède à son affichage."""
@@ -160,10 +289,17 @@ class Player:
 
     color_: int = 0
 
-    name: Optional[str] = None
+    name_: Optional[str] = None
     rendered_name: Optional[Surface] = None
 
-    def __init__(self, id: int, parent: Pygame, x: int = 0, y: int = 0) -> None:
+    def __init__(
+        self,
+        id: int,
+        parent: Pygame,
+        x: int = 0,
+        y: int = 0,
+        coords: Optional[Union[Coords, InterpolatedCoords]] = None,
+    ) -> None:
         """Créé le joueur en fonction des arguments donnés.
         
         Attributes
@@ -176,17 +312,32 @@ class Player:
             La coordonnée `x` du joueur
         y: int = 0
             La coordonnée `y` du joueur
+        coords: Optional[Union[Coords, InterpolatedCoords]] = None
+            Les coordonnées à utiliser à la place de `x` et `y`
+            (par exemple des `InterpolatedCoords` pour un joueur distant)
         """
         self.parent = parent
         self.id = id
-        self.coords = Coords(x, y)
+        self.coords = coords if coords is not None else Coords(x, y)
+        self.coords.listener = self.moved
         self.color = 0
         self.name = ""
-        self.rendered_name = self.parent.small_font.render(
-            self.name,
-            True,
-            0x000000
-        )
+    
+    @property
+    def name(self) -> Optional[str]:
+        return self.name_
+    
+    @name.setter
+    def name(self, value: Optional[str]) -> None:
+        self.name_ = value
+        if value is None:
+            self.rendered_name = None
+        else:
+            self.rendered_name = text_cache.render(
+                self.parent.small_font,
+                value,
+                0x000000
+            )
     
     @property
     def color(self) -> int:
@@ -197,17 +348,28 @@ class Player:
         self.color_ = value
         self.sprite = Sprite("player", data=self.color)
     
-    def render(self)-> None:
-        """Affiche le joueur sur l'écran (`self.parent.screen`)"""
-        screen:pygame.Surface = self.parent.screen
-        x = (self.x - self.parent.camera_x) * 32 + self.parent.screen.get_width()//2
-        y = (self.y - self.parent.camera_y) * 32 + self.parent.screen.get_height()//2
-        self.sprite.center_at(x, y)
+    def render(self, context: FrameContext, surface: Optional[pygame.Surface] = None)-> None:
+        """Affiche le joueur sur l'écran (`self.parent.screen`)
+        
+        Attributes
+        ----------
+        context: FrameContext
+            Le contexte de rendu de l'image (caméra, zoom)
+        surface: Optional[pygame.Surface] = None
+            La surface sur laquelle afficher le joueur (par défaut l'écran)
+        """
+        screen:pygame.Surface = self.parent.screen if surface is None else surface
+        tile_size = context.tile_size
+        x = self.x * tile_size + context.origin_x
+        y = self.y * tile_size + context.origin_y
+        self.sprite.center_at(x, y, context.zoom)
         if self.rendered_name is not None:
             x -= self.rendered_name.get_width()//2
-            y -= 30
+            y -= tile_size * 15 // 16
             screen.blit(self.rendered_name, (x, y))
-        self.sprite.blit(screen)
+        self.sprite.blit(screen, scale=context.zoom)
+        if metrics.enabled:
+            BLITS.inc(1 if self.rendered_name is None else 2)
     
     def move_by(self, offset_x: int = 0, offset_y: int = 0, check_move: bool = True) -> bool:
         """Déplace le joueur avec les coordonnées indiquées.
@@ -258,6 +420,19 @@ class Player:
     
     def update_animation(self) -> None:
         self.coords.update()
+    
+    def moved(self, x: int, y: int) -> None:
+        """Appelée par `Coords` quand la destination du joueur change,
+        elle met à jour l'index spatial des joueurs.
+        
+        Attributes
+        ----------
+        x: int
+            La nouvelle coordonnée `x` réelle du joueur
+        y: int
+            La nouvelle coordonnée `y` réelle du joueur
+        """
+        self.parent.players.grid.move(self.id, x, y)
 
 class Players:
     """Cette classe contient tout les joueurs connectés au monde actuel.
@@ -266,6 +441,7 @@ class Players:
     parent: Pygame
     players: Dict[int, Player] = {}
     player: Optional[Player]
+    grid: SpatialHash
 
     def __init__(self, parent: Pygame) -> None:
         """Initialise la classe (mais pas les données)
@@ -278,12 +454,22 @@ class Players:
         self.parent = parent
         self.player_id = None
         self.player = None
+        self.players = {}
+        self.grid = SpatialHash()
     
-    def init(self) -> None:
+    def init(self, player_id: int = 0, x: Optional[int] = None, y: Optional[int] = None) -> None:
         """Cette fonction initialise le joueur.
+        
+        Attributes
+        ----------
+        player_id: int = 0
+            L'identifiant du joueur local (donné par le serveur en multijoueur)
+        x: Optional[int] = None
+        y: Optional[int] = None
+            La position du joueur (par défaut celle du point d'apparition)
         """
-        self.player_id = 0
-        self.new(self.player_id)
+        self.player_id = player_id
+        self.new(self.player_id, x, y)
         self.player.color = 1
     
     def __getitem__(self, player_id: int) -> Player:
@@ -301,23 +487,39 @@ class Players:
         """
         return self.players[player_id]
     
-    def new(self, player_id: int) -> None:
+    def new(
+        self,
+        player_id: int,
+        x: Optional[int] = None,
+        y: Optional[int] = None,
+        coords: Optional[Union[Coords, InterpolatedCoords]] = None,
+    ) -> None:
         """Cette fonction créé un nouveau joueur et l'ajoute dans le dictionnaire
         
         Attributes
         ----------
         player_id: int
             L'identifiant du joueur à créer dans le dictionnaire
+        x: Optional[int] = None
+            La coordonnée `x` du joueur (par défaut celle du point d'apparition)
+        y: Optional[int] = None
+            La coordonnée `y` du joueur (par défaut celle du point d'apparition)
+        coords: Optional[Union[Coords, InterpolatedCoords]] = None
+            Les coordonnées du joueur si elles ne sont pas gérées par une transition
         """
         if not player_id in self.players:
             self.players[player_id] = Player(
                 player_id,
                 self.parent,
-                self.parent.map.spawn[0],
-                self.parent.map.spawn[1],
+                self.parent.map.spawn[0] if x is None else x,
+                self.parent.map.spawn[1] if y is None else y,
+                coords,
             )
+            self.grid.insert(player_id, *self.players[player_id].coords.real_coords())
             if player_id == self.player_id:
                 self.player = self[player_id]
+            if metrics.enabled:
+                PLAYERS.set(len(self.players))
     
     def remove(self, player_id: int) -> None:
         """Supprimes un joueur du dictionnaire.
@@ -329,17 +531,67 @@ class Players:
         """
         if player_id in self.players:
             del self.players[player_id]
+            self.grid.remove(player_id)
+            if metrics.enabled:
+                PLAYERS.set(len(self.players))
+    
+    def in_area(self, x_min: float, y_min: float, x_max: float, y_max: float) -> Iterator[Player]:
+        """Retourne les joueurs dont les coordonnées réelles sont dans le rectangle
+        indiqué (bornes incluses), en utilisant l'index spatial.
+        
+        Attributes
+        ----------
+        x_min: float
+        y_min: float
+            Le coin haut gauche de la zone
+        x_max: float
+        y_max: float
+            Le coin bas droit de la zone
+        
+        Returns
+        -------
+        Iterator[Player]
+            Les joueurs présents dans la zone
+        """
+        for player_id in list(self.grid.query(x_min, y_min, x_max, y_max)):
+            yield self.players[player_id]
     
-    def render(self) -> None:
-        """Effectue l'affichage de tout les joueurs.
+    def near(self, x: float, y: float, radius: int) -> Iterator[Player]:
+        """Retourne les joueurs situés à au plus `radius` tuiles (sur chaque axe)
+        du point indiqué"""
+        return self.in_area(x - radius, y - radius, x + radius, y + radius)
+    
+    def render(self, context: FrameContext, surface: Optional[pygame.Surface] = None) -> None:
+        """Effectue l'affichage des joueurs visibles à l'écran.
+        Seuls les joueurs dans la zone affichée sont animés et dessinés : comme les
+        transitions dépendent de l'heure, l'animation des autres joueurs est
+        rattrapée quand ils reviennent à l'écran.
+
+        Attributes
+        ----------
+        context: FrameContext
+            Le contexte de rendu de l'image (caméra, zoom, tuiles visibles)
+        surface: Optional[pygame.Surface] = None
+            La surface sur laquelle afficher les joueurs (par défaut l'écran,
+            ou une partie de l'écran pour l'écran partagé)
         """
-        for player in self.players.values():
-            player.update_animation()
-            player.render()
+        if self.player is not None:
+            self.player.update_animation()
+        columns, rows = context.columns, context.rows
+        for player in self.in_area(
+            columns.start - VIEW_MARGIN, rows.start - VIEW_MARGIN,
+            columns.stop - 1 + VIEW_MARGIN, rows.stop - 1 + VIEW_MARGIN,
+        ):
+            if player is not self.player:
+                player.update_animation()
+                player.render(context, surface)
+        if self.player is not None:
+            self.player.render(context, surface)
   
     def reset(self) -> None:
         """Cette fonction réinitialise tout les joueurs.
         """
         self.players = {}
         self.player = None
+        self.grid = SpatialHash()
         self.color = 0
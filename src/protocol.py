@@ -0,0 +1,214 @@
+"""Ce fichier décrit le protocole utilisé entre le serveur et les clients.
+Chaque message est une trame binaire composée d'un en-tête (taille du contenu
+et type du message) suivi du contenu du message.
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+from enum import IntEnum
+import json
+import struct
+import zlib
+
+if TYPE_CHECKING:
+    from .map import Map
+
+__all__ = [
+    "DEFAULT_HOST",
+    "DEFAULT_PORT",
+    "TICK_RATE",
+    "Message",
+    "ProtocolError",
+    "FrameReader",
+    "frame",
+    "pack_hello",
+    "unpack_hello",
+    "pack_welcome",
+    "unpack_welcome",
+    "pack_join",
+    "unpack_join",
+    "pack_leave",
+    "unpack_leave",
+    "pack_move",
+    "unpack_move",
+    "pack_position",
+    "unpack_position",
+    "pack_tile",
+    "unpack_tile",
+    "pack_tick",
+    "unpack_tick",
+    "pack_ack",
+    "unpack_ack",
+    "pack_reject",
+    "unpack_reject",
+    "encode_world",
+    "decode_world",
+]
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7777
+
+TICK_RATE = 20 # nombre de ticks du serveur par seconde
+
+MAX_FRAME_SIZE = 16 * 1024 * 1024 # taille maximale du contenu d'une trame
+
+HEADER = struct.Struct("<IB") # taille du contenu, type du message
+PLAYER_ID = struct.Struct("<I")
+WELCOME = struct.Struct("<II") # identifiant du joueur, taille du monde compressé
+POSITION = struct.Struct("<Iii") # identifiant, x, y
+MOVE = struct.Struct("<Hbb") # numéro de séquence, déplacement relatif x, y
+ACK = struct.Struct("<Hii") # dernier déplacement traité, x, y
+TICK = struct.Struct("<I") # numéro du tick
+TILE = struct.Struct("<iiBH") # x, y, type, données
+
+class Message(IntEnum):
+    """Les différents types de messages"""
+    HELLO = 1 # client -> serveur : nom du joueur
+    WELCOME = 2 # serveur -> client : identifiant du joueur, monde et tuiles qu'il a explorées
+    JOIN = 3 # serveur -> client : un joueur est arrivé
+    LEAVE = 4 # serveur -> client : un joueur est parti
+    MOVE = 5 # client -> serveur : demande de déplacement
+    POSITION = 6 # serveur -> client : position d'un joueur
+    TILE = 7 # serveur -> client : une tuile a changé
+    TICK = 8 # serveur -> client : numéro du tick des trames qui suivent
+    ACK = 9 # serveur -> client : position du joueur après ses déplacements
+    REJECT = 10 # serveur -> client : connexion refusée, avec la raison
+
+class ProtocolError(Exception):
+    """Erreur levée quand une trame reçue est invalide"""
+
+def frame(message: Message, payload: bytes = b"") -> bytes:
+    """Construit une trame à partir du type de message et de son contenu.
+
+    Attributes
+    ----------
+    message: Message
+        Le type du message
+    payload: bytes = b""
+        Le contenu du message
+
+    Returns
+    -------
+    bytes
+        La trame prête à être envoyée
+    """
+    return HEADER.pack(len(payload), message) + payload
+
+class FrameReader:
+    """Découpe le flux d'octets reçu en trames complètes"""
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Tuple[int, bytes]]:
+        """Ajoute les octets reçus et retourne les trames complètes.
+
+        Attributes
+        ----------
+        data: bytes
+            Les octets reçus
+
+        Returns
+        -------
+        List[Tuple[int, bytes]]
+            La liste des trames complètes (type du message, contenu)
+        """
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        offset = 0
+        header_size = HEADER.size
+        while len(buffer) - offset >= header_size:
+            size, message = HEADER.unpack_from(buffer, offset)
+            if size > MAX_FRAME_SIZE:
+                raise ProtocolError(f"frame too large ({size} bytes)")
+            end = offset + header_size + size
+            if end > len(buffer):
+                break
+            frames.append((message, bytes(buffer[offset + header_size:end])))
+            offset = end
+        if offset:
+            del buffer[:offset]
+        return frames
+
+def pack_hello(name: str) -> bytes:
+    return frame(Message.HELLO, name.encode("utf-8"))
+
+def unpack_hello(payload: bytes) -> str:
+    return payload.decode("utf-8", "replace")
+
+def pack_welcome(player_id: int, world: bytes, explored: bytes) -> bytes:
+    """Construit la trame d'accueil d'un joueur : le monde (sérialisé par
+    `encode_world`) et les tuiles explorées par ce joueur seulement
+    (`Explored.to_bytes`)"""
+    return frame(
+        Message.WELCOME,
+        WELCOME.pack(player_id, len(world)) + world + zlib.compress(explored),
+    )
+
+def unpack_welcome(payload: bytes) -> Tuple[int, bytes, bytes]:
+    player_id, size = WELCOME.unpack_from(payload)
+    world = payload[WELCOME.size:WELCOME.size + size]
+    return player_id, world, zlib.decompress(payload[WELCOME.size + size:])
+
+def pack_join(player_id: int, x: int, y: int, name: str) -> bytes:
+    return frame(Message.JOIN, POSITION.pack(player_id, x, y) + name.encode("utf-8"))
+
+def unpack_join(payload: bytes) -> Tuple[int, int, int, str]:
+    player_id, x, y = POSITION.unpack_from(payload)
+    return player_id, x, y, payload[POSITION.size:].decode("utf-8", "replace")
+
+def pack_leave(player_id: int) -> bytes:
+    return frame(Message.LEAVE, PLAYER_ID.pack(player_id))
+
+def unpack_leave(payload: bytes) -> int:
+    return PLAYER_ID.unpack(payload)[0]
+
+def pack_move(sequence: int, offset_x: int, offset_y: int) -> bytes:
+    return frame(Message.MOVE, MOVE.pack(sequence, offset_x, offset_y))
+
+def unpack_move(payload: bytes) -> Tuple[int, int, int]:
+    return MOVE.unpack(payload)
+
+def pack_position(player_id: int, x: int, y: int) -> bytes:
+    return frame(Message.POSITION, POSITION.pack(player_id, x, y))
+
+def unpack_position(payload: bytes) -> Tuple[int, int, int]:
+    return POSITION.unpack(payload)
+
+def pack_tile(x: int, y: int, type: int, data: int) -> bytes:
+    return frame(Message.TILE, TILE.pack(x, y, type, data))
+
+def unpack_tile(payload: bytes) -> Tuple[int, int, int, int]:
+    return TILE.unpack(payload)
+
+def pack_tick(tick: int) -> bytes:
+    return frame(Message.TICK, TICK.pack(tick))
+
+def unpack_tick(payload: bytes) -> int:
+    return TICK.unpack(payload)[0]
+
+def pack_ack(sequence: int, x: int, y: int) -> bytes:
+    return frame(Message.ACK, ACK.pack(sequence, x, y))
+
+def unpack_ack(payload: bytes) -> Tuple[int, int, int]:
+    return ACK.unpack(payload)
+
+def pack_reject(reason: str) -> bytes:
+    return frame(Message.REJECT, reason.encode("utf-8"))
+
+def unpack_reject(payload: bytes) -> str:
+    return payload.decode("utf-8", "replace")
+
+def encode_world(map: Map) -> bytes:
+    """Sérialise le monde (avec `Map.to_dict`) et le compresse. Les tuiles
+    explorées des joueurs n'en font pas partie : chaque joueur ne reçoit que
+    les siennes (voir `pack_welcome`)."""
+    return zlib.compress(
+        json.dumps(map.to_dict(explored=False), separators=(",", ":")).encode("utf-8")
+    )
+
+def decode_world(data: bytes) -> Dict[str, Any]:
+    """Décompresse un monde sérialisé par `encode_world`, le résultat peut être
+    chargé avec `Map.load_dict`"""
+    return json.loads(zlib.decompress(data).decode("utf-8"))
@@ -0,0 +1,90 @@
+"""Ce fichier contient l'enregistrement et la relecture des parties.
+Une partie est entièrement déterminée par la graine du monde, les commandes
+exécutées à chaque image (voir `inputs.py`) et la durée de chaque image : en
+rejouant ces données, on obtient exactement les mêmes déplacements.
+"""
+from __future__ import annotations
+from typing import Iterator, Optional, Tuple
+
+import struct
+import zlib
+
+__all__ = [
+    "Recording",
+]
+
+MAGIC = b"SYLR"
+VERSION = 4
+HEADER = struct.Struct("<4sBQIii") # signature, version, graine, nombre d'images, position finale
+TICK = struct.Struct("<IH") # masque des commandes, durée de l'image en millisecondes
+# format des images des versions précédentes qui peuvent encore être lues
+OLD_TICKS = {2: struct.Struct("<BH"), 3: struct.Struct("<HH")}
+
+class Recording:
+    """Une partie enregistrée"""
+    seed: int
+    ticks: bytearray
+    final: Optional[Tuple[int, int]]
+
+    def __init__(self, seed: int) -> None:
+        """Initialise un enregistrement vide.
+
+        Attributes
+        ----------
+        seed: int
+            La graine du monde de la partie
+        """
+        self.seed = seed
+        self.ticks = bytearray()
+        self.final = None
+
+    def append(self, mask: int, duration: int) -> None:
+        """Ajoute une image à l'enregistrement.
+
+        Attributes
+        ----------
+        mask: int
+            Le masque des commandes de l'image (voir `inputs.command_mask`)
+        duration: int
+            La durée de l'image en millisecondes
+        """
+        self.ticks += TICK.pack(mask, min(duration, 0xFFFF))
+
+    def __len__(self) -> int:
+        return len(self.ticks) // TICK.size
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return TICK.iter_unpack(self.ticks)
+
+    def save(self, path: str) -> None:
+        """Écrit l'enregistrement dans un fichier (les images sont compressées)"""
+        final_x, final_y = self.final if self.final is not None else (0, 0)
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.seed, len(self), int(final_x), int(final_y)))
+            file.write(zlib.compress(bytes(self.ticks), 9))
+
+    @classmethod
+    def load(cls, path: str) -> Recording:
+        """Lit un enregistrement écrit par `Recording.save`
+
+        Raises
+        ------
+        ValueError
+            Si le fichier n'est pas un enregistrement valide
+        """
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, version, seed, count, final_x, final_y = HEADER.unpack_from(data)
+        if magic != MAGIC or (version != VERSION and version not in OLD_TICKS):
+            raise ValueError(f"{path} is not a supported recording")
+        recording = cls(seed)
+        ticks = zlib.decompress(data[HEADER.size:])
+        if version in OLD_TICKS:
+            for mask, duration in OLD_TICKS[version].iter_unpack(ticks):
+                recording.append(mask, duration)
+        else:
+            recording.ticks = bytearray(ticks)
+        if len(recording) != count:
+            raise ValueError(f"{path} is truncated")
+        recording.final = (final_x, final_y)
+        return recording
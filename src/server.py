@@ -0,0 +1,504 @@
+"""Ce fichier contient le serveur multijoueur.
+Le serveur garde le monde et la position de chaque joueur, applique les
+déplacements demandés par les clients et leur envoie les mises à jour de leur
+zone d'intérêt une fois par tick, regroupées en un seul envoi par client.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Set, Tuple
+
+import asyncio
+import logging
+import socket
+import time
+
+from .autosave import AUTOSAVE_INTERVAL, Autosave, load_latest
+from .map import Map
+from .metrics import PLAYERS, TICK_TIME, metrics
+from .spatial import SpatialHash
+from .protocol import (
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    TICK_RATE,
+    FrameReader,
+    Message,
+    ProtocolError,
+    encode_world,
+    pack_ack,
+    pack_join,
+    pack_leave,
+    pack_position,
+    pack_reject,
+    pack_tick,
+    pack_tile,
+    pack_welcome,
+    unpack_hello,
+    unpack_move,
+)
+
+__all__ = [
+    "INTEREST_RADIUS_X",
+    "INTEREST_RADIUS_Y",
+    "INTEREST_CELL",
+    "ServerPlayer",
+    "Connection",
+    "Server",
+    "run_server",
+]
+
+MAX_PENDING_MOVES = 8 # nombre maximal de déplacements en attente par joueur
+MAX_WRITE_BUFFER = 4 * 1024 * 1024 # un client plus en retard que ça est déconnecté
+
+# zone d'intérêt d'un joueur : l'écran (23x18 tuiles) plus une marge
+INTEREST_RADIUS_X = 16
+INTEREST_RADIUS_Y = 13
+INTEREST_CELL = 8 # taille des cellules de l'index des joueurs et des modifications de tuiles
+
+# les joueurs sans nom sont rangés sous ce préfixe suivi de leur identifiant,
+# interdit au début des noms choisis par les joueurs
+ANONYMOUS_PREFIX = "#"
+
+Cell = Tuple[int, int]
+Area = Tuple[int, int, int, int]
+
+class ServerPlayer:
+    """Un joueur tel que le serveur le connaît.
+    `key` range la position et les tuiles explorées du joueur : son nom, ou
+    un identifiant propre à la connexion pour un joueur sans nom. `visible`
+    contient les joueurs que le client connaît (ceux dans sa zone d'intérêt),
+    et `tile_versions` la version des modifications de tuiles qu'il a reçues
+    pour chaque cellule.
+    """
+    __slots__ = ("id", "name", "key", "x", "y", "moves", "last_move", "connection", "visible", "area", "tile_versions")
+
+    def __init__(self, id: int, name: str, x: int, y: int, connection: Connection) -> None:
+        self.id = id
+        self.name = name
+        self.key = name if name else f"{ANONYMOUS_PREFIX}{id}"
+        self.x = x
+        self.y = y
+        self.moves: List[Tuple[int, int, int]] = []
+        self.last_move = 0 # numéro de séquence du dernier déplacement traité
+        self.connection = connection
+        self.visible: Set[int] = set()
+        self.area: Area = (0, 0, -1, -1)
+        self.tile_versions: Dict[Cell, int] = {}
+
+class Connection(asyncio.Protocol):
+    """La connexion avec un client.
+    Les trames à envoyer sont accumulées dans `outgoing` et envoyées en une seule
+    fois à la fin du tick.
+    """
+    transport: Optional[asyncio.Transport]
+    player: Optional[ServerPlayer]
+
+    def __init__(self, server: Server) -> None:
+        self.server = server
+        self.reader = FrameReader()
+        self.transport = None
+        self.player = None
+        self.outgoing = bytearray()
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def data_received(self, data: bytes) -> None:
+        try:
+            frames = self.reader.feed(data)
+        except ProtocolError as error:
+            logging.warning("Closing connection: %s", error)
+            self.transport.close()
+            return
+        for message, payload in frames:
+            self.server.handle(self, message, payload)
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.server.disconnect(self)
+
+    def send(self, data: bytes) -> None:
+        """Ajoute une trame à envoyer à la fin du tick"""
+        self.outgoing += data
+
+    def flush(self, tick: bytes) -> None:
+        """Envoie en une fois les trames accumulées pendant le tick, précédées
+        du numéro du tick.
+        
+        Attributes
+        ----------
+        tick: bytes
+            La trame `Message.TICK` du tick actuel
+        """
+        if not self.outgoing or self.transport is None or self.transport.is_closing():
+            return
+        if self.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            logging.warning("Client too slow, closing connection")
+            self.transport.close()
+            return
+        data, self.outgoing = self.outgoing, bytearray()
+        data[:0] = tick
+        self.transport.write(data)
+
+class Server:
+    """Le serveur multijoueur.
+    Chaque client ne reçoit que les mises à jour des joueurs et des tuiles
+    situés dans sa zone d'intérêt : les joueurs sont rangés dans un index spatial
+    et un joueur qui se déplace n'est comparé qu'aux joueurs proches de lui.
+    """
+    map: Map
+    players: Dict[int, ServerPlayer]
+    connections: List[Connection]
+    grid: SpatialHash
+    tile_changes: Dict[Cell, Dict[Tuple[int, int], bytes]]
+    tile_versions: Dict[Cell, int]
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, map: Optional[Map] = None) -> None:
+        """Initialise le serveur et génère le monde si aucun n'est donné.
+
+        Attributes
+        ----------
+        host: str = DEFAULT_HOST
+            L'adresse sur laquelle écouter
+        port: int = DEFAULT_PORT
+            Le port sur lequel écouter
+        map: Optional[Map] = None
+            Le monde à utiliser
+        """
+        self.host = host
+        self.port = port
+        self.map = map if map is not None else Map(None)
+        self.players = {}
+        self.connections = []
+        self.grid = SpatialHash(INTEREST_CELL)
+        self.tile_changes = {}
+        self.tile_versions = {}
+        self.next_id = 1
+        self.world_data: Optional[bytes] = None
+        self.tick_count = 0
+        self.server: Optional[asyncio.AbstractServer] = None
+        # dernière position des joueurs partis, rangée par nom : ils reviennent
+        # là où ils étaient (et elle est sauvegardée avec le monde)
+        self.positions: Dict[str, Tuple[int, int]] = {}
+        self.names: Set[str] = set() # noms des joueurs connectés
+        self.autosave: Optional[Autosave] = None
+
+    @property
+    def world(self) -> bytes:
+        """Le monde sérialisé envoyé aux nouveaux joueurs (recalculé seulement
+        après une modification)"""
+        if self.world_data is None:
+            self.world_data = encode_world(self.map)
+        return self.world_data
+
+    def handle(self, connection: Connection, message: int, payload: bytes) -> None:
+        """Traite une trame reçue d'un client"""
+        player = connection.player
+        if player is None:
+            if message == Message.HELLO:
+                self.join(connection, unpack_hello(payload))
+            return
+        if message == Message.MOVE:
+            if len(player.moves) < MAX_PENDING_MOVES:
+                player.moves.append(unpack_move(payload))
+
+    def join(self, connection: Connection, name: str) -> None:
+        """Ajoute le joueur correspondant à la connexion, lui envoie le monde et
+        les joueurs proches, et annonce son arrivée aux joueurs proches.
+        La connexion est refusée si le nom est déjà pris par un joueur connecté :
+        les deux joueurs partageraient sinon leur position et leurs tuiles
+        explorées."""
+        if name in self.names or name.startswith(ANONYMOUS_PREFIX):
+            logging.info("Refusing name %r", name)
+            if connection.transport is not None:
+                connection.transport.write(pack_reject(f"name {name!r} is not available"))
+                connection.transport.close()
+            return
+        x, y = self.positions.get(name, self.map.spawn) if name else self.map.spawn
+        player = ServerPlayer(self.next_id, name, x, y, connection)
+        self.next_id += 1
+        connection.player = player
+        if name:
+            self.names.add(name)
+        self.map.exploration.reveal(player.key, player.x, player.y)
+        explored = self.map.exploration.get(player.key).to_bytes()
+        connection.send(pack_welcome(player.id, self.world, explored))
+        if (x, y) != tuple(self.map.spawn):
+            # le client place le joueur au point d'apparition
+            connection.send(pack_ack(player.last_move, x, y))
+        # le monde envoyé contient déjà toutes les modifications de tuiles
+        player.tile_versions = dict(self.tile_versions)
+        player.area = self.interest_area(player.x, player.y)
+        self.players[player.id] = player
+        self.connections.append(connection)
+        self.grid.insert(player.id, player.x, player.y)
+        for other_id in self.near(player):
+            self.show(player, self.players[other_id])
+        logging.info("Player %s joined (%s)", player.id, name)
+
+    def disconnect(self, connection: Connection) -> None:
+        """Retire le joueur de la connexion fermée et annonce son départ aux
+        joueurs qui le voyaient"""
+        player = connection.player
+        if player is None:
+            return
+        connection.player = None
+        self.connections.remove(connection)
+        del self.players[player.id]
+        self.grid.remove(player.id)
+        if player.name:
+            self.names.discard(player.name)
+            self.positions[player.name] = (player.x, player.y)
+        else:
+            # un joueur sans nom ne peut pas revenir : son état est oublié
+            self.map.exploration.discard(player.key)
+        leave = pack_leave(player.id)
+        for other_id in player.visible:
+            other = self.players[other_id]
+            other.visible.discard(player.id)
+            other.connection.send(leave)
+        logging.info("Player %s left", player.id)
+
+    def player_positions(self) -> Dict[str, Tuple[int, int]]:
+        """Retourne la position de chaque joueur, connecté ou parti, rangée
+        par nom (pour la sauvegarde automatique)"""
+        positions = dict(self.positions)
+        for player in self.players.values():
+            if player.name:
+                positions[player.name] = (player.x, player.y)
+        return positions
+
+    def near(self, player: ServerPlayer) -> Set[int]:
+        """Retourne les identifiants des joueurs dans la zone d'intérêt du joueur.
+        La zone étant la même pour tous, la relation est symétrique : si A voit
+        B, alors B voit A."""
+        near = set(self.grid.query(
+            player.x - INTEREST_RADIUS_X, player.y - INTEREST_RADIUS_Y,
+            player.x + INTEREST_RADIUS_X, player.y + INTEREST_RADIUS_Y,
+        ))
+        near.discard(player.id)
+        return near
+
+    def show(self, player: ServerPlayer, other: ServerPlayer) -> None:
+        """Fait entrer deux joueurs dans la zone d'intérêt l'un de l'autre"""
+        player.visible.add(other.id)
+        other.visible.add(player.id)
+        player.connection.send(pack_join(other.id, other.x, other.y, other.name))
+        other.connection.send(pack_join(player.id, player.x, player.y, player.name))
+
+    def hide(self, player: ServerPlayer, other: ServerPlayer) -> None:
+        """Fait sortir deux joueurs de la zone d'intérêt l'un de l'autre"""
+        player.visible.discard(other.id)
+        other.visible.discard(player.id)
+        player.connection.send(pack_leave(other.id))
+        other.connection.send(pack_leave(player.id))
+
+    def interest_area(self, x: int, y: int) -> Area:
+        """Retourne les cellules (bornes incluses) couvertes par la zone d'intérêt
+        d'un joueur aux coordonnées indiquées"""
+        return (
+            (x - INTEREST_RADIUS_X) // INTEREST_CELL,
+            (y - INTEREST_RADIUS_Y) // INTEREST_CELL,
+            (x + INTEREST_RADIUS_X) // INTEREST_CELL,
+            (y + INTEREST_RADIUS_Y) // INTEREST_CELL,
+        )
+
+    def update_interest(self, player: ServerPlayer) -> None:
+        """Envoie la nouvelle position d'un joueur aux joueurs proches, ainsi que
+        les arrivées et départs de joueurs et les tuiles modifiées qui entrent
+        dans sa zone d'intérêt."""
+        position = pack_position(player.id, player.x, player.y)
+        near = self.near(player)
+        players = self.players
+        for other_id in player.visible - near:
+            self.hide(player, players[other_id])
+        visible = player.visible
+        for other_id in near:
+            if other_id in visible:
+                players[other_id].connection.send(position)
+            else:
+                self.show(player, players[other_id])
+
+        area = self.interest_area(player.x, player.y)
+        if area != player.area:
+            old = player.area
+            player.area = area
+            if self.tile_versions:
+                self.sync_tiles(player, old, area)
+
+    def sync_tiles(self, player: ServerPlayer, old: Area, area: Area) -> None:
+        """Envoie au joueur les tuiles modifiées des cellules qui viennent d'entrer
+        dans sa zone d'intérêt et dont il n'a pas la dernière version"""
+        x_min, y_min, x_max, y_max = area
+        old_x_min, old_y_min, old_x_max, old_y_max = old
+        for cell_y in range(y_min, y_max + 1):
+            for cell_x in range(x_min, x_max + 1):
+                if old_x_min <= cell_x <= old_x_max and old_y_min <= cell_y <= old_y_max:
+                    continue
+                cell = (cell_x, cell_y)
+                version = self.tile_versions.get(cell)
+                if version is None or player.tile_versions.get(cell) == version:
+                    continue
+                for tile in self.tile_changes[cell].values():
+                    player.connection.send(tile)
+                player.tile_versions[cell] = version
+
+    def set_tile(self, x: int, y: int, type: int, data: int = 0) -> None:
+        """Modifie une tuile du monde et l'envoie aux joueurs dont la zone
+        d'intérêt couvre sa cellule. Les autres la recevront en s'approchant.
+
+        Attributes
+        ----------
+        x: int
+            La coordonnée `x` de la tuile
+        y: int
+            La coordonnée `y` de la tuile
+        type: int
+            Le nouveau type de la tuile
+        data: int = 0
+            Les données de la tuile
+        """
+        self.map.set_tile(x, y, type, data)
+        self.world_data = None
+        tile = pack_tile(x, y, type, data)
+        cell = (x // INTEREST_CELL, y // INTEREST_CELL)
+        self.tile_changes.setdefault(cell, {})[(x, y)] = tile
+        version = self.tile_versions[cell] = self.tile_versions.get(cell, 0) + 1
+        cell_x, cell_y = cell
+        for player_id in self.grid.query(
+            cell_x * INTEREST_CELL - INTEREST_RADIUS_X,
+            cell_y * INTEREST_CELL - INTEREST_RADIUS_Y,
+            (cell_x + 1) * INTEREST_CELL - 1 + INTEREST_RADIUS_X,
+            (cell_y + 1) * INTEREST_CELL - 1 + INTEREST_RADIUS_Y,
+        ):
+            player = self.players[player_id]
+            player.connection.send(tile)
+            player.tile_versions[cell] = version
+
+    def teleport(self, player_id: int, x: int, y: int) -> None:
+        """Déplace un joueur directement aux coordonnées indiquées"""
+        player = self.players[player_id]
+        player.x, player.y = x, y
+        self.grid.move(player.id, x, y)
+        player.connection.send(pack_ack(player.last_move, x, y))
+        self.map.exploration.reveal(player.key, x, y)
+        self.update_interest(player)
+
+    def tick(self) -> None:
+        """Applique les déplacements en attente puis envoie les mises à jour du tick"""
+        start = time.perf_counter()
+        allow_move = self.map.allow_move
+        moved = []
+        for player in self.players.values():
+            if not player.moves:
+                continue
+            x, y = player.x, player.y
+            for sequence, offset_x, offset_y in player.moves:
+                player.last_move = sequence
+                # un déplacement d'une seule tuile à la fois : un client ne
+                # peut pas se téléporter
+                if abs(offset_x) + abs(offset_y) != 1:
+                    continue
+                new_x, new_y = player.x + offset_x, player.y + offset_y
+                if allow_move(new_x, new_y):
+                    player.x, player.y = new_x, new_y
+            player.moves.clear()
+            # l'acquittement permet au client de corriger sa prédiction,
+            # y compris quand le déplacement a été refusé
+            player.connection.send(pack_ack(player.last_move, player.x, player.y))
+            if (player.x, player.y) != (x, y):
+                self.grid.move(player.id, player.x, player.y)
+                moved.append(player)
+
+        # toutes les positions sont à jour avant de calculer les zones d'intérêt
+        reveal = self.map.exploration.reveal
+        for player in moved:
+            reveal(player.key, player.x, player.y)
+            self.update_interest(player)
+
+        tick = pack_tick(self.tick_count)
+        for connection in self.connections:
+            connection.flush(tick)
+        self.tick_count += 1
+        if metrics.enabled:
+            TICK_TIME.observe(time.perf_counter() - start)
+            PLAYERS.set(len(self.players))
+            metrics.maybe_write()
+
+    async def start(self) -> None:
+        """Commence à écouter les connexions"""
+        loop = asyncio.get_running_loop()
+        self.server = await loop.create_server(
+            lambda: Connection(self),
+            self.host,
+            self.port,
+        )
+        logging.info("Listening on %s:%s", self.host, self.port)
+
+    async def run(self) -> None:
+        """Démarre le serveur et fait tourner la boucle des ticks à `TICK_RATE`"""
+        await self.start()
+        loop = asyncio.get_running_loop()
+        interval = 1 / TICK_RATE
+        next_tick = loop.time()
+        try:
+            while True:
+                self.tick()
+                if self.autosave is not None:
+                    self.autosave.tick()
+                next_tick += interval
+                delay = next_tick - loop.time()
+                if delay < 0:
+                    # le serveur est en retard, on ne cherche pas à rattraper les ticks perdus,
+                    # mais le numéro de tick avance quand même pour que l'heure envoyée aux
+                    # clients (tick / TICK_RATE) reste celle du serveur
+                    self.tick_count += int(-delay // interval)
+                    next_tick = loop.time()
+                    delay = 0
+                await asyncio.sleep(delay)
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Ferme le serveur et toutes les connexions"""
+        if self.server is not None:
+            self.server.close()
+        for connection in list(self.connections):
+            if connection.transport is not None:
+                connection.transport.close()
+        if self.autosave is not None:
+            self.autosave.close()
+            self.autosave = None
+
+def run_server(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    autosave: Optional[str] = None,
+    autosave_interval: float = AUTOSAVE_INTERVAL,
+) -> None:
+    """Lance un serveur jusqu'à ce qu'il soit interrompu.
+
+    Attributes
+    ----------
+    host: str = DEFAULT_HOST
+    port: int = DEFAULT_PORT
+        L'adresse sur laquelle écouter
+    autosave: Optional[str] = None
+        Le dossier des sauvegardes automatiques (la plus récente est reprise)
+    autosave_interval: float = AUTOSAVE_INTERVAL
+        Le nombre de secondes entre deux sauvegardes
+    """
+    map = None
+    saved = load_latest(autosave) if autosave is not None else None
+    if saved is not None:
+        map = Map(None, generate_maze=False)
+        saved.apply(map)
+    server = Server(host, port, map)
+    if saved is not None:
+        server.positions.update(saved.positions)
+    if autosave is not None:
+        server.autosave = Autosave(autosave, server.map, server.player_positions, autosave_interval)
+    try:
+        asyncio.run(server.run())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,147 @@
+from __future__ import annotations
+from typing import Dict, Hashable, Iterator, Set, Tuple
+
+__all__ = [
+    "SpatialHash",
+]
+
+class SpatialHash:
+    """Index spatial qui range des objets (identifiés par une clé) par cellule
+    de la grille du monde.
+    Il permet de retrouver rapidement les objets présents dans une zone
+    rectangulaire sans parcourir tous les objets.
+    """
+    cell_size: int
+    cells: Dict[Tuple[int, int], Set[Hashable]]
+    positions: Dict[Hashable, Tuple[int, int]]
+
+    def __init__(self, cell_size: int = 1) -> None:
+        """Initialise l'index vide.
+
+        Attributes
+        ----------
+        cell_size: int = 1
+            La taille (en tuiles) du côté d'une cellule de l'index
+        """
+        self.cell_size = cell_size
+        self.cells = {}
+        self.positions = {}
+
+    def cell(self, x: float, y: float) -> Tuple[int, int]:
+        """Retourne la cellule contenant le point aux coordonnées indiquées"""
+        return (int(x) // self.cell_size, int(y) // self.cell_size)
+
+    def insert(self, key: Hashable, x: float, y: float) -> None:
+        """Ajoute (ou déplace) un objet dans l'index.
+
+        Attributes
+        ----------
+        key: Hashable
+            La clé de l'objet (par exemple l'identifiant d'un joueur)
+        x: float
+            La coordonnée `x` de l'objet
+        y: float
+            La coordonnée `y` de l'objet
+        """
+        if key in self.positions:
+            self.move(key, x, y)
+            return
+        position = (int(x), int(y))
+        self.positions[key] = position
+        self.cells.setdefault(self.cell(*position), set()).add(key)
+
+    def move(self, key: Hashable, x: float, y: float) -> bool:
+        """Met à jour la position d'un objet déjà présent dans l'index.
+
+        Attributes
+        ----------
+        key: Hashable
+            La clé de l'objet
+        x: float
+            La nouvelle coordonnée `x` de l'objet
+        y: float
+            La nouvelle coordonnée `y` de l'objet
+
+        Returns
+        -------
+        bool
+            Indique si l'objet a changé de cellule
+        """
+        if key not in self.positions:
+            self.insert(key, x, y)
+            return True
+        old_cell = self.cell(*self.positions[key])
+        position = (int(x), int(y))
+        self.positions[key] = position
+        new_cell = self.cell(*position)
+        if new_cell == old_cell:
+            return False
+        self._discard(key, old_cell)
+        self.cells.setdefault(new_cell, set()).add(key)
+        return True
+
+    def remove(self, key: Hashable) -> None:
+        """Supprime un objet de l'index s'il y est présent"""
+        position = self.positions.pop(key, None)
+        if position is not None:
+            self._discard(key, self.cell(*position))
+
+    def _discard(self, key: Hashable, cell: Tuple[int, int]) -> None:
+        """Retire la clé d'une cellule et supprime la cellule si elle est vide"""
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self.cells[cell]
+
+    def query(self, x_min: float, y_min: float, x_max: float, y_max: float) -> Iterator[Hashable]:
+        """Retourne les clés des objets présents dans le rectangle indiqué
+        (bornes incluses).
+        Si le rectangle couvre plus de cellules qu'il n'y a d'objets, les objets
+        sont parcourus directement, ce qui est moins coûteux.
+
+        Attributes
+        ----------
+        x_min: float
+        y_min: float
+            Le coin haut gauche du rectangle
+        x_max: float
+        y_max: float
+            Le coin bas droit du rectangle
+
+        Returns
+        -------
+        Iterator[Hashable]
+            Les clés des objets présents dans la zone
+        """
+        x_min, y_min, x_max, y_max = int(x_min), int(y_min), int(x_max), int(y_max)
+        cell_x_min, cell_y_min = self.cell(x_min, y_min)
+        cell_x_max, cell_y_max = self.cell(x_max, y_max)
+        positions = self.positions
+        cell_count = (cell_x_max - cell_x_min + 1) * (cell_y_max - cell_y_min + 1)
+        if cell_count >= len(positions):
+            for key, (x, y) in positions.items():
+                if x_min <= x <= x_max and y_min <= y <= y_max:
+                    yield key
+            return
+        cells = self.cells
+        for cell_y in range(cell_y_min, cell_y_max + 1):
+            for cell_x in range(cell_x_min, cell_x_max + 1):
+                bucket = cells.get((cell_x, cell_y))
+                if bucket is None:
+                    continue
+                for key in bucket:
+                    x, y = positions[key]
+                    if x_min <= x <= x_max and y_min <= y <= y_max:
+                        yield key
+
+    def near(self, x: float, y: float, radius: int) -> Iterator[Hashable]:
+        """Retourne les clés des objets situés à au plus `radius` tuiles
+        (sur chaque axe) du point indiqué"""
+        return self.query(x - radius, y - radius, x + radius, y + radius)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.positions
+
+    def __len__(self) -> int:
+        return len(self.positions)
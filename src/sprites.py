@@ -1,17 +1,29 @@
 from __future__ import annotations
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
 import os.path
 import json
 
 import pygame
 import pygame.image
 import pygame.surface
+import pygame.transform
 
-IMAGE_PATH = "./data/images"
+from .bundle import IMAGE_PATH, TEXTURES_FILE, bundle
+from .metrics import IMAGE_HITS, IMAGE_MISSES, TEXTURE_LOADS, metrics
 
-with open("./data/textures.json") as file: # chargement des textures
-    index = json.load(file)
+if bundle is not None:
+    index = bundle.textures
+else:
+    with open(TEXTURES_FILE) as file: # chargement des textures
+        index = json.load(file)
+
+# textures animées et intervalles (en images) entre deux étapes de leur animation
+ANIMATED_TEXTURES = {name for name, entry in index.items() if entry["type"] == 1}
+ANIMATION_INTERVALS = sorted({index[name]["interval"] for name in ANIMATED_TEXTURES})
 
 def get_path(image_path: str) -> str:
     """Retourne le chemin du fichier relatif selon le chemin relatif de l'image
@@ -29,10 +41,38 @@ def get_path(image_path: str) -> str:
     """
     return os.path.join(IMAGE_PATH, image_path)
 
-cache = {}
+BASE_SIZE = 16 # taille des tuiles du pack de textures
+IMAGE_SCALE = 2 # agrandissement des images de `IMAGE_PATH` (voir `extract.py`)
+DEFAULT_SCALE = IMAGE_SCALE
+MIN_SCALE = 1
+MAX_SCALE = 6
+MAX_SCALED_BYTES = 16 * 1024 * 1024 # mémoire maximale des images agrandies
+MAX_COMPOSITE_BYTES = 8 * 1024 * 1024 # mémoire maximale des tuiles superposées
+
+surface_cache: Dict[str, pygame.surface.Surface] = {}
+
+def decode_image(name: str) -> pygame.surface.Surface:
+    """Lit une image depuis le paquet de ressources s'il est disponible, sinon
+    depuis son fichier, sans la mettre en cache.
+    Cette fonction peut être appelée depuis un autre fil d'exécution.
+
+    Attributes
+    ----------
+    name: str
+        Le nom de l'image à lire
+
+    Returns
+    -------
+    pygame.surface.Surface
+        La surface pygame de l'image
+    """
+    if bundle is not None and name in bundle:
+        return bundle.load(name)
+    return pygame.image.load(get_path(name))
 
 def load_image(name: str) -> pygame.surface.Surface:
     """Charge une image et retourne la surface correspondante.
+    L'image est lue dans le paquet de ressources s'il est disponible.
     
     Attributes
     ----------
@@ -45,12 +85,213 @@ def load_image(name: str) -> pygame.surface.Surface:
         La surface pygame de l'image.
     """
     entire_path = get_path(name)
-    if entire_path not in cache:
-        image = pygame.image.load(entire_path)
-        cache[entire_path] = image
+    if entire_path not in surface_cache:
+        if metrics.enabled:
+            TEXTURE_LOADS.inc()
+        image = decode_image(name)
+        surface_cache[entire_path] = image
         return image
     else:
-        return cache[entire_path]
+        return surface_cache[entire_path]
+
+def texture_images(texture: str) -> List[str]:
+    """Retourne le nom de toutes les images utilisées par une texture"""
+    entry = index[texture]
+    names = [entry["location"]]
+    names.extend(entry.get("frames", []))
+    names.extend(entry.get("datas", {}).values())
+    names.extend(entry.get("grid", []))
+    return names
+
+def preload(
+    progress: Optional[Callable[[int, int], None]] = None,
+    workers: Optional[int] = None,
+) -> None:
+    """Charge toutes les textures de `textures.json` avant le début de la partie.
+    Les images sont décodées en parallèle (pygame libère le GIL pendant le
+    décodage), puis celles lues depuis leur fichier sont converties au format
+    de l'écran dans le fil d'exécution principal : l'écran doit donc déjà être
+    créé. Les images du paquet de ressources sont gardées telles quelles,
+    leurs pixels restent dans la mémoire du fichier projeté.
+
+    Attributes
+    ----------
+    progress: Optional[Callable[[int, int], None]] = None
+        Appelée dans le fil d'exécution principal après chaque image avec le
+        nombre d'images chargées et le nombre total d'images
+    workers: Optional[int] = None
+        Le nombre de fils d'exécution utilisés (par défaut, un par processeur
+        et huit au plus)
+    """
+    names = []
+    for texture in index:
+        for name in texture_images(texture):
+            if get_path(name) not in surface_cache and name not in names:
+                names.append(name)
+    with ThreadPoolExecutor(workers or min(8, os.cpu_count() or 1)) as executor:
+        futures = {executor.submit(decode_image, name): name for name in names}
+        for done, future in enumerate(as_completed(futures), 1):
+            name = futures[future]
+            image = future.result()
+            if bundle is None or name not in bundle:
+                image = image.convert_alpha()
+            surface_cache[get_path(name)] = image
+            if metrics.enabled:
+                TEXTURE_LOADS.inc()
+            if progress is not None:
+                progress(done, len(names))
+    for texture in index:
+        get_image(texture)
+
+class ScaledCache:
+    """Le cache des images agrandies pour chaque niveau de zoom.
+    Chaque copie est calculée une seule fois à partir de la tuile de 16 pixels
+    d'origine (les images sont agrandies sans lissage, ce qui permet de la
+    retrouver exactement). Quand la mémoire utilisée dépasse `max_bytes`, les
+    copies utilisées le moins récemment, donc celles des niveaux de zoom qui
+    ne sont plus affichés, sont supprimées.
+    """
+    surfaces: OrderedDict[Tuple[pygame.surface.Surface, int], pygame.surface.Surface]
+    sources: Dict[pygame.surface.Surface, pygame.surface.Surface]
+
+    def __init__(self, max_bytes: int = MAX_SCALED_BYTES) -> None:
+        """Initialise un cache vide.
+
+        Attributes
+        ----------
+        max_bytes: int = MAX_SCALED_BYTES
+            La mémoire maximale des images agrandies, en octets
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.surfaces = OrderedDict()
+        self.sources = {}
+
+    def source(self, image: pygame.surface.Surface) -> pygame.surface.Surface:
+        """Retourne la tuile d'origine d'une image de `IMAGE_PATH`"""
+        source = self.sources.get(image)
+        if source is None:
+            width, height = image.get_size()
+            source = pygame.transform.scale(image, (width // IMAGE_SCALE, height // IMAGE_SCALE))
+            self.sources[image] = source
+        return source
+
+    def get(self, image: pygame.surface.Surface, scale: int) -> pygame.surface.Surface:
+        """Retourne une image agrandie.
+
+        Attributes
+        ----------
+        image: pygame.surface.Surface
+            L'image chargée par `load_image`
+        scale: int
+            L'agrandissement de la tuile d'origine
+
+        Returns
+        -------
+        pygame.surface.Surface
+            L'image agrandie
+        """
+        if scale == IMAGE_SCALE:
+            return image
+        key = (image, scale)
+        scaled = self.surfaces.get(key)
+        if scaled is not None:
+            self.surfaces.move_to_end(key)
+            return scaled
+        source = self.source(image)
+        scaled = pygame.transform.scale(source, (source.get_width() * scale, source.get_height() * scale))
+        self.surfaces[key] = scaled
+        self.size += _surface_bytes(scaled)
+        while self.size > self.max_bytes and len(self.surfaces) > 1:
+            _, evicted = self.surfaces.popitem(last=False)
+            self.size -= _surface_bytes(evicted)
+        return scaled
+
+    def clear(self) -> None:
+        self.surfaces.clear()
+        self.sources.clear()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.surfaces)
+
+def _surface_bytes(surface: pygame.surface.Surface) -> int:
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+scaled_cache = ScaledCache()
+
+class CompositeCache:
+    """Le cache des tuiles à plusieurs couches (un pont sur un chemin sur de
+    l'herbe…) aplaties en une seule image.
+    La clé est la pile des images de chaque couche, qui dépend du type, de la
+    donnée et de l'étape d'animation de chaque couche : quand l'une d'elles
+    change, la tuile utilise une autre entrée du cache. Les entrées utilisées
+    le moins récemment sont supprimées au-delà de `max_bytes`.
+    """
+    surfaces: OrderedDict[Tuple[Tuple[pygame.surface.Surface, ...], int], pygame.surface.Surface]
+
+    def __init__(self, max_bytes: int = MAX_COMPOSITE_BYTES) -> None:
+        """Initialise un cache vide.
+
+        Attributes
+        ----------
+        max_bytes: int = MAX_COMPOSITE_BYTES
+            La mémoire maximale des tuiles aplaties, en octets
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.surfaces = OrderedDict()
+
+    def get(self, layers: Tuple[pygame.surface.Surface, ...], scale: int) -> pygame.surface.Surface:
+        """Retourne l'image des couches superposées.
+
+        Attributes
+        ----------
+        layers: Tuple[pygame.surface.Surface, ...]
+            Les images de chaque couche (chargées par `load_image`), du fond
+            vers le dessus
+        scale: int
+            L'agrandissement de la tuile d'origine
+
+        Returns
+        -------
+        pygame.surface.Surface
+            L'image aplatie, de la taille de la plus grande couche
+        """
+        key = (layers, scale)
+        composite = self.surfaces.get(key)
+        if composite is not None:
+            self.surfaces.move_to_end(key)
+            return composite
+        scaled = [scaled_cache.get(layer, scale) for layer in layers]
+        width = max(layer.get_width() for layer in scaled)
+        height = max(layer.get_height() for layer in scaled)
+        composite = pygame.Surface((width, height), pygame.SRCALPHA, scaled[-1])
+        for layer in scaled:
+            # les couches sont centrées, comme avec `Sprite.center_at`
+            composite.blit(layer, ((width - layer.get_width()) // 2, (height - layer.get_height()) // 2))
+        self.surfaces[key] = composite
+        self.size += _surface_bytes(composite)
+        while self.size > self.max_bytes and len(self.surfaces) > 1:
+            _, evicted = self.surfaces.popitem(last=False)
+            self.size -= _surface_bytes(evicted)
+        return composite
+
+    def clear(self) -> None:
+        self.surfaces.clear()
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self.surfaces)
+
+composite_cache = CompositeCache()
+
+def prescale(scale: int) -> None:
+    """Calcule à l'avance les images de toutes les textures à un agrandissement,
+    pour que le changement de zoom ne ralentisse pas les images suivantes"""
+    for texture in index:
+        for name in texture_images(texture):
+            scaled_cache.get(load_image(name), scale)
 
 class Image:
     frames: List[pygame.surface.Surface]
@@ -152,7 +393,11 @@ def get_image(name: str) -> Image:
         L'image correspondant à la texture demandée
     """
     if name not in cache:
+        if metrics.enabled:
+            IMAGE_MISSES.inc()
         cache[name] = Image(name)
+    elif metrics.enabled:
+        IMAGE_HITS.inc()
     return cache[name]
 
 class Sprite:
@@ -176,7 +421,7 @@ class Sprite:
         self.y=0
         self.data = data
     
-    def center_at(self, x: int, y: int) -> None:
+    def center_at(self, x: int, y: int, scale: int = DEFAULT_SCALE) -> None:
         """Centre la texture à un point sur l'écran en utilisant la taille
         de la texture
         
@@ -186,12 +431,25 @@ class Sprite:
             La coordonnée `x` du point sur lequel centrer la texture
         y: int
             La coordonnée `y` du point sur lequel centrer la texture
+        scale: int = DEFAULT_SCALE
+            L'agrandissement de la texture par rapport à la tuile d'origine
         """
-        self.x = x - self.sprite.image(self.data).get_width() // 2
-        self.y = y - self.sprite.image(self.data).get_height() // 2
+        image = self.sprite.image(self.data)
+        self.x = x - image.get_width() * scale // (2 * IMAGE_SCALE)
+        self.y = y - image.get_height() * scale // (2 * IMAGE_SCALE)
     
-    def blit(self, surface:pygame.Surface, animation_state_:int=0, x:int = 0, y: int = 0) -> None:
-        surface.blit(self.sprite.image(self.data, animation_state_, x, y), (self.x, self.y))
+    def blit(
+        self,
+        surface: pygame.Surface,
+        animation_state_: int = 0,
+        x: int = 0,
+        y: int = 0,
+        scale: int = DEFAULT_SCALE,
+    ) -> None:
+        image = self.sprite.image(self.data, animation_state_, x, y)
+        if scale != IMAGE_SCALE:
+            image = scaled_cache.get(image, scale)
+        surface.blit(image, (self.x, self.y))
 
 # pour les données des chemins (textures connectées) :
 # 2**0 : haut
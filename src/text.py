@@ -0,0 +1,158 @@
+from __future__ import annotations
+from typing import List, Optional, Tuple, Union
+
+from collections import OrderedDict
+
+import pygame
+import pygame.font
+from pygame.surface import Surface
+
+__all__ = [
+    "TextCache",
+    "GlyphLine",
+    "text_cache",
+]
+
+Color = Union[int, Tuple[int, int, int]]
+
+class TextCache:
+    """Cache des surfaces de texte déjà rendues.
+    Le rendu d'un texte par pygame est coûteux, on garde donc les surfaces
+    rendues en mémoire en supprimant les moins récemment utilisées quand le
+    cache est plein.
+    """
+    max_size: int
+    surfaces: OrderedDict
+
+    def __init__(self, max_size: int = 256) -> None:
+        """Initialise le cache vide.
+
+        Attributes
+        ----------
+        max_size: int = 256
+            Le nombre maximal de surfaces gardées en mémoire
+        """
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+
+    def render(self, font: pygame.font.Font, text: str, color: Color, antialias: bool = True) -> Surface:
+        """Retourne la surface du texte demandé, en la rendant seulement si elle
+        n'est pas déjà dans le cache.
+
+        Attributes
+        ----------
+        font: pygame.font.Font
+            La police utilisée pour le rendu
+        text: str
+            Le texte à rendre
+        color: Color
+            La couleur du texte
+        antialias: bool = True
+            Indique si le texte doit être lissé
+
+        Returns
+        -------
+        Surface
+            La surface contenant le texte
+        """
+        key = (font, text, color, antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self) -> None:
+        """Vide le cache"""
+        self.surfaces.clear()
+
+    def __len__(self) -> int:
+        return len(self.surfaces)
+
+text_cache = TextCache() # cache partagé par tout le jeu
+
+class GlyphLine:
+    """Ligne de texte mise à jour caractère par caractère.
+    Elle est utilisée pour les textes qui changent à chaque image (fps,
+    coordonnées...) : seuls les caractères qui ont changé sont redessinés,
+    les autres restent tels quels sur la surface de la ligne.
+    """
+    font: pygame.font.Font
+    color: Color
+    text: str
+    surface: Surface
+    glyphs: List[Tuple[str, int, int]]
+
+    def __init__(self, font: pygame.font.Font, color: Color, cache: Optional[TextCache] = None) -> None:
+        """Initialise une ligne vide.
+
+        Attributes
+        ----------
+        font: pygame.font.Font
+            La police utilisée pour le rendu
+        color: Color
+            La couleur du texte
+        cache: Optional[TextCache] = None
+            Le cache utilisé pour les caractères (par défaut le cache partagé)
+        """
+        self.font = font
+        self.color = color
+        self.cache = cache if cache is not None else text_cache
+        self.text = ""
+        self.glyphs = []
+        self.surface = Surface((0, font.get_height()), pygame.SRCALPHA)
+
+    def glyph(self, char: str) -> Surface:
+        """Retourne la surface d'un caractère"""
+        return self.cache.render(self.font, char, self.color)
+
+    def update(self, text: str) -> Surface:
+        """Met à jour le texte de la ligne et retourne la surface à afficher.
+
+        Attributes
+        ----------
+        text: str
+            Le nouveau texte
+
+        Returns
+        -------
+        Surface
+            La surface contenant la ligne
+        """
+        if text == self.text:
+            return self.surface
+        layout = []
+        x = 0
+        for char in text:
+            width = self.glyph(char).get_width()
+            layout.append((char, x, width))
+            x += width
+
+        height = self.surface.get_height()
+        if x > self.surface.get_width():
+            # la ligne est plus grande que la surface : on l'agrandit et on redessine tout
+            self.surface = Surface((x, height), pygame.SRCALPHA)
+            self.glyphs = []
+
+        old = self.glyphs
+        changed = [
+            i for i, glyph in enumerate(layout)
+            if i >= len(old) or old[i] != glyph
+        ]
+        # on efface d'abord les anciens caractères puis on dessine les nouveaux
+        # pour ne pas effacer un caractère qui vient d'être dessiné
+        for i in range(len(old)):
+            if i >= len(layout) or old[i] != layout[i]:
+                _, old_x, old_width = old[i]
+                self.surface.fill((0, 0, 0, 0), (old_x, 0, old_width, height))
+        for i in changed:
+            char, glyph_x, _ = layout[i]
+            self.surface.blit(self.glyph(char), (glyph_x, 0))
+
+        self.glyphs = layout
+        self.text = text
+        return self.surface
@@ -0,0 +1,157 @@
+"""Ce fichier contient les vues du jeu : des parties de l'écran qui affichent
+chacune le monde autour d'une caméra.
+Par défaut, une seule vue couvre tout l'écran. L'écran peut aussi être partagé
+entre deux joueurs locaux (`--split`), ou découpé en une grille qui suit
+plusieurs joueurs (mode spectateur, touche `toggle_grid`).
+
+Les vues partagent les textures, les tuiles composées et la vue d'ensemble du
+monde : chacune ne garde que son image du monde (`MapView`), décalée d'une
+image à l'autre comme celle de l'écran entier.
+"""
+from __future__ import annotations
+from typing import List, Optional, TYPE_CHECKING
+
+import math
+
+import pygame
+import pygame.draw
+
+from .camera import Camera, FrameContext
+
+if TYPE_CHECKING:
+    from .fog import FogOverlay
+    from .map import Map, MapView
+    from .players import Players
+
+__all__ = [
+    "MAX_VIEWPORTS",
+    "split_screen",
+    "Viewport",
+]
+
+MAX_VIEWPORTS = 4 # nombre de vues de la grille du mode spectateur au maximum
+BORDER_COLOR = (0, 0, 0) # couleur du bord de chaque vue quand l'écran est partagé
+
+def split_screen(rect: pygame.Rect, count: int) -> List[pygame.Rect]:
+    """Découpe un rectangle de l'écran en une grille de `count` vues, remplie
+    ligne par ligne (deux vues sont côte à côte).
+
+    Attributes
+    ----------
+    rect: pygame.Rect
+        Le rectangle à découper (l'écran)
+    count: int
+        Le nombre de vues
+
+    Returns
+    -------
+    List[pygame.Rect]
+        Le rectangle de chaque vue, sans chevauchement
+    """
+    columns = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    rects = []
+    for index in range(count):
+        column, row = index % columns, index // columns
+        # les bords sont calculés et non les tailles, pour que les vues
+        # couvrent exactement le rectangle
+        left = rect.x + rect.width * column // columns
+        right = rect.x + rect.width * (column + 1) // columns
+        top = rect.y + rect.height * row // rows
+        bottom = rect.y + rect.height * (row + 1) // rows
+        rects.append(pygame.Rect(left, top, right - left, bottom - top))
+    return rects
+
+class Viewport:
+    """Une partie de l'écran qui affiche le monde autour d'une caméra"""
+    camera: Camera
+    rect: pygame.Rect
+    fog: Optional[FogOverlay]
+
+    def __init__(
+        self,
+        map: Map,
+        camera: Camera,
+        rect: pygame.Rect,
+        fog: Optional[FogOverlay] = None,
+        view: Optional[MapView] = None,
+    ) -> None:
+        """Crée la vue et son image du monde.
+
+        Attributes
+        ----------
+        map: Map
+            Le monde affiché
+        camera: Camera
+            La caméra au centre de la vue
+        rect: pygame.Rect
+            La partie de l'écran occupée par la vue
+        fog: Optional[FogOverlay] = None
+            Le brouillard affiché par-dessus le monde (aucun par défaut)
+        view: Optional[MapView] = None
+            L'image du monde à utiliser (par défaut, une nouvelle image est
+            créée pour la vue et libérée par `close`)
+        """
+        self.map = map
+        self.camera = camera
+        self.rect = pygame.Rect(rect)
+        self.fog = fog
+        self.owns_view = view is None
+        self.view = map.new_view() if view is None else view
+        self.screen: Optional[pygame.Surface] = None
+        self.surface: Optional[pygame.Surface] = None # partie de l'écran de la vue
+
+    def frame_context(self, zoom: int, animation_state: int) -> FrameContext:
+        """Retourne le contexte de rendu de la vue pour l'image en cours"""
+        return FrameContext(
+            *self.camera.position(),
+            self.rect.width,
+            self.rect.height,
+            zoom,
+            animation_state,
+        )
+
+    def render(self, screen: pygame.Surface, players: Players, zoom: int, animation_state: int) -> FrameContext:
+        """Affiche le monde, les joueurs et le brouillard dans la vue.
+
+        Attributes
+        ----------
+        screen: pygame.Surface
+            L'écran, dont la vue occupe `self.rect`
+        players: Players
+            Les joueurs à afficher
+        zoom: int
+            L'agrandissement des tuiles de 16 pixels
+        animation_state: int
+            L'étape d'animation des tuiles
+
+        Returns
+        -------
+        FrameContext
+            Le contexte de rendu de la vue
+        """
+        if self.surface is None or self.screen is not screen:
+            # la sous-surface partage les pixels de l'écran : rien n'est recopié
+            self.screen = screen
+            self.surface = screen.subsurface(self.rect)
+        surface = self.surface
+        context = self.frame_context(zoom, animation_state)
+        if context.overview:
+            self.map.overview.render(surface, context, players)
+        else:
+            self.map.render(context, surface, self.view)
+            players.render(context, surface)
+        if self.fog is not None:
+            self.fog.render(surface, context)
+        return context
+
+    def render_border(self) -> None:
+        """Dessine le bord de la vue (quand l'écran est partagé)"""
+        if self.surface is not None:
+            pygame.draw.rect(self.surface, BORDER_COLOR, self.surface.get_rect(), 1)
+
+    def close(self) -> None:
+        """Libère l'image du monde de la vue (si elle a été créée pour elle)"""
+        if self.owns_view:
+            self.map.remove_view(self.view)
+        self.screen = self.surface = None
@@ -2,18 +2,26 @@
 
 block_cipher = None
 
+# avec le paquet de ressources (`python -m src.bundle`), les images et les
+# fichiers JSON qu'il contient ne sont pas copiés séparément
+if os.path.exists('data/assets.bundle'):
+    assets = [('data/assets.bundle', 'data')]
+else:
+    assets = [
+        ('data/images', 'data/images'),
+        ('data/blocs.json', 'data'),
+        ('data/textures.json', 'data'),
+    ]
+
 
 a = Analysis(['main.py'],
              pathex=[],
              binaries=[],
              datas=[
                  ('data/fonts', 'data/fonts'),
-                 ('data/images', 'data/images'),
-                 ('data/blocs.json', 'data'),
-                 ('data/textures.json', 'data'),
                  ('data/configuration.json', 'data'),
 #                 ('desktop.ini', '.')
-             ],
+             ] + assets,
              hiddenimports=[],
              hookspath=[],
              hooksconfig={},